@@ -1,15 +1,35 @@
+import argparse
+import gc
 import os
 import sqlite3
-import pandas as pd
-import numpy as np
 import json
 import random
 import threading
-from datetime import datetime, timedelta
-from flask import Flask, request, jsonify, render_template_string
+import time
+from datetime import date, datetime, timedelta
+from itertools import islice
+from flask import Flask, Response, g, request, jsonify, render_template_string
 from flask_cors import CORS
 import logging
 
+from case_base import CaseBaseBuilder
+from case_loader import (
+    LoadReport, iter_json_cases, iter_sqlite_cases, load_medication_rows,
+)
+from db_schema import (
+    SCHEMA_VERSION, SymptomEncoder, create_symptom_tables, database_version, drop_symptom_tables,
+    finalize_schema, get_schema_version, inserted_patients, migrate_database, table_exists,
+)
+from diagnosis_engine import rank_diagnoses
+from health import HealthMonitor
+from knowledge_base import KnowledgeBaseReloader
+from medications import MedicationIndex
+from metrics import CONTENT_TYPE, Gauge, Histogram, MetricsRegistry, StageTimer
+from normalization import SymptomNormalizer, fold
+from recency import HALF_LIFE_DAYS
+from result_cache import DiagnosisCache, EncodedResponse
+from snapshot import load_snapshot, source_signature, write_snapshot
+
 # Configuration du logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -18,6 +38,99 @@ app = Flask(__name__)
 CORS(app)
 
 DB_PATH = 'data/raw/medical_data.db'
+JSON_PATH = 'data/raw/medical_data.json'
+# Sources de la base de cas : fichiers (date et taille) et bases SQLite (compteur
+# d'écritures, insensible aux fichiers -wal et -shm que créent les lectures)
+SOURCE_PATHS = [JSON_PATH]
+SOURCE_DATABASES = [DB_PATH]
+
+# Migration automatique d'une base à un ancien schéma au chargement ; par défaut
+# la base doit être migrée explicitement (python db_schema.py)
+MIGRATE_SCHEMA = os.environ.get('MIGRATE_SCHEMA', '0') == '1'
+
+# Instantané binaire de la base de cas (chaîne vide pour le désactiver)
+SNAPSHOT_PATH = os.environ.get('SNAPSHOT_PATH', 'data/processed/case_base.snapshot')
+
+# Mode partagé : base de cas chargée au démarrage (gunicorn --preload) et adossée
+# à l'instantané projeté en mémoire, commun à tous les workers
+SHARED_CASE_BASE = os.environ.get('SHARED_CASE_BASE', '0') == '1'
+
+# Moteur de diagnostic par défaut : 'bitset' (matrice de bits vectorisée),
+# 'index' (index inversé), 'rules' (règles d'association), 'sharded' (matrice
+# de bits répartie sur plusieurs processus) ou 'scan' (parcours complet)
+DIAGNOSIS_BACKEND = os.environ.get('DIAGNOSIS_BACKEND', 'bitset')
+DIAGNOSIS_BACKENDS = ('bitset', 'index', 'rules', 'sharded', 'scan')
+
+# Nombre de shards (un processus chacun) du moteur 'sharded', 0 pour le désactiver
+DIAGNOSIS_SHARDS = int(os.environ.get('DIAGNOSIS_SHARDS', 0))
+
+# Pondération par défaut des cas : 'uniform' (chaque cas compte pour un) ou
+# 'recency' (poids décroissant avec l'ancienneté de la consultation)
+DIAGNOSIS_WEIGHTING = os.environ.get('DIAGNOSIS_WEIGHTING', 'uniform')
+DIAGNOSIS_WEIGHTINGS = ('uniform', 'recency')
+# Demi-vie du poids d'un cas pour la pondération par récence, en jours
+RECENCY_HALF_LIFE_DAYS = float(os.environ.get('RECENCY_HALF_LIFE_DAYS', HALF_LIFE_DAYS))
+
+# Seuils des règles d'association extraites par FP-Growth (support relatif au nombre de cas)
+RULE_OPTIONS = {
+    'min_support': float(os.environ.get('RULES_MIN_SUPPORT', 0.005)),
+    'min_confidence': float(os.environ.get('RULES_MIN_CONFIDENCE', 0.2)),
+    'max_length': int(os.environ.get('RULES_MAX_LENGTH', 5)),
+}
+
+# Recherche des cas similaires : découpage des signatures MinHash, nombre de cas
+# retournés par défaut et au plus
+SIMILARITY_OPTIONS = {
+    'bands': int(os.environ.get('LSH_BANDS', 16)),
+    'rows': int(os.environ.get('LSH_ROWS', 4)),
+}
+SIMILAR_CASES_K = 10
+MAX_SIMILAR_CASES = 100
+
+# Complétion des symptômes : nombre de suggestions par défaut et au plus
+SUGGEST_LIMIT = 10
+MAX_SUGGEST_LIMIT = 50
+
+# Rechargement automatique quand les fichiers sources changent, et période de vérification
+WATCH_SOURCES = os.environ.get('WATCH_SOURCES', '0') == '1'
+WATCH_INTERVAL = float(os.environ.get('WATCH_INTERVAL', 5))
+
+# Période (s) de lecture du compteur d'écritures SQLite, qui applique à chaque
+# worker les cas ajoutés par les autres (0 pour désactiver ; WATCH_INTERVAL si WATCH_SOURCES)
+SYNC_INTERVAL = float(os.environ.get('SYNC_INTERVAL', 2))
+
+# Jeton exigé par /admin/reload (sans jeton, seules les requêtes locales sont acceptées)
+ADMIN_TOKEN = os.environ.get('ADMIN_TOKEN', '')
+
+# Nombre maximal d'éléments acceptés par /api/diagnose/batch
+MAX_BATCH_SIZE = int(os.environ.get('MAX_BATCH_SIZE', 10000))
+
+# Nombre maximal de cas acceptés par /api/cases/bulk
+MAX_BULK_CASES = int(os.environ.get('MAX_BULK_CASES', 100000))
+
+# Noms canoniques des symptômes (accents, casse, séparateurs et synonymes),
+# appliqués au chargement, aux ajouts de cas et aux requêtes
+symptom_normalizer = SymptomNormalizer()
+
+# Cache des diagnostics : nombre d'entrées (0 pour désactiver) et durée de vie en secondes
+diagnosis_cache = DiagnosisCache(
+    max_size=int(os.environ.get('DIAGNOSIS_CACHE_SIZE', 4096)),
+    ttl=float(os.environ.get('DIAGNOSIS_CACHE_TTL', 600)),
+)
+
+# Liste des symptômes encodée une fois par version du vocabulaire, et durée (s)
+# pendant laquelle le navigateur la réutilise sans la revalider
+symptoms_response = EncodedResponse()
+
+# Durées exportées par /metrics : étapes du diagnostic (par moteur) et requêtes HTTP (par route)
+stage_seconds = Histogram(
+    'diagnosis_stage_seconds', "Durée de chaque étape d'une requête de diagnostic", ('stage', 'engine')
+)
+request_seconds = Histogram('http_request_duration_seconds', "Durée des requêtes HTTP", ('route',))
+SYMPTOMS_MAX_AGE = int(os.environ.get('SYMPTOMS_MAX_AGE', 60))
+
+# Nombre de lignes insérées par appel à executemany
+INSERT_CHUNK_SIZE = 50000
 
 # Lock pour éviter les accès concurrents lors de la création de la DB
 db_lock = threading.Lock()
@@ -197,23 +310,32 @@ HTML_TEMPLATE = '''
     <script>
         $(document).ready(function() {
             // Initialisation de Select2
+            // Symptômes proposés par le serveur au fil de la saisie
             $('#symptoms').select2({
                 placeholder: 'Choisissez un ou plusieurs symptômes',
                 allowClear: true,
-                theme: 'bootstrap-5'
+                theme: 'bootstrap-5',
+                ajax: {
+                    url: '/api/symptoms/suggest',
+                    delay: 100,
+                    data: function(params) {
+                        return {q: params.term || ''};
+                    },
+                    processResults: function(data) {
+                        return {
+                            results: data.suggestions.map(function(suggestion) {
+                                return {id: suggestion.symptom, text: suggestion.symptom.replace(/_/g, ' ')};
+                            })
+                        };
+                    },
+                    error: function(xhr, status) {
+                        if (status !== 'abort') {
+                            showError("Erreur lors du chargement des symptômes");
+                        }
+                    }
+                }
             });
 
-            // Chargement des symptômes
-            $.get('/api/symptoms')
-                .done(function(symptoms) {
-                    symptoms.forEach(function(symptom) {
-                        $('#symptoms').append(new Option(symptom.replace('_', ' '), symptom));
-                    });
-                })
-                .fail(function(error) {
-                    showError("Erreur lors du chargement des symptômes");
-                });
-
             // Gestion du formulaire
             $('#diagnosis-form').on('submit', function(e) {
                 e.preventDefault();
@@ -317,9 +439,24 @@ HTML_TEMPLATE = '''
 </html>
 '''
 
-def generate_medical_data():
-    """Génère des données médicales d'exemple pour le système expert"""
+def chunked(iterable, size=INSERT_CHUNK_SIZE):
+    """Découpe un itérable en listes de taille `size`"""
+    iterator = iter(iterable)
+    while True:
+        chunk = list(islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
+
+def generate_medical_data(num_patients=1000, seed=None):
+    """Générateur de patients d'exemple pour le système expert
+
+    Les patients sont produits un à un : la création de la base et du
+    fichier JSON n'en garde jamais plus d'un lot en mémoire.
+    """
     logger.info("Génération des données médicales...")
+    if seed is not None:
+        random.seed(seed)
     
     # Définition des diagnostics et leurs symptômes associés
     medical_data = {
@@ -336,10 +473,7 @@ def generate_medical_data():
     }
     
     # Génération des patients
-    patients = []
-    symptoms_records = []
-    
-    for i in range(1000):  # 1000 patients d'exemple
+    for i in range(num_patients):  # 1000 patients d'exemple par défaut
         # Sélection aléatoire d'un diagnostic
         diagnostic = random.choice(list(medical_data.keys()))
         symptoms_list = medical_data[diagnostic]
@@ -357,47 +491,49 @@ def generate_medical_data():
             if other_symptoms:
                 patient_symptoms.append(random.choice(other_symptoms))
         
-        # Création du patient
-        patient = {
+        yield {
             'id': i + 1,
             'age': random.randint(18, 80),
             'diagnostic': diagnostic,
             'symptoms_list': patient_symptoms
         }
-        patients.append(patient)
-        
-        # Création des enregistrements de symptômes pour SQLite
-        for symptom in patient_symptoms:
-            symptoms_records.append({
-                'patient_id': i + 1,
-                'symptom': symptom
-            })
-    
-    return patients, symptoms_records
 
-def create_sqlite_database():
-    """Crée et remplit la base de données SQLite avec protection contre les accès concurrents"""
+def create_sqlite_database(num_patients=1000, seed=None, force=False):
+    """Crée et remplit la base de données SQLite avec protection contre les accès concurrents
+
+    Une base existante n'est remplacée qu'avec `force`. Retourne True si la
+    base a été créée, False si elle existait déjà.
+
+    La base est laissée en journal WAL (mode persistant, enregistré dans le
+    fichier) : les workers la lisent pendant que les ingestions y écrivent.
+    """
     try:
         with db_lock:  # Protection contre les accès concurrents
             # Vérifier à nouveau si la DB existe après avoir acquis le lock
             if os.path.exists(DB_PATH):
-                logger.info("Base de données déjà existante, chargement...")
-                return
+                if not force:
+                    logger.info("Base de données déjà existante, chargement...")
+                    return False
+                logger.info("Base de données existante remplacée (--force)")
+                for suffix in ('', '-wal', '-shm'):
+                    if os.path.exists(DB_PATH + suffix):
+                        os.remove(DB_PATH + suffix)
                 
             logger.info("Création de la base de données SQLite...")
             
             # Création du répertoire si nécessaire
             os.makedirs(os.path.dirname(DB_PATH), exist_ok=True)
             
-            # Génération des données
-            patients, symptoms_records = generate_medical_data()
-            
             # Connexion à SQLite
             conn = sqlite3.connect(DB_PATH)
             cursor = conn.cursor()
             
+            # Journal WAL conservé ; synchronous=OFF le temps du chargement en masse
+            cursor.execute('PRAGMA journal_mode=WAL')
+            cursor.execute('PRAGMA synchronous=OFF')
+            
             # Suppression des tables existantes si elles existent
-            cursor.execute('DROP TABLE IF EXISTS symptoms')
+            drop_symptom_tables(conn)
             cursor.execute('DROP TABLE IF EXISTS patients')
             
             # Création des tables
@@ -409,33 +545,33 @@ def create_sqlite_database():
                 )
             ''')
             
-            cursor.execute('''
-                CREATE TABLE symptoms (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    patient_id INTEGER NOT NULL,
-                    symptom TEXT NOT NULL,
-                    FOREIGN KEY (patient_id) REFERENCES patients (id)
-                )
-            ''')
+            create_symptom_tables(conn)
             
-            # Insertion des patients
-            for patient in patients:
-                cursor.execute(
+            # Insertion des patients et de leurs symptômes par lots, dans une seule transaction
+            encoder = SymptomEncoder(conn)
+            n_patients = 0
+            for chunk in chunked(generate_medical_data(num_patients, seed)):
+                cursor.executemany(
                     'INSERT INTO patients (id, age, diagnostic) VALUES (?, ?, ?)',
-                    (patient['id'], patient['age'], patient['diagnostic'])
+                    ((patient['id'], patient['age'], patient['diagnostic']) for patient in chunk)
                 )
-            
-            # Insertion des symptômes
-            for symptom_record in symptoms_records:
-                cursor.execute(
-                    'INSERT INTO symptoms (patient_id, symptom) VALUES (?, ?)',
-                    (symptom_record['patient_id'], symptom_record['symptom'])
+                cursor.executemany(
+                    'INSERT OR IGNORE INTO patient_symptoms (patient_id, symptom_id) VALUES (?, ?)',
+                    encoder.rows(
+                        (patient['id'], symptom) for patient in chunk for symptom in patient['symptoms_list']
+                    )
                 )
+                n_patients += len(chunk)
+            conn.commit()
             
+            # Index créés après le chargement
+            finalize_schema(conn)
             conn.commit()
+            cursor.execute('PRAGMA synchronous=NORMAL')
             conn.close()
             
-            logger.info(f"Base de données SQLite créée avec {len(patients)} patients")
+            logger.info(f"Base de données SQLite créée avec {n_patients} patients")
+            return True
             
     except Exception as e:
         logger.error(f"Erreur lors de la création de la base SQLite: {str(e)}")
@@ -448,52 +584,92 @@ def create_sqlite_database():
                 pass
         raise
 
-def create_json_data():
-    """Crée un fichier JSON avec des données supplémentaires"""
+def create_json_data(num_patients=500, seed=None):
+    """Crée un fichier JSON avec des données supplémentaires
+
+    Les patients sont écrits au fil de la génération, un par ligne, et les
+    métadonnées après eux.
+    """
     try:
         logger.info("Création des données JSON...")
         
-        # Génération de données supplémentaires
-        patients, _ = generate_medical_data()
-        
-        # Formatage pour JSON
-        json_data = {
-            "patients": [
-                {
+        os.makedirs(os.path.dirname(JSON_PATH), exist_ok=True)
+        n_patients = 0
+        with open(JSON_PATH, 'w', encoding='utf-8') as f:
+            f.write('{"patients": [')
+            for patient in generate_medical_data(num_patients, seed):
+                f.write(',\n' if n_patients else '\n')
+                json.dump({
                     "id": patient['id'],
                     "age": patient['age'],
                     "diagnostic": patient['diagnostic'],
                     "symptoms": patient['symptoms_list']
-                }
-                for patient in patients[:500]  # Seulement 500 pour le JSON
-            ],
-            "metadata": {
+                }, f, ensure_ascii=False)
+                n_patients += 1
+            f.write('\n], "metadata": ')
+            json.dump({
                 "created_at": datetime.now().isoformat(),
-                "total_patients": 500,
+                "total_patients": n_patients,
                 "data_source": "generated"
-            }
-        }
+            }, f, ensure_ascii=False)
+            f.write('}\n')
         
-        # Sauvegarde
-        json_path = 'data/raw/medical_data.json'
-        os.makedirs(os.path.dirname(json_path), exist_ok=True)
-        with open(json_path, 'w', encoding='utf-8') as f:
-            json.dump(json_data, f, ensure_ascii=False, indent=2)
-        
-        logger.info(f"Fichier JSON créé: {json_path}")
+        logger.info(f"Fichier JSON créé: {JSON_PATH}")
         
     except Exception as e:
         logger.error(f"Erreur lors de la création du JSON: {str(e)}")
         raise
 
-def load_data():
-    """Charge les données depuis SQLite et JSON"""
+def check_schema(db_path):
+    """Vérifie que la base est au schéma courant, et la migre si MIGRATE_SCHEMA=1
+
+    Sans MIGRATE_SCHEMA, une base à un ancien schéma n'est pas modifiée :
+    le chargement échoue avec la commande de migration à exécuter.
+    """
+    conn = sqlite3.connect(db_path, timeout=30)
     try:
-        # Vérification de l'existence du fichier de base de données
-        if not os.path.exists(DB_PATH):
-            logger.warning("Base de données non trouvée, génération des données...")
-            create_sqlite_database()
+        version = get_schema_version(conn)
+    finally:
+        conn.close()
+    if version >= SCHEMA_VERSION:
+        return
+    if not MIGRATE_SCHEMA:
+        raise RuntimeError(
+            f"Base {db_path} au schéma version {version} (version {SCHEMA_VERSION} attendue): "
+            f"exécuter `python db_schema.py {db_path}` ou définir MIGRATE_SCHEMA=1"
+        )
+    logger.warning(f"Migration automatique de {db_path} vers le schéma version {SCHEMA_VERSION} (MIGRATE_SCHEMA=1)")
+    migrate_database(db_path)
+
+def prepare_sources():
+    """Crée la base si elle est absente et vérifie son schéma
+
+    Appelé par le rechargeur avant le relevé de la signature des sources :
+    la création ou la migration ne rend pas périmée la base qui suit.
+    """
+    # Vérification de l'existence du fichier de base de données
+    if not os.path.exists(DB_PATH):
+        logger.warning("Base de données non trouvée, génération des données...")
+        # Le fichier JSON n'est écrit qu'avec la base (pas par un second worker)
+        if create_sqlite_database():
             create_json_data()
+    
+    # Base à un ancien schéma : migrée seulement si MIGRATE_SCHEMA=1
+    check_schema(DB_PATH)
+
+def load_data():
+    """Charge les données depuis SQLite et JSON (sources préparées par prepare_sources)"""
+    try:
+        report = LoadReport()
+        
+        # Démarrage rapide depuis l'instantané s'il est à jour par rapport aux sources
+        signature = source_signature(SOURCE_PATHS, SOURCE_DATABASES)
+        if SNAPSHOT_PATH:
+            snapshot = load_snapshot(SNAPSHOT_PATH, signature, symptom_normalizer.version)
+            if snapshot is not None:
+                report.rows['snapshot'] = len(snapshot)
+                snapshot.load_stats = report.summary()
+                return snapshot
         
         # Connexion SQLite avec retry en cas d'erreur
         max_retries = 3
@@ -501,145 +677,537 @@ def load_data():
             try:
                 conn = sqlite3.connect(DB_PATH, timeout=30)
                 
-                # Chargement des données SQLite
-                patients_df = pd.read_sql_query("""
-                    SELECT p.*, GROUP_CONCAT(s.symptom) as symptoms_list
-                    FROM patients p
-                    LEFT JOIN symptoms s ON p.id = s.patient_id
-                    GROUP BY p.id
-                """, conn)
-                
-                conn.close()
+                # Lecture des patients par blocs, directement dans la base compacte
+                builder = CaseBaseBuilder()
+                normalize = symptom_normalizer.normalize_list
+                try:
+                    for diagnosis, symptoms, consulted in report.count('sqlite', iter_sqlite_cases(conn)):
+                        builder.add(diagnosis, normalize(symptoms), consulted)
+                    # Co-occurrences diagnostic x médicament, agrégées par SQLite
+                    medications = MedicationIndex.from_rows(*load_medication_rows(conn))
+                finally:
+                    conn.close()
                 break
                 
             except sqlite3.Error as e:
                 logger.warning(f"Tentative {attempt + 1} échouée: {str(e)}")
+                report.rows['sqlite'] = 0
                 if attempt == max_retries - 1:
                     raise
-                
-        # Conversion des symptômes en liste
-        patients_df['symptoms_list'] = patients_df['symptoms_list'].apply(
-            lambda x: x.split(',') if isinstance(x, str) else []
-        )
         
-        # Chargement des données JSON si disponible
-        json_path = 'data/raw/medical_data.json'
-        if os.path.exists(json_path):
+        # Chargement des données JSON si disponible, décodées au fil de l'eau
+        if os.path.exists(JSON_PATH):
             try:
-                with open(json_path, 'r', encoding='utf-8') as f:
-                    json_data = json.load(f)
-                
-                json_df = pd.json_normalize(json_data['patients'])
-                json_df = json_df.rename(columns={'symptoms': 'symptoms_list'})
-                
-                # Fusion des données
-                combined_data = pd.concat([
-                    patients_df[['age', 'diagnostic', 'symptoms_list']],
-                    json_df[['age', 'diagnostic', 'symptoms_list']]
-                ], ignore_index=True)
+                json_cases = report.count('json', iter_json_cases(JSON_PATH))
+                for diagnosis, symptoms, consulted, age, case_medications in json_cases:
+                    builder.add(diagnosis, normalize(symptoms), consulted)
+                    if case_medications is not None:
+                        medications.add_case(diagnosis, age, case_medications)
             except Exception as e:
+                # Les cas JSON déjà lus sont conservés
                 logger.warning(f"Erreur lors du chargement JSON: {str(e)}")
-                combined_data = patients_df
-        else:
-            combined_data = patients_df
         
-        logger.info(f"Données chargées avec succès: {len(combined_data)} entrées")
+        combined_data = builder.build()
+        combined_data.medications = medications
+        stats = report.summary()
+        logger.info(
+            f"Données chargées avec succès: {len(combined_data)} entrées en {stats['seconds']} s "
+            f"({stats['rows_per_second']} lignes/s, RSS max {stats['peak_rss_mb']} Mo)"
+        )
+        combined_data.load_stats = stats
+        
+        if SNAPSHOT_PATH:
+            try:
+                write_snapshot(combined_data, SNAPSHOT_PATH, signature, symptom_normalizer.version)
+                if SHARED_CASE_BASE:
+                    # Bascule sur les tableaux projetés, partagés via le cache de pages
+                    mapped = load_snapshot(SNAPSHOT_PATH, signature, symptom_normalizer.version)
+                    if mapped is not None:
+                        mapped.load_stats = stats
+                        mapped.medications = medications
+                        combined_data = mapped
+            except Exception as e:
+                logger.warning(f"Impossible d'écrire l'instantané: {str(e)}")
         return combined_data
     
     except Exception as e:
         logger.error(f"Erreur lors du chargement des données: {str(e)}")
         return None
 
-def calculate_diagnosis(symptoms, data):
-    """Calcule le diagnostic le plus probable basé sur les symptômes"""
+def get_engine(knowledge, backend=None):
+    """Retourne le moteur de diagnostic demandé (None pour le parcours complet)"""
+    backend = backend or DIAGNOSIS_BACKEND
+    if backend == 'scan':
+        return None
+    engine = knowledge.engines.get(backend)
+    if engine is None:
+        raise ValueError(f"Moteur de diagnostic inconnu: {backend}")
+    return engine
+
+def get_weights(knowledge, backend=None, weighting=None):
+    """Poids de la pondération demandée : par profil pour les moteurs, par cas pour le parcours complet
+
+    None pour la pondération uniforme et pour les règles d'association.
+    """
+    backend = backend or DIAGNOSIS_BACKEND
+    if (weighting or DIAGNOSIS_WEIGHTING) != 'recency' or backend == 'rules':
+        return None
+    if backend == 'scan':
+        return knowledge.recency.case_weights()
+    return knowledge.recency.weights()
+
+def calculate_diagnosis(symptoms, knowledge, backend=None, weighting=None):
+    """Calcule le diagnostic le plus probable basé sur les symptômes
+
+    Une erreur du moteur est journalisée puis propagée : une liste vide
+    signifie « aucun cas trouvé » et peut être mise en cache, un échec non.
+    """
     try:
-        # Filtrage des cas avec des symptômes similaires
-        matching_cases = data[data['symptoms_list'].apply(
-            lambda x: any(symptom in x for symptom in symptoms) if isinstance(x, list) else False
-        )]
-        
-        if len(matching_cases) == 0:
+        engine = get_engine(knowledge, backend)
+        weights = get_weights(knowledge, backend, weighting)
+        # Recherche des cas candidats et similarités (une seule passe vectorisée des moteurs)
+        timer = StageTimer(stage_seconds, backend or DIAGNOSIS_BACKEND)
+        if engine is None:
+            average_scores = scan_average_scores(symptoms, knowledge.case_base, weights)
+        else:
+            average_scores = engine.average_scores(symptoms, weights)
+        timer.lap('score')
+
+        if len(average_scores) == 0:
             logger.warning(f"Aucun cas trouvé pour les symptômes: {symptoms}")
             return []
-        
-        # Calcul des scores pour chaque diagnostic
-        diagnosis_scores = {}
-        for _, case in matching_cases.iterrows():
-            diagnosis = case['diagnostic']
-            case_symptoms = set(case['symptoms_list']) if isinstance(case['symptoms_list'], list) else set()
-            input_symptoms = set(symptoms)
-            
-            # Calcul de la similarité (coefficient de Jaccard)
-            intersection = len(case_symptoms.intersection(input_symptoms))
-            union = len(case_symptoms.union(input_symptoms))
-            similarity = intersection / union if union > 0 else 0
-            
-            if diagnosis not in diagnosis_scores:
-                diagnosis_scores[diagnosis] = []
-            diagnosis_scores[diagnosis].append(similarity)
-        
-        # Calcul des scores moyens
-        average_scores = {
-            diagnosis: sum(scores) / len(scores)
-            for diagnosis, scores in diagnosis_scores.items()
-        }
-        
-        # Tri des diagnostics par score
-        sorted_diagnoses = sorted(
-            average_scores.items(),
-            key=lambda x: x[1],
-            reverse=True
-        )
-        
+
         # Retourne les 3 meilleurs diagnostics avec leurs scores
-        results = [
-            {"diagnostic": diag, "probability": round(score * 100, 2)}
-            for diag, score in sorted_diagnoses[:3]
-            if score > 0.1  # Seuil minimal de 10%
-        ]
-        
+        results = rank_diagnoses(average_scores)
+        timer.lap('rank')
+
         logger.info(f"Diagnostic calculé avec succès: {results}")
         return results
-    
+
     except Exception as e:
         logger.error(f"Erreur lors du diagnostic: {str(e)}")
-        return []
+        raise
+
+def calculate_diagnosis_batch(symptom_lists, knowledge, backend=None, weighting=None):
+    """Calcule les diagnostics de plusieurs listes de symptômes en une seule passe
+
+    Retourne, dans l'ordre d'entrée, un dictionnaire par liste avec les
+    diagnostics ou un message d'erreur propre à cet élément.
+    """
+    results = [None] * len(symptom_lists)
+    queries = []
+    positions = []
+    for position, symptoms in enumerate(symptom_lists):
+        try:
+            queries.append(frozenset(symptoms))
+            positions.append(position)
+        except TypeError as e:
+            results[position] = {"diagnoses": [], "error": f"Invalid symptoms: {str(e)}"}
 
-# Initialisation des données au démarrage
-data = None
-def initialize_data():
-    global data
     try:
-        logger.info("Initialisation du système expert médical...")
-        data = load_data()
-        if data is None or len(data) == 0:
-            raise RuntimeError("Échec du chargement initial des données")
-        logger.info("✅ Système expert initialisé avec succès.")
-        return True
+        engine = get_engine(knowledge, backend)
+        weights = get_weights(knowledge, backend, weighting)
+        if engine is None:
+            batch_scores = [
+                scan_average_scores(query, knowledge.case_base, weights) for query in queries
+            ]
+        else:
+            batch_scores = engine.average_scores_batch(queries, weights)
+        for position, average_scores in zip(positions, batch_scores):
+            results[position] = {"diagnoses": rank_diagnoses(average_scores), "error": None}
+        logger.info(f"Diagnostics calculés en lot: {len(queries)} requêtes")
     except Exception as e:
-        logger.error(f"Erreur critique lors du démarrage: {str(e)}")
+        logger.error(f"Erreur lors du diagnostic en lot: {str(e)}")
+        for position in positions:
+            results[position] = {"diagnoses": [], "error": str(e)}
+
+    return results
+
+def cache_variant(backend=None, weighting=None):
+    """Partie de la clé de cache propre au moteur et à la pondération"""
+    backend = backend or DIAGNOSIS_BACKEND
+    weighting = weighting or DIAGNOSIS_WEIGHTING
+    if weighting == 'uniform' or backend == 'rules':
+        return backend
+    # Les poids par récence changent chaque jour
+    return backend, weighting, date.today().toordinal()
+
+def cached_diagnosis(symptoms, knowledge, backend=None, weighting=None):
+    """Diagnostic de la base de connaissances, servi depuis le cache quand c'est possible"""
+    timer = StageTimer(stage_seconds, backend or DIAGNOSIS_BACKEND)
+    key = DiagnosisCache.make_key(symptoms, cache_variant(backend, weighting))
+    generation = knowledge.generation
+    epoch = diagnosis_cache.epoch
+    results = diagnosis_cache.get(key, generation)
+    timer.lap('cache')
+    if results is None:
+        results = calculate_diagnosis(symptoms, knowledge, backend, weighting)
+        diagnosis_cache.put(key, results, generation, epoch)
+    return results
+
+def with_recommendations(diagnoses, knowledge, age=None):
+    """Diagnostics complétés des médicaments les plus prescrits (copies : le cache n'est pas modifié)"""
+    medications = knowledge.case_base.medications
+    return [
+        {**diagnosis, "medications": medications.recommend(diagnosis["diagnostic"], age)}
+        for diagnosis in diagnoses
+    ]
+
+def ingest_cases(cases, knowledge):
+    """Ajoute des cas confirmés à SQLite puis à la base de cas en mémoire, sans rechargement
+
+    Les cas sont écrits dans une seule transaction ; les index, effectifs
+    des profils, règles et caches sont ensuite mis à jour cas par cas.
+    Retourne les identifiants des patients créés.
+    """
+    today = datetime.now().strftime("%Y-%m-%d")
+    with db_lock:
+        conn = sqlite3.connect(DB_PATH, timeout=30, isolation_level=None)
+        try:
+            columns = {row[1] for row in conn.execute('PRAGMA table_info(patients)')}
+            has_medications = table_exists(conn, 'medications')
+
+            conn.execute('BEGIN IMMEDIATE')
+            # Cas des autres workers appliqués d'abord : la base en mémoire suit la base SQLite
+            catch_up_cases(conn, knowledge, DB_PATH)
+            version = database_version(conn)
+            first_id = conn.execute(
+                'SELECT COALESCE(MAX(CAST(id AS INTEGER)), 0) + 1 FROM patients'
+            ).fetchone()[0]
+            ids = list(range(first_id, first_id + len(cases)))
+
+            if 'date_consultation' in columns:
+                conn.executemany(
+                    'INSERT INTO patients (id, age, diagnostic, date_consultation) VALUES (?, ?, ?, ?)',
+                    ((pid, case.get('age'), case['diagnostic'], case.get('date_consultation', today))
+                     for pid, case in zip(ids, cases))
+                )
+            else:
+                conn.executemany(
+                    'INSERT INTO patients (id, age, diagnostic) VALUES (?, ?, ?)',
+                    ((pid, case.get('age'), case['diagnostic']) for pid, case in zip(ids, cases))
+                )
+            encoder = SymptomEncoder(conn)
+            conn.executemany(
+                'INSERT OR IGNORE INTO patient_symptoms (patient_id, symptom_id) VALUES (?, ?)',
+                encoder.rows((pid, s) for pid, case in zip(ids, cases) for s in case['symptoms'])
+            )
+            if has_medications:
+                conn.executemany(
+                    'INSERT INTO medications (patient_id, medication) VALUES (?, ?)',
+                    ((pid, m) for pid, case in zip(ids, cases) for m in case.get('medications', []))
+                )
+            written_version = database_version(conn)
+            conn.execute('COMMIT')
+        except Exception:
+            if conn.in_transaction:
+                conn.execute('ROLLBACK')
+            raise
+        finally:
+            conn.close()
+        # Un rechargement en cours au moment de l'écriture repassera sur les sources
+        reloader.record_change(DB_PATH, version, written_version)
+
+        touched, stale_variants = apply_cases(cases, knowledge, has_medications, today)
+    diagnosis_cache.invalidate_symptoms(touched, stale_variants)
+
+    logger.info(f"{len(cases)} cas ajoutés (total: {len(knowledge.case_base)})")
+    return ids
+
+def apply_cases(cases, knowledge, has_medications, today=None):
+    """Ajoute à la base en mémoire des cas déjà écrits dans SQLite (appelé avec db_lock)
+
+    Retourne les symptômes touchés et les variantes du cache à vider entièrement.
+    """
+    # Mise à jour incrémentale en mémoire, sous le verrou : les règles sont mises
+    # à jour après l'ajout de tout le lot à la base de cas
+    case_base = knowledge.case_base
+    rules_threshold = rules_state(knowledge)
+    profile_ids = []
+    touched = set()
+    for case in cases:
+        symptoms = symptom_normalizer.normalize_list(case['symptoms'])
+        profile_id, is_new = case_base.add_case(
+            case['diagnostic'], symptoms, case.get('date_consultation', today)
+        )
+        if is_new:
+            for engine in knowledge.engines.values():
+                engine.add_profile(profile_id)
+            knowledge.similar_cases.add_profile(profile_id)
+        profile_ids.append(profile_id)
+        knowledge.suggestions.add_case(symptoms)
+        if has_medications:
+            case_base.medications.add_case(case['diagnostic'], case.get('age'), case.get('medications', []))
+        touched.update(symptoms)
+    # Règles touchées par le lot recalculées une seule fois
+    knowledge.engines['rules'].add_cases(profile_ids)
+    return touched, rules_variants(knowledge, rules_threshold)
+
+def catch_up_cases(conn, knowledge, database):
+    """Applique à la base en mémoire les patients ajoutés par d'autres processus
+
+    Appelé avec db_lock, dans une transaction de `conn`. Retourne False si
+    d'autres écritures (modifications, suppressions) exigent un rechargement.
+    """
+    known = reloader.database_version(database)
+    current = database_version(conn)
+    if known == current:
+        return True
+    if known is None or known[0] != current[0] or known[1] is None or knowledge is not reloader.current:
+        return False
+    patient_ids = inserted_patients(conn, known[1], current[1])
+    if patient_ids is None:
+        return False
+
+    columns = {row[1] for row in conn.execute('PRAGMA table_info(patients)')}
+    date_column = 'date_consultation' if 'date_consultation' in columns else 'NULL'
+    has_medications = table_exists(conn, 'medications')
+    cases = []
+    for patient_id in patient_ids:
+        row = conn.execute(
+            f'SELECT diagnostic, {date_column}, age FROM patients WHERE id = ?', (patient_id,)
+        ).fetchone()
+        symptoms = [name for name, in conn.execute('''
+            SELECT v.name FROM patient_symptoms ps
+            JOIN symptom_vocab v ON v.id = ps.symptom_id
+            WHERE ps.patient_id = ?
+        ''', (patient_id,))]
+        medications = []
+        if has_medications:
+            medications = [medication for medication, in conn.execute(
+                'SELECT medication FROM medications WHERE patient_id = ?', (patient_id,)
+            )]
+        cases.append({
+            'diagnostic': row[0], 'date_consultation': row[1], 'age': row[2],
+            'symptoms': symptoms, 'medications': medications,
+        })
+    touched, stale_variants = apply_cases(cases, knowledge, has_medications)
+    reloader.record_change(database, known, current)
+    diagnosis_cache.invalidate_symptoms(touched, stale_variants)
+    logger.info(f"{len(cases)} cas ajoutés par d'autres processus (total: {len(knowledge.case_base)})")
+    return True
+
+def sync_cases(database):
+    """Rattrape les écritures des autres workers dans `database` (appelé par la surveillance)"""
+    with db_lock:
+        knowledge = reloader.current
+        if knowledge is None:
+            return False
+        conn = sqlite3.connect(database, timeout=30, isolation_level=None)
+        try:
+            # Lecture cohérente : compteur, journal et patients d'une même version
+            conn.execute('BEGIN')
+            return catch_up_cases(conn, knowledge, database)
+        finally:
+            if conn.in_transaction:
+                conn.execute('ROLLBACK')
+            conn.close()
+
+def rules_state(knowledge):
+    """Seuil d'effectif des règles et nombre d'extractions : s'ils changent, toutes les règles sont réévaluées"""
+    rules = knowledge.engines['rules']
+    return rules.min_count, rules.mined_count
+
+def rules_variants(knowledge, previous_state):
+    """Variantes du cache à vider entièrement après une mise à jour des règles"""
+    if rules_state(knowledge) != previous_state:
+        # Règles sans symptôme commun avec le cas ajoutées ou retirées par le nouveau seuil
+        return (cache_variant('rules'),)
+    return ()
+
+def retire_case(patient_id, knowledge):
+    """Supprime un patient de SQLite et retire son cas de la base en mémoire
+
+    Retourne False si le patient n'existe pas.
+    """
+    with db_lock:
+        conn = sqlite3.connect(DB_PATH, timeout=30, isolation_level=None)
+        try:
+            columns = {row[1] for row in conn.execute('PRAGMA table_info(patients)')}
+            date_column = 'date_consultation' if 'date_consultation' in columns else 'NULL'
+
+            conn.execute('BEGIN IMMEDIATE')
+            catch_up_cases(conn, knowledge, DB_PATH)
+            version = database_version(conn)
+            row = conn.execute(
+                f'SELECT diagnostic, {date_column}, age FROM patients WHERE id = ?', (patient_id,)
+            ).fetchone()
+            if row is None:
+                conn.execute('ROLLBACK')
+                return False
+            symptoms = [name for name, in conn.execute('''
+                SELECT v.name FROM patient_symptoms ps
+                JOIN symptom_vocab v ON v.id = ps.symptom_id
+                WHERE ps.patient_id = ?
+            ''', (patient_id,))]
+            conn.execute('DELETE FROM patient_symptoms WHERE patient_id = ?', (patient_id,))
+            medications = None
+            if table_exists(conn, 'medications'):
+                medications = [medication for medication, in conn.execute(
+                    'SELECT medication FROM medications WHERE patient_id = ?', (patient_id,)
+                )]
+                conn.execute('DELETE FROM medications WHERE patient_id = ?', (patient_id,))
+            conn.execute('DELETE FROM patients WHERE id = ?', (patient_id,))
+            written_version = database_version(conn)
+            conn.execute('COMMIT')
+        except Exception:
+            if conn.in_transaction:
+                conn.execute('ROLLBACK')
+            raise
+        finally:
+            conn.close()
+        reloader.record_change(DB_PATH, version, written_version)
+
+        symptoms = symptom_normalizer.normalize_list(symptoms)
+        rules_threshold = rules_state(knowledge)
+        profile_id = knowledge.case_base.remove_case(row[0], symptoms, row[1])
+        if medications is not None:
+            knowledge.case_base.medications.remove_case(row[0], row[2], medications)
+        if profile_id is not None:
+            knowledge.engines['rules'].remove_case(profile_id)
+            knowledge.suggestions.remove_case(symptoms)
+        stale_variants = rules_variants(knowledge, rules_threshold)
+    diagnosis_cache.invalidate_symptoms(symptoms, stale_variants)
+
+    logger.info(f"Cas du patient {patient_id} retiré (total: {len(knowledge.case_base)})")
+    return True
+
+def scan_average_scores(symptoms, data, case_weights=None):
+    """Parcours complet des cas (implémentation de référence sans index)
+
+    `case_weights` donne le poids de chaque cas dans la moyenne (1 par défaut).
+    """
+    input_symptoms = set(symptoms)
+    if case_weights is None:
+        case_weights = [1] * len(data.case_profiles)
+    else:
+        case_weights = case_weights.tolist()
+
+    # Calcul des scores pour chaque diagnostic
+    diagnosis_scores = {}
+    for profile_id, weight in zip(data.case_profiles.tolist(), case_weights):
+        # Cas retiré
+        if profile_id < 0:
+            continue
+        case_symptoms = {data.symptoms[i] for i in data.profile_symptoms(profile_id)}
+
+        # Filtrage des cas avec des symptômes similaires
+        if not any(symptom in case_symptoms for symptom in symptoms):
+            continue
+        diagnosis = data.diagnostics[data.profile_diagnostics[profile_id]]
+
+        # Calcul de la similarité (coefficient de Jaccard)
+        intersection = len(case_symptoms.intersection(input_symptoms))
+        union = len(case_symptoms.union(input_symptoms))
+        similarity = intersection / union if union > 0 else 0
+
+        if diagnosis not in diagnosis_scores:
+            diagnosis_scores[diagnosis] = [0, 0]
+        diagnosis_scores[diagnosis][0] += similarity * weight
+        diagnosis_scores[diagnosis][1] += weight
+
+    # Calcul des scores moyens (pondérés)
+    return [
+        (diagnosis, total / weight)
+        for diagnosis, (total, weight) in diagnosis_scores.items()
+        if weight > 0
+    ]
+
+def similar_cases(symptoms, knowledge, k=SIMILAR_CASES_K, bands=None, check=False):
+    """Cas passés les plus similaires aux symptômes (recherche MinHash LSH)
+
+    Les cas identiques sont regroupés : chaque élément donne un profil
+    (diagnostic, symptômes), sa similarité de Jaccard et son nombre de cas.
+    Avec `check`, le résultat est comparé à la recherche exacte par force
+    brute et le rappel est retourné.
+    """
+    index = knowledge.similar_cases
+    case_base = knowledge.case_base
+    started = time.perf_counter()
+    profile_ids, similarities, n_candidates = index.search(symptoms, k, bands)
+    elapsed = time.perf_counter() - started
+
+    result = {
+        "cases": [
+            {
+                "diagnostic": case_base.diagnostics[case_base.profile_diagnostics[profile_id]],
+                "symptoms": sorted(case_base.symptoms[i] for i in case_base.profile_symptoms(profile_id)),
+                "similarity": round(float(similarity), 4),
+                "count": int(case_base.profile_counts[profile_id]),
+            }
+            for profile_id, similarity in zip(profile_ids.tolist(), similarities)
+        ],
+        "candidates": n_candidates,
+        "elapsed_ms": round(elapsed * 1000, 3),
+    }
+    if check:
+        started = time.perf_counter()
+        _, exact = index.exact_search(symptoms, k)
+        exact_elapsed = time.perf_counter() - started
+        # Rappel tolérant aux ex aequo : un cas aussi similaire que le k-ième exact compte
+        found = int((similarities >= exact[-1] - 1e-12).sum()) if len(exact) else 0
+        result["check"] = {
+            "recall": round(found / len(exact), 4) if len(exact) else 1.0,
+            "exact_similarities": [round(float(similarity), 4) for similarity in exact],
+            "exact_elapsed_ms": round(exact_elapsed * 1000, 3),
+        }
+    return result
+
+# Base de connaissances (base de cas et moteurs), chargée une seule fois puis
+# remplacée d'un bloc à chaque rechargement ; sa génération invalide le cache
+reloader = KnowledgeBaseReloader(
+    load_data, SOURCE_PATHS, RULE_OPTIONS, RECENCY_HALF_LIFE_DAYS, SIMILARITY_OPTIONS,
+    DIAGNOSIS_SHARDS, SOURCE_DATABASES, sync_cases, prepare_sources,
+)
+
+def start_source_watcher():
+    """Surveillance des sources dans le processus courant (une fois par worker)"""
+    if WATCH_SOURCES:
+        reloader.start_watcher(WATCH_INTERVAL)
+    elif SYNC_INTERVAL > 0:
+        # Seul le compteur d'écritures SQLite est lu : cas ajoutés par les autres workers
+        reloader.start_watcher(SYNC_INTERVAL, files=False)
+
+def get_knowledge_base():
+    """Base de connaissances courante, chargée au premier appel (None si indisponible)"""
+    knowledge = reloader.get()
+    if knowledge is not None:
+        start_source_watcher()
+    return knowledge
+
+def initialize_data():
+    # La surveillance des sources démarre avec les requêtes, donc après le fork des workers
+    logger.info("Initialisation du système expert médical...")
+    if reloader.get() is None:
+        logger.error("Erreur critique lors du démarrage: échec du chargement initial des données")
         return False
+    logger.info("✅ Système expert initialisé avec succès.")
+    return True
 
 # Routes
 @app.route('/')
 def home():
     """Page d'accueil"""
     # Vérification que les données sont chargées
-    if data is None:
-        if not initialize_data():
-            return "Système en cours d'initialisation, veuillez patienter...", 503
+    if get_knowledge_base() is None:
+        return "Système en cours d'initialisation, veuillez patienter...", 503
     return render_template_string(HTML_TEMPLATE)
 
-@app.route('/health')
-def health():
-    """Endpoint de santé pour le monitoring"""
+def health_status():
+    """État de santé du service et code HTTP associé (partagé par les points d'entrée WSGI et ASGI)"""
     try:
+        knowledge = reloader.current
         # Vérification de la connexion à la base de données
         if os.path.exists(DB_PATH):
             conn = sqlite3.connect(DB_PATH, timeout=5)
             cursor = conn.cursor()
             cursor.execute("SELECT COUNT(*) FROM patients")
             count = cursor.fetchone()[0]
+            schema_version = get_schema_version(conn)
+            symptoms_count = None
+            if schema_version >= SCHEMA_VERSION:
+                cursor.execute("SELECT COUNT(*) FROM symptom_vocab")
+                symptoms_count = cursor.fetchone()[0]
             conn.close()
             
             status = {
@@ -647,80 +1215,583 @@ def health():
                 "timestamp": datetime.now().isoformat(),
                 "database": "connected",
                 "patients_count": count,
-                "data_loaded": data is not None
+                "schema_version": schema_version,
+                "symptoms_count": symptoms_count,
+                "data_loaded": knowledge is not None,
+                "data_generation": knowledge.generation if knowledge is not None else None,
+                "reload": reloader.status(),
+                "rules": knowledge.engines['rules'].stats() if knowledge is not None else None,
+                "shared_case_base": SHARED_CASE_BASE,
+                "worker_pid": os.getpid(),
+                "diagnosis_cache": diagnosis_cache.stats()
             }
-            return jsonify(status)
+            return status, 200
         else:
-            return jsonify({
+            return {
                 "status": "unhealthy", 
                 "error": "Database not found",
                 "timestamp": datetime.now().isoformat()
-            }), 500
+            }, 500
     except Exception as e:
         logger.error(f"Échec du health check: {str(e)}")
-        return jsonify({
+        return {
             "status": "unhealthy", 
             "error": str(e),
             "timestamp": datetime.now().isoformat()
-        }), 500
+        }, 500
+
+def readiness_state():
+    """État en mémoire de la base de connaissances pour /health/ready (aucune entrée/sortie)"""
+    knowledge = reloader.current
+    state = {
+        "data_loaded": knowledge is not None,
+        "worker_pid": os.getpid(),
+        "reload": reloader.status(),
+    }
+    if knowledge is None:
+        return state
+    case_base = knowledge.case_base
+    state.update({
+        "cases_count": len(case_base),
+        "data_generation": knowledge.generation,
+        "loaded_at": knowledge.loaded_at.isoformat(),
+        "indexes": {
+            "profiles": case_base.n_profiles,
+            "symptoms": len(case_base.symptoms),
+            "diagnostics": len(case_base.diagnostics),
+            "case_base_bytes": case_base.nbytes,
+            "inverted_index_postings": sum(len(posting) for posting in knowledge.engines['index'].postings),
+            "rules": knowledge.engines['rules'].n_rules,
+            "similar_cases_bands": knowledge.similar_cases.bands,
+            "medications": case_base.medications.stats(),
+        },
+    })
+    return state
+
+def check_database():
+    """Vérification profonde de la base SQLite (connexion et requêtes de comptage)"""
+    if not os.path.exists(DB_PATH):
+        raise FileNotFoundError("Database not found")
+    conn = sqlite3.connect(DB_PATH, timeout=5)
+    try:
+        count = conn.execute("SELECT COUNT(*) FROM patients").fetchone()[0]
+        return {"patients_count": count, "schema_version": get_schema_version(conn)}
+    finally:
+        conn.close()
+
+# Instantané servi par /health/ready : la base SQLite est vérifiée au plus une
+# fois toutes les HEALTH_DB_INTERVAL secondes, en arrière-plan
+health_monitor = HealthMonitor(
+    readiness_state, check_database,
+    interval=float(os.environ.get('HEALTH_SNAPSHOT_INTERVAL', 2)),
+    database_interval=float(os.environ.get('HEALTH_DB_INTERVAL', 30)),
+)
+
+def knowledge_value(read):
+    """Jauge lue sur la base de connaissances courante (absente tant qu'elle n'est pas chargée)"""
+    def value():
+        knowledge = reloader.current
+        return None if knowledge is None else read(knowledge)
+    return value
+
+def cache_value(name):
+    return lambda: diagnosis_cache.stats()[name]
+
+# Métriques exportées par /metrics, lues au moment de l'export (aucun coût par requête)
+metrics_registry = MetricsRegistry([
+    stage_seconds,
+    request_seconds,
+    Gauge('knowledge_base_generation', "Génération de la base de connaissances servie",
+          knowledge_value(lambda k: k.generation)),
+    Gauge('knowledge_base_loaded_timestamp_seconds', "Date de chargement de la base de connaissances",
+          knowledge_value(lambda k: k.loaded_at.timestamp())),
+    Gauge('knowledge_base_reloads_total', "Rechargements réussis", lambda: reloader.reloads, kind='counter'),
+    Gauge('knowledge_base_reload_failures_total', "Rechargements échoués", lambda: reloader.failures,
+          kind='counter'),
+    Gauge('case_base_cases', "Nombre de cas de la base", knowledge_value(lambda k: len(k.case_base))),
+    Gauge('case_base_profiles', "Nombre de profils (symptômes, diagnostic) distincts",
+          knowledge_value(lambda k: k.case_base.n_profiles)),
+    Gauge('case_base_symptoms', "Taille du vocabulaire des symptômes",
+          knowledge_value(lambda k: len(k.case_base.symptoms))),
+    Gauge('case_base_diagnostics', "Nombre de diagnostics distincts",
+          knowledge_value(lambda k: len(k.case_base.diagnostics))),
+    Gauge('case_base_bytes', "Taille des tableaux de la base de cas",
+          knowledge_value(lambda k: k.case_base.nbytes)),
+    Gauge('inverted_index_postings', "Nombre d'entrées de l'index inversé",
+          knowledge_value(lambda k: sum(len(posting) for posting in k.engines['index'].postings))),
+    Gauge('association_rules', "Nombre de règles d'association",
+          knowledge_value(lambda k: k.engines['rules'].n_rules)),
+    Gauge('medication_pairs', "Couples diagnostic x médicament suivis",
+          knowledge_value(lambda k: k.case_base.medications.stats()["pairs"])),
+    Gauge('diagnosis_cache_entries', "Entrées du cache des diagnostics", cache_value('size')),
+    *(
+        Gauge(f'diagnosis_cache_{name}_total', f"Cache des diagnostics : {label}", cache_value(name),
+              kind='counter')
+        for name, label in (
+            ('hits', "succès"), ('misses', "échecs"), ('evictions', "entrées évincées"),
+            ('expirations', "entrées expirées"), ('invalidations', "entrées invalidées"),
+        )
+    ),
+])
+
+@app.before_request
+def start_request_timer():
+    g.request_started = time.perf_counter()
+
+@app.after_request
+def record_request_duration(response):
+    started = g.get('request_started')
+    if started is not None:
+        route = request.url_rule.rule if request.url_rule is not None else 'unmatched'
+        request_seconds.observe(time.perf_counter() - started, route)
+    return response
+
+@app.route('/metrics')
+def metrics():
+    """Métriques au format texte de Prometheus (propres à chaque worker)"""
+    return Response(metrics_registry.render(), content_type=CONTENT_TYPE)
+
+@app.route('/health')
+def health():
+    """Endpoint de santé pour le monitoring"""
+    status, code = health_status()
+    return jsonify(status), code
+
+def symptoms_variant(knowledge, if_none_match=None, accept_encoding=None):
+    """Réponse de /api/symptoms : (statut, corps, en-têtes), 304 si le client a déjà ce contenu"""
+    symptoms = knowledge.case_base.symptoms
+    # Au sein d'une génération, le vocabulaire ne fait que grandir
+    n_symptoms = len(symptoms)
+    variants = symptoms_response.get(
+        (knowledge.generation, n_symptoms), lambda: sorted(symptoms[:n_symptoms])
+    )
+    headers = {
+        "Cache-Control": f"public, max-age={SYMPTOMS_MAX_AGE}",
+        "Vary": "Accept-Encoding",
+    }
+    encoding = EncodedResponse.choose(variants, accept_encoding)
+    body, headers["ETag"] = variants[encoding]
+    if EncodedResponse.matches(variants, if_none_match):
+        return 304, b'', headers
+    headers["Content-Type"] = "application/json"
+    if encoding != 'identity':
+        headers["Content-Encoding"] = encoding
+    return 200, body, headers
+
+@app.route('/health/live')
+def health_live():
+    """Sonde de vivacité : le processus répond (aucune entrée/sortie)"""
+    return jsonify({"status": "alive", "worker_pid": os.getpid(), "timestamp": datetime.now().isoformat()})
+
+@app.route('/health/ready')
+def health_ready():
+    """Sonde de disponibilité : instantané mis en cache, 503 tant que le service n'est pas prêt"""
+    snapshot = health_monitor.snapshot()
+    return jsonify(snapshot), 200 if snapshot["ready"] else 503
 
 @app.route('/api/symptoms', methods=['GET'])
 def get_symptoms():
     """Retourne la liste des symptômes possibles"""
     try:
-        # Initialisation des données si nécessaire
-        if data is None:
-            if not initialize_data():
-                return jsonify({"error": "Système non initialisé"}), 503
-        
-        # Extraction de tous les symptômes uniques
-        all_symptoms = set()
-        for symptoms in data['symptoms_list']:
-            if isinstance(symptoms, list):
-                all_symptoms.update(symptoms)
+        # Base de connaissances lue une seule fois pour toute la requête
+        knowledge = get_knowledge_base()
+        if knowledge is None:
+            return jsonify({"error": "Système non initialisé"}), 503
         
-        return jsonify(sorted(list(all_symptoms)))
+        # Vocabulaire des symptômes de la base de cas, pré-encodé
+        status, body, headers = symptoms_variant(
+            knowledge, request.headers.get('If-None-Match'), request.headers.get('Accept-Encoding')
+        )
+        return Response(body, status=status, headers=headers)
     
     except Exception as e:
         logger.error(f"Erreur lors de la récupération des symptômes: {str(e)}")
         return jsonify({"error": str(e)}), 500
 
+def symptom_suggestions(knowledge, prefix, limit=SUGGEST_LIMIT):
+    """Réponse de /api/symptoms/suggest : symptômes commençant par `prefix`, les plus fréquents d'abord"""
+    return {"query": prefix, "suggestions": knowledge.suggestions.suggest(prefix, limit)}
+
+@app.route('/api/symptoms/suggest', methods=['GET'])
+def suggest_symptoms():
+    """Complétion des symptômes : ?q=fiè&limit=10 (sans tenir compte des accents ni de la casse)"""
+    try:
+        knowledge = get_knowledge_base()
+        if knowledge is None:
+            return jsonify({"error": "Système non initialisé"}), 503
+
+        limit = int_arg('limit', SUGGEST_LIMIT, MAX_SUGGEST_LIMIT)
+        if limit is None:
+            return jsonify({"error": f"limit must be an integer between 1 and {MAX_SUGGEST_LIMIT}"}), 400
+        return jsonify(symptom_suggestions(knowledge, request.args.get('q', ''), limit))
+
+    except Exception as e:
+        logger.error(f"Erreur lors de la complétion des symptômes: {str(e)}")
+        return jsonify({"error": str(e)}), 500
+
+def validate_symptoms(request_data):
+    """Vérifie le corps d'une requête de diagnostic, retourne un message d'erreur ou None"""
+    if not request_data or 'symptoms' not in request_data:
+        return "Symptoms are required"
+
+    symptoms = request_data['symptoms']
+    if not isinstance(symptoms, list) or len(symptoms) == 0:
+        return "Symptoms must be a non-empty list"
+    return None
+
+def scoring_options(request_data):
+    """Moteur ("engine") et pondération ("weighting") d'une requête : (moteur, pondération, erreur)"""
+    backend = request_data.get('engine') or DIAGNOSIS_BACKEND
+    if backend not in DIAGNOSIS_BACKENDS:
+        return None, None, f"Engine must be one of {', '.join(DIAGNOSIS_BACKENDS)}"
+    if backend == 'sharded' and not DIAGNOSIS_SHARDS:
+        return None, None, "Sharded engine is disabled (DIAGNOSIS_SHARDS=0)"
+    weighting = request_data.get('weighting') or DIAGNOSIS_WEIGHTING
+    if weighting not in DIAGNOSIS_WEIGHTINGS:
+        return None, None, f"Weighting must be one of {', '.join(DIAGNOSIS_WEIGHTINGS)}"
+    if backend == 'rules':
+        # Les règles portent sur les effectifs des itemsets
+        if request_data.get('weighting') == 'recency':
+            return None, None, "Recency weighting is not available for the rules engine"
+        weighting = 'uniform'
+    return backend, weighting, None
+
+def patient_age(request_data):
+    """Âge facultatif ("age") d'une requête de diagnostic : (âge, erreur)"""
+    age = request_data.get('age')
+    if age is not None and (not isinstance(age, int) or isinstance(age, bool) or not 0 <= age <= 150):
+        return None, "Age must be an integer between 0 and 150"
+    return age, None
+
+def validate_case(case):
+    """Vérifie un cas confirmé à ajouter, retourne un message d'erreur ou None"""
+    if not isinstance(case, dict):
+        return "Case must be an object"
+    error = validate_symptoms(case)
+    if error:
+        return error
+    # Vérifiés après normalisation : "  ", "__" ou "-" n'ont pas de nom canonique
+    normalize = symptom_normalizer.normalize
+    if not all(isinstance(symptom, str) and normalize(symptom) for symptom in case['symptoms']):
+        return "Symptoms must be non-empty strings"
+    if not isinstance(case.get('diagnostic'), str) or not fold(case['diagnostic']):
+        return "Diagnostic is required"
+    # La colonne patients.age est NOT NULL
+    age = case.get('age')
+    if not isinstance(age, int) or isinstance(age, bool) or not 0 <= age <= 150:
+        return "Age must be an integer between 0 and 150"
+    medications = case.get('medications', [])
+    if not isinstance(medications, list) or not all(isinstance(m, str) for m in medications):
+        return "Medications must be a list of strings"
+    if 'date_consultation' in case:
+        try:
+            datetime.strptime(case['date_consultation'], "%Y-%m-%d")
+        except (TypeError, ValueError):
+            return "date_consultation must use the YYYY-MM-DD format"
+    return None
+
 @app.route('/api/diagnose', methods=['POST'])
 def diagnose():
     """Endpoint de diagnostic"""
     try:
-        # Initialisation des données si nécessaire
-        if data is None:
-            if not initialize_data():
-                return jsonify({"error": "Système non initialisé"}), 503
+        # Base de connaissances lue une seule fois pour toute la requête
+        knowledge = get_knowledge_base()
+        if knowledge is None:
+            return jsonify({"error": "Système non initialisé"}), 503
         
         # Vérification des données d'entrée
+        timer = StageTimer(stage_seconds)
         request_data = request.get_json()
-        if not request_data or 'symptoms' not in request_data:
-            return jsonify({"error": "Symptoms are required"}), 400
+        error = validate_symptoms(request_data)
+        if error:
+            return jsonify({"error": error}), 400
         
         symptoms = request_data['symptoms']
-        if not isinstance(symptoms, list) or len(symptoms) == 0:
-            return jsonify({"error": "Symptoms must be a non-empty list"}), 400
         
-        # Calcul du diagnostic
-        diagnosis = calculate_diagnosis(symptoms, data)
+        # Moteur et pondération choisis par la requête, sinon ceux par défaut
+        backend, weighting, error = scoring_options(request_data)
+        if error:
+            return jsonify({"error": error}), 400
+        age, error = patient_age(request_data)
+        if error:
+            return jsonify({"error": error}), 400
+        timer.engine = backend
+        timer.lap('validate')
         
-        return jsonify({
+        # Calcul du diagnostic sur les noms canoniques, puis médicaments recommandés
+        canonical = symptom_normalizer.normalize_list(symptoms)
+        timer.lap('normalize')
+        # Cache, calcul et classement sont chronométrés par cached_diagnosis et calculate_diagnosis
+        diagnosis = cached_diagnosis(canonical, knowledge, backend, weighting)
+        timer.restart()
+        diagnoses = with_recommendations(diagnosis, knowledge, age)
+        timer.lap('recommend')
+        
+        response = jsonify({
             "symptoms": symptoms,
-            "diagnoses": diagnosis,
+            "engine": backend,
+            "weighting": weighting,
+            "diagnoses": diagnoses,
             "timestamp": datetime.now().isoformat()
         })
+        timer.lap('serialize')
+        return response
     
     except Exception as e:
         logger.error(f"Erreur lors du diagnostic: {str(e)}")
         return jsonify({"error": str(e)}), 500
 
+@app.route('/api/diagnose/batch', methods=['POST'])
+def diagnose_batch():
+    """Endpoint de diagnostic en lot : {"items": [{"symptoms": [...]}, ...], "engine", "weighting"}"""
+    try:
+        # Base de connaissances lue une seule fois pour toute la requête
+        knowledge = get_knowledge_base()
+        if knowledge is None:
+            return jsonify({"error": "Système non initialisé"}), 503
+
+        # Vérification des données d'entrée
+        request_data = request.get_json()
+        if not request_data or not isinstance(request_data.get('items'), list):
+            return jsonify({"error": "Items must be a list"}), 400
+
+        items = request_data['items']
+        if len(items) > MAX_BATCH_SIZE:
+            return jsonify({"error": f"Batch size is limited to {MAX_BATCH_SIZE} items"}), 413
+
+        backend, weighting, error = scoring_options(request_data)
+        if error:
+            return jsonify({"error": error}), 400
+
+        # Les éléments invalides reçoivent leur propre erreur sans faire échouer le lot
+        results = [None] * len(items)
+        valid_positions = []
+        for position, item in enumerate(items):
+            error = validate_symptoms(item if isinstance(item, dict) else None)
+            if error:
+                symptoms = item.get('symptoms') if isinstance(item, dict) else None
+                results[position] = {"symptoms": symptoms, "diagnoses": [], "error": error}
+            else:
+                valid_positions.append(position)
+
+        # Seuls les éléments absents du cache sont calculés
+        generation = knowledge.generation
+        epoch = diagnosis_cache.epoch
+        pending = []
+        for position in valid_positions:
+            symptoms = symptom_normalizer.normalize_list(items[position]['symptoms'])
+            key = DiagnosisCache.make_key(symptoms, cache_variant(backend, weighting))
+            cached = diagnosis_cache.get(key, generation)
+            if cached is None:
+                pending.append((position, key, symptoms))
+            else:
+                results[position] = {"symptoms": items[position]['symptoms'], "diagnoses": cached, "error": None}
+
+        batch = calculate_diagnosis_batch(
+            [symptoms for _, _, symptoms in pending], knowledge, backend, weighting
+        )
+        for (position, key, _), result in zip(pending, batch):
+            if result['error'] is None:
+                diagnosis_cache.put(key, result['diagnoses'], generation, epoch)
+            results[position] = {"symptoms": items[position]['symptoms'], **result}
+
+        return jsonify({
+            "results": results,
+            "engine": backend,
+            "weighting": weighting,
+            "timestamp": datetime.now().isoformat()
+        })
+
+    except Exception as e:
+        logger.error(f"Erreur lors du diagnostic en lot: {str(e)}")
+        return jsonify({"error": str(e)}), 500
+
+def int_arg(name, default, maximum):
+    """Paramètre entier de la requête entre 1 et `maximum`, None s'il est invalide"""
+    try:
+        value = int(request.args.get(name, default))
+    except ValueError:
+        return None
+    return value if 1 <= value <= maximum else None
+
+@app.route('/api/similar-cases', methods=['GET', 'POST'])
+def get_similar_cases():
+    """Cas passés les plus similaires : ?k=10&bands=16&check=1, symptômes dans le corps JSON ou ?symptoms="""
+    try:
+        # Base de connaissances lue une seule fois pour toute la requête
+        knowledge = get_knowledge_base()
+        if knowledge is None:
+            return jsonify({"error": "Système non initialisé"}), 503
+
+        if request.method == 'POST':
+            request_data = request.get_json()
+        else:
+            request_data = {"symptoms": request.args.getlist('symptoms')}
+        error = validate_symptoms(request_data)
+        if error:
+            return jsonify({"error": error}), 400
+        symptoms = request_data['symptoms']
+
+        # Compromis rappel/latence : nombre de cas et de bandes LSH sondées
+        max_bands = knowledge.similar_cases.bands
+        k = int_arg('k', SIMILAR_CASES_K, MAX_SIMILAR_CASES)
+        if k is None:
+            return jsonify({"error": f"k must be an integer between 1 and {MAX_SIMILAR_CASES}"}), 400
+        bands = int_arg('bands', max_bands, max_bands)
+        if bands is None:
+            return jsonify({"error": f"bands must be an integer between 1 and {max_bands}"}), 400
+        check = request.args.get('check', '0').lower() in ('1', 'true', 'yes')
+
+        result = similar_cases(symptom_normalizer.normalize_list(symptoms), knowledge, k, bands, check)
+        return jsonify({
+            "symptoms": symptoms,
+            "k": k,
+            "bands": bands,
+            **result,
+            "timestamp": datetime.now().isoformat()
+        })
+
+    except Exception as e:
+        logger.error(f"Erreur lors de la recherche de cas similaires: {str(e)}")
+        return jsonify({"error": str(e)}), 500
+
+@app.route('/api/cases', methods=['POST'])
+def add_case():
+    """Ajoute un cas confirmé à la base de connaissances (apprentissage continu)"""
+    try:
+        # Base de connaissances lue une seule fois pour toute la requête
+        knowledge = get_knowledge_base()
+        if knowledge is None:
+            return jsonify({"error": "Système non initialisé"}), 503
+
+        case = request.get_json()
+        error = validate_case(case)
+        if error:
+            return jsonify({"error": error}), 400
+
+        patient_id, = ingest_cases([case], knowledge)
+        return jsonify({
+            "id": patient_id,
+            "cases_count": len(knowledge.case_base),
+            "timestamp": datetime.now().isoformat()
+        }), 201
+
+    except Exception as e:
+        logger.error(f"Erreur lors de l'ajout du cas: {str(e)}")
+        return jsonify({"error": str(e)}), 500
+
+@app.route('/api/cases/bulk', methods=['POST'])
+def add_cases_bulk():
+    """Ajout en masse de cas confirmés : {"cases": [...]} (tout ou rien)"""
+    try:
+        # Base de connaissances lue une seule fois pour toute la requête
+        knowledge = get_knowledge_base()
+        if knowledge is None:
+            return jsonify({"error": "Système non initialisé"}), 503
+
+        request_data = request.get_json()
+        if not request_data or not isinstance(request_data.get('cases'), list):
+            return jsonify({"error": "Cases must be a list"}), 400
+
+        cases = request_data['cases']
+        if len(cases) > MAX_BULK_CASES:
+            return jsonify({"error": f"Bulk size is limited to {MAX_BULK_CASES} cases"}), 413
+
+        errors = [
+            {"index": position, "error": error}
+            for position, error in enumerate(validate_case(case) for case in cases)
+            if error
+        ]
+        if errors:
+            return jsonify({"error": "Invalid cases", "details": errors}), 400
+
+        ids = ingest_cases(cases, knowledge)
+        return jsonify({
+            "inserted": len(ids),
+            "ids": ids,
+            "cases_count": len(knowledge.case_base),
+            "timestamp": datetime.now().isoformat()
+        }), 201
+
+    except Exception as e:
+        logger.error(f"Erreur lors de l'ajout en masse: {str(e)}")
+        return jsonify({"error": str(e)}), 500
+
+@app.route('/api/cases/<int:patient_id>', methods=['DELETE'])
+def delete_case(patient_id):
+    """Retire un cas de la base de connaissances (erreur de saisie, diagnostic infirmé)"""
+    try:
+        # Base de connaissances lue une seule fois pour toute la requête
+        knowledge = get_knowledge_base()
+        if knowledge is None:
+            return jsonify({"error": "Système non initialisé"}), 503
+
+        if not retire_case(patient_id, knowledge):
+            return jsonify({"error": "Case not found"}), 404
+        return jsonify({
+            "id": patient_id,
+            "cases_count": len(knowledge.case_base),
+            "timestamp": datetime.now().isoformat()
+        })
+
+    except Exception as e:
+        logger.error(f"Erreur lors du retrait du cas: {str(e)}")
+        return jsonify({"error": str(e)}), 500
+
+@app.route('/admin/reload', methods=['POST'])
+def admin_reload():
+    """Recharge la base de connaissances depuis les sources (?wait=1 pour attendre la fin)"""
+    try:
+        if ADMIN_TOKEN:
+            if request.headers.get('X-Admin-Token') != ADMIN_TOKEN:
+                return jsonify({"error": "Unauthorized"}), 401
+        elif request.remote_addr not in ('127.0.0.1', '::1'):
+            return jsonify({"error": "Unauthorized"}), 401
+
+        wait = request.args.get('wait', '0').lower() in ('1', 'true', 'yes')
+        reloaded = reloader.reload(wait=wait)
+        if not wait:
+            return jsonify({"status": "reloading", **reloader.status()}), 202
+        if not reloaded:
+            return jsonify({"status": "failed", **reloader.status()}), 500
+        return jsonify({"status": "reloaded", **reloader.status()})
+
+    except Exception as e:
+        logger.error(f"Erreur lors du rechargement: {str(e)}")
+        return jsonify({"error": str(e)}), 500
+
 # Initialisation au démarrage uniquement si ce script est exécuté directement
 if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Système expert médical")
+    parser.add_argument('--patients', type=int, default=None,
+                        help="génère une base de N patients (si elle n'existe pas) puis quitte")
+    parser.add_argument('--force', action='store_true',
+                        help="remplace la base et le fichier JSON existants")
+    parser.add_argument('--json-patients', type=int, default=500)
+    parser.add_argument('--seed', type=int, default=None,
+                        help="graine du générateur aléatoire (données reproductibles)")
+    args = parser.parse_args()
+
+    if args.patients is not None:
+        # Base existante : ni elle ni le fichier JSON ne sont régénérés, sauf avec --force
+        if not create_sqlite_database(args.patients, args.seed, args.force):
+            logger.info("Base existante conservée, fichier JSON inchangé (--force pour les régénérer)")
+        elif args.json_patients > 0:
+            json_seed = None if args.seed is None else args.seed + 1
+            create_json_data(args.json_patients, json_seed)
+    else:
+        initialize_data()
+        # kill -HUP <pid> recharge la base sans redémarrer le serveur
+        reloader.install_signal_handler()
+        port = int(os.environ.get("PORT", 5000))
+        app.run(host='0.0.0.0', port=port, debug=False)
+elif SHARED_CASE_BASE:
+    # Pour Gunicorn avec --preload : chargement unique dans le processus maître,
+    # les workers héritent des tableaux projetés en lecture seule après le fork
     initialize_data()
-    port = int(os.environ.get("PORT", 5000))
-    app.run(host='0.0.0.0', port=port, debug=False)
+    # Les objets existants passent dans la génération permanente du GC :
+    # aucune écriture sur leurs en-têtes, donc pas de copie des pages après le fork
+    gc.freeze()
 else:
     # Pour Gunicorn, initialisation lazy
     pass
\ No newline at end of file
@@ -0,0 +1,303 @@
+# Point d'entrée ASGI (uvicorn asgi:app) pour /api/diagnose, /api/symptoms[/suggest] et /health[/live|/ready]
+#
+# La boucle d'événements n'est jamais bloquée : le chargement de la base, les
+# diagnostics et le contrôle de santé s'exécutent dans un pool de threads, et
+# les requêtes identiques simultanées partagent un seul calcul. Les autres
+# routes restent servies par l'application Flask (app:app).
+import asyncio
+import json
+import logging
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from urllib.parse import parse_qs
+
+import app as service
+from metrics import CONTENT_TYPE, Gauge, StageTimer
+from result_cache import DiagnosisCache
+
+logger = logging.getLogger(__name__)
+
+# Threads de calcul (diagnostics, chargement, contrôle de santé) ; défaut de ThreadPoolExecutor si 0
+SCORING_THREADS = int(os.environ.get('SCORING_THREADS', 0)) or None
+
+# Taille maximale du corps d'une requête, en octets
+MAX_BODY_SIZE = 1 << 20
+
+executor = ThreadPoolExecutor(max_workers=SCORING_THREADS, thread_name_prefix='scoring')
+
+
+class RequestCoalescer:
+    """Regroupe les calculs identiques en cours : un seul calcul par clé, partagé par les requêtes"""
+
+    def __init__(self):
+        self._inflight = {}
+        self.computed = 0
+        self.coalesced = 0
+
+    async def run(self, key, compute):
+        """Résultat de compute() (fonction bloquante exécutée dans le pool), partagé par clé"""
+        loop = asyncio.get_running_loop()
+        if key is None:
+            return await loop.run_in_executor(executor, compute)
+        future = self._inflight.get(key)
+        if future is None:
+            self.computed += 1
+            future = loop.run_in_executor(executor, compute)
+            self._inflight[key] = future
+            future.add_done_callback(lambda _: self._inflight.pop(key, None))
+        else:
+            self.coalesced += 1
+        # Une requête annulée (client déconnecté) n'annule pas le calcul partagé
+        return await asyncio.shield(future)
+
+    def stats(self):
+        return {
+            "in_flight": len(self._inflight),
+            "computed": self.computed,
+            "coalesced": self.coalesced,
+        }
+
+
+coalescer = RequestCoalescer()
+
+service.metrics_registry.register(Gauge(
+    'asgi_computed_requests_total', "Calculs de diagnostic lancés", lambda: coalescer.computed, kind='counter'
+))
+service.metrics_registry.register(Gauge(
+    'asgi_coalesced_requests_total', "Requêtes servies par un calcul identique déjà en cours",
+    lambda: coalescer.coalesced, kind='counter'
+))
+
+
+class HTTPError(Exception):
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+
+async def read_json(receive):
+    """Corps JSON de la requête (None si vide)"""
+    chunks = []
+    size = 0
+    while True:
+        message = await receive()
+        if message['type'] == 'http.disconnect':
+            raise HTTPError(400, "Client disconnected")
+        chunk = message.get('body', b'')
+        size += len(chunk)
+        if size > MAX_BODY_SIZE:
+            raise HTTPError(413, f"Request body is limited to {MAX_BODY_SIZE} bytes")
+        chunks.append(chunk)
+        if not message.get('more_body', False):
+            break
+    body = b''.join(chunks)
+    if not body:
+        return None
+    try:
+        return json.loads(body)
+    except ValueError:
+        raise HTTPError(400, "Invalid JSON body")
+
+
+async def get_knowledge_base():
+    """Base de connaissances courante ; le premier chargement s'exécute hors de la boucle"""
+    knowledge = service.reloader.current
+    if knowledge is not None:
+        service.start_source_watcher()
+        return knowledge
+    return await coalescer.run('knowledge_base', service.get_knowledge_base)
+
+
+async def diagnose(scope, receive):
+    """Endpoint de diagnostic (mêmes entrées et sorties que la version Flask)"""
+    knowledge = await get_knowledge_base()
+    if knowledge is None:
+        return 503, {"error": "Système non initialisé"}
+
+    request_data = await read_json(receive)
+    timer = StageTimer(service.stage_seconds)
+    if request_data is not None and not isinstance(request_data, dict):
+        return 400, {"error": "Symptoms are required"}
+    error = service.validate_symptoms(request_data)
+    if error:
+        return 400, {"error": error}
+    symptoms = request_data['symptoms']
+
+    backend, weighting, error = service.scoring_options(request_data)
+    if error:
+        return 400, {"error": error}
+    age, error = service.patient_age(request_data)
+    if error:
+        return 400, {"error": error}
+    timer.engine = backend
+    timer.lap('validate')
+
+    # Noms canoniques : les variantes d'orthographe partagent l'entrée de cache
+    canonical = service.symptom_normalizer.normalize_list(symptoms)
+    timer.lap('normalize')
+    key = DiagnosisCache.make_key(canonical, service.cache_variant(backend, weighting))
+    generation = knowledge.generation
+    diagnosis = service.diagnosis_cache.get(key, generation)
+    timer.lap('cache')
+    if diagnosis is None:
+        def compute():
+            epoch = service.diagnosis_cache.epoch
+            results = service.calculate_diagnosis(canonical, knowledge, backend, weighting)
+            service.diagnosis_cache.put(key, results, generation, epoch)
+            return results
+
+        # Calcul et classement chronométrés par calculate_diagnosis (attente dans le pool comprise ici)
+        diagnosis = await coalescer.run(None if key is None else (key, generation), compute)
+        timer.lap('queue')
+
+    diagnoses = service.with_recommendations(diagnosis, knowledge, age)
+    timer.lap('recommend')
+    body = json.dumps({
+        "symptoms": symptoms,
+        "engine": backend,
+        "weighting": weighting,
+        "diagnoses": diagnoses,
+        "timestamp": datetime.now().isoformat()
+    }, sort_keys=True).encode('utf-8')
+    timer.lap('serialize')
+    return 200, body, {"Content-Type": "application/json"}
+
+
+async def symptoms(scope, receive):
+    """Liste des symptômes possibles, pré-encodée (ETag, 304 et variantes compressées)"""
+    knowledge = await get_knowledge_base()
+    if knowledge is None:
+        return 503, {"error": "Système non initialisé"}
+    headers = dict(scope['headers'])
+    status, body, response_headers = service.symptoms_variant(
+        knowledge,
+        headers.get(b'if-none-match', b'').decode('latin-1'),
+        headers.get(b'accept-encoding', b'').decode('latin-1'),
+    )
+    return status, body, response_headers
+
+
+async def suggest_symptoms(scope, receive):
+    """Complétion des symptômes par préfixe (?q=, ?limit=), calculée sur la boucle : moins d'une milliseconde"""
+    knowledge = await get_knowledge_base()
+    if knowledge is None:
+        return 503, {"error": "Système non initialisé"}
+    params = parse_qs(scope.get('query_string', b'').decode('utf-8', 'replace'))
+    try:
+        limit = int(params.get('limit', [service.SUGGEST_LIMIT])[0])
+    except ValueError:
+        limit = None
+    if limit is None or not 1 <= limit <= service.MAX_SUGGEST_LIMIT:
+        return 400, {"error": f"limit must be an integer between 1 and {service.MAX_SUGGEST_LIMIT}"}
+    return 200, service.symptom_suggestions(knowledge, params.get('q', [''])[0], limit)
+
+
+async def health(scope, receive):
+    """Endpoint de santé, avec l'état du regroupement des requêtes"""
+    status, code = await asyncio.get_running_loop().run_in_executor(executor, service.health_status)
+    if code == 200:
+        status["coalescing"] = coalescer.stats()
+    return code, status
+
+
+async def health_live(scope, receive):
+    """Sonde de vivacité (aucune entrée/sortie)"""
+    return 200, {"status": "alive", "worker_pid": os.getpid(), "timestamp": datetime.now().isoformat()}
+
+
+async def metrics(scope, receive):
+    """Métriques au format texte de Prometheus"""
+    return 200, service.metrics_registry.render().encode('utf-8'), {"Content-Type": CONTENT_TYPE}
+
+
+async def health_ready(scope, receive):
+    """Sonde de disponibilité : instantané mis en cache, sans attente"""
+    snapshot = service.health_monitor.snapshot()
+    return 200 if snapshot["ready"] else 503, snapshot
+
+
+# Chemin -> (méthode, gestionnaire)
+ROUTES = {
+    '/api/diagnose': ('POST', diagnose),
+    '/api/symptoms': ('GET', symptoms),
+    '/api/symptoms/suggest': ('GET', suggest_symptoms),
+    '/health': ('GET', health),
+    '/health/live': ('GET', health_live),
+    '/health/ready': ('GET', health_ready),
+    '/metrics': ('GET', metrics),
+}
+
+
+async def send_response(send, status, body, headers):
+    """Envoie un corps déjà encodé ; `headers` : dictionnaire nom -> valeur"""
+    await send({
+        'type': 'http.response.start',
+        'status': status,
+        'headers': [
+            (b'content-length', str(len(body)).encode()),
+            # Même politique CORS que flask_cors avec ses options par défaut
+            (b'access-control-allow-origin', b'*'),
+            *((name.lower().encode('latin-1'), value.encode('latin-1')) for name, value in headers.items()),
+        ],
+    })
+    await send({'type': 'http.response.body', 'body': body})
+
+
+async def send_json(send, status, payload, headers=None):
+    body = json.dumps(payload, sort_keys=True).encode('utf-8')
+    await send_response(send, status, body, {"Content-Type": "application/json", **(headers or {})})
+
+
+async def lifespan(receive, send):
+    while True:
+        message = await receive()
+        if message['type'] == 'lifespan.startup':
+            # Chargement lancé sans attendre : le serveur accepte déjà les requêtes
+            asyncio.get_running_loop().create_task(get_knowledge_base())
+            await send({'type': 'lifespan.startup.complete'})
+        elif message['type'] == 'lifespan.shutdown':
+            executor.shutdown(wait=False)
+            await send({'type': 'lifespan.shutdown.complete'})
+            return
+
+
+async def app(scope, receive, send):
+    """Application ASGI"""
+    if scope['type'] == 'lifespan':
+        await lifespan(receive, send)
+        return
+    if scope['type'] != 'http':
+        return
+
+    route = ROUTES.get(scope['path'])
+    if route is None:
+        await send_json(send, 404, {"error": "Not found"})
+        return
+    method, handler = route
+    if scope['method'] == 'OPTIONS':
+        # Requête CORS préalable
+        await send_json(send, 200, {}, {
+            "Access-Control-Allow-Methods": method,
+            "Access-Control-Allow-Headers": "content-type",
+        })
+        return
+    if scope['method'] != method:
+        await send_json(send, 405, {"error": "Method not allowed"}, {"Allow": method})
+        return
+
+    started = time.perf_counter()
+    try:
+        # (statut, objet JSON) ou (statut, corps encodé, en-têtes)
+        response = await handler(scope, receive)
+    except HTTPError as e:
+        response = e.status, {"error": str(e)}
+    except Exception as e:
+        logger.error(f"Erreur lors du traitement de {scope['path']}: {str(e)}")
+        response = 500, {"error": str(e)}
+    if len(response) == 3:
+        await send_response(send, *response)
+    else:
+        await send_json(send, *response)
+    service.request_seconds.observe(time.perf_counter() - started, scope['path'])
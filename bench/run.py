@@ -0,0 +1,325 @@
+"""Banc d'essai du chemin de diagnostic : chargement, latence et débit par moteur et par taille de base
+
+    python -m bench.run --sizes 10000,100000 --output bench/results/latest.json
+    python -m bench.run --sizes 10000,100000 --save-baseline      # référence bench/baseline.json
+    python -m bench.run --sizes 10000,100000                      # comparaison à la référence
+
+Chaque taille est mesurée dans un processus neuf (pic de mémoire propre à
+la taille). Les bases SQLite sont générées une fois par (taille, graine)
+avec data_generator puis réutilisées. Le code de sortie vaut 1 si une
+mesure régresse de plus de --tolerance par rapport à la référence.
+"""
+import argparse
+import json
+import logging
+import os
+import platform
+import random
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from multiprocessing import get_context
+
+import numpy as np
+
+import data_generator
+
+# Tailles de base de référence ; 10M (génération de plusieurs dizaines de minutes) sur demande
+SIZES = (10_000, 100_000, 1_000_000, 10_000_000)
+DEFAULT_SIZES = SIZES[:3]
+BACKENDS = ('bitset', 'index', 'rules', 'scan')
+WEIGHTINGS = ('uniform', 'recency')
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+DATA_DIR = os.path.join(BENCH_DIR, 'data')
+BASELINE_PATH = os.path.join(BENCH_DIR, 'baseline.json')
+OUTPUT_PATH = os.path.join(BENCH_DIR, 'results', 'latest.json')
+
+# Composition des requêtes : symptômes complets d'un patient, sous-ensemble
+# de 1 à 2 symptômes, ou variantes d'écriture avec un symptôme inconnu
+QUERY_MIX = {'full': 0.7, 'partial': 0.2, 'variant': 0.1}
+
+# Mesures comparées à la référence : nom -> True si une valeur plus grande est meilleure
+METRICS = {
+    'load_seconds': False,
+    'knowledge_base_seconds': False,
+    'peak_rss_mb': False,
+    'p50_ms': False,
+    'p99_ms': False,
+    'throughput_qps': True,
+}
+
+logger = logging.getLogger('bench')
+
+
+def database_path(size, seed, data_dir=DATA_DIR):
+    """Base SQLite générée pour (taille, graine), créée au premier usage"""
+    path = os.path.join(data_dir, f'cases_{size}_{seed}.db')
+    if not os.path.exists(path):
+        logger.info(f"Génération de {size} patients (graine {seed}): {path}")
+        temp_path = f'{path}.{os.getpid()}.tmp'
+        data_generator.create_sqlite_database(size, temp_path, seed)
+        os.replace(temp_path, path)
+        for suffix in ('-wal', '-shm'):
+            if os.path.exists(temp_path + suffix):
+                os.remove(temp_path + suffix)
+    return path
+
+
+def variant(symptom):
+    """Écriture alternative d'un symptôme (casse, séparateurs) que la normalisation doit absorber"""
+    return symptom.replace('_', ' ').capitalize()
+
+
+def generate_queries(n_queries, seed):
+    """Listes de symptômes reproductibles tirées des patients de data_generator"""
+    rng = random.Random(seed)
+    queries = []
+    for patient in data_generator.generate_patients(n_queries, seed):
+        symptoms = patient['symptoms']
+        kind = rng.choices(list(QUERY_MIX), weights=list(QUERY_MIX.values()))[0]
+        if kind == 'partial':
+            symptoms = rng.sample(symptoms, min(len(symptoms), rng.randint(1, 2)))
+        elif kind == 'variant':
+            symptoms = [variant(s) for s in symptoms] + ['symptome_inconnu']
+        queries.append(symptoms)
+    return queries
+
+
+def latency_stats(durations):
+    """Percentiles et débit d'une série de durées (secondes)"""
+    durations = np.array(durations)
+    total = durations.sum()
+    return {
+        'queries': len(durations),
+        'p50_ms': round(float(np.percentile(durations, 50)) * 1000, 3),
+        'p99_ms': round(float(np.percentile(durations, 99)) * 1000, 3),
+        'mean_ms': round(float(durations.mean()) * 1000, 3),
+        'throughput_qps': round(len(durations) / total, 1) if total > 0 else None,
+    }
+
+
+def time_queries(run, queries, max_seconds):
+    """Durées de run(requête), en s'arrêtant après `max_seconds` (au moins 20 requêtes)"""
+    durations = []
+    started = time.perf_counter()
+    for query in queries:
+        query_started = time.perf_counter()
+        run(query)
+        durations.append(time.perf_counter() - query_started)
+        if len(durations) >= 20 and time.perf_counter() - started > max_seconds:
+            break
+    return durations
+
+
+def measure_size(size, db_path, options):
+    """Mesures d'une taille de base, exécutées dans un processus dédié"""
+    import app as service
+    from case_loader import peak_rss_mb
+    from knowledge_base import KnowledgeBase
+
+    # Un journal par diagnostic fausserait les mesures
+    logging.getLogger('app').setLevel(logging.WARNING)
+    # Sources du banc d'essai, sans fichier JSON ni instantané
+    service.DB_PATH = db_path
+    service.JSON_PATH = db_path + '.json'
+    service.SOURCE_PATHS = []
+    service.SOURCE_DATABASES = [db_path]
+    service.SNAPSHOT_PATH = ''
+
+    started = time.perf_counter()
+    case_base = service.load_data()
+    load_seconds = time.perf_counter() - started
+    if case_base is None:
+        raise RuntimeError(f"Échec du chargement de {db_path}")
+
+    started = time.perf_counter()
+    knowledge = KnowledgeBase(
+        case_base, 1, service.RULE_OPTIONS, service.RECENCY_HALF_LIFE_DAYS,
+        service.SIMILARITY_OPTIONS, options['shards'],
+    )
+    knowledge_base_seconds = time.perf_counter() - started
+    peak_rss = peak_rss_mb()
+
+    result = {
+        'size': size,
+        'cases': len(case_base),
+        'profiles': case_base.n_profiles,
+        'symptoms': len(case_base.symptoms),
+        'load_seconds': round(load_seconds, 3),
+        'knowledge_base_seconds': round(knowledge_base_seconds, 3),
+        'peak_rss_mb': round(peak_rss, 1) if peak_rss is not None else None,
+        'backends': {},
+    }
+
+    # Requêtes tirées avec une autre graine que la base, normalisées comme par /api/diagnose
+    raw_queries = generate_queries(options['queries'], options['seed'] + 1000)
+    queries = [service.symptom_normalizer.normalize_list(query) for query in raw_queries]
+    backends = list(options['backends'])
+    if options['shards'] and 'sharded' not in backends:
+        backends.append('sharded')
+    for backend in backends:
+        for weighting in options['weightings']:
+            if backend == 'rules' and weighting == 'recency':
+                continue
+            # Diagnostic sans cache : coût du calcul seul
+            durations = time_queries(
+                lambda query: service.calculate_diagnosis(query, knowledge, backend, weighting),
+                queries, options['max_seconds'],
+            )
+            result['backends'][f'{backend}/{weighting}'] = latency_stats(durations)
+
+    if options['http']:
+        # Requêtes HTTP complètes (validation, cache, sérialisation) via le client de test Flask
+        service.reloader.current = knowledge
+        client = service.app.test_client()
+        durations = time_queries(
+            lambda query: client.post('/api/diagnose', json={'symptoms': query}),
+            raw_queries, options['max_seconds'],
+        )
+        result['http'] = {'/api/diagnose': latency_stats(durations)}
+
+    return result
+
+
+def flatten(result):
+    """Mesures comparables d'une taille : (clé, mesure) -> valeur"""
+    values = {}
+    for metric in ('load_seconds', 'knowledge_base_seconds', 'peak_rss_mb'):
+        values[('load', metric)] = result.get(metric)
+    for group in ('backends', 'http'):
+        for name, stats in result.get(group, {}).items():
+            for metric in ('p50_ms', 'p99_ms', 'throughput_qps'):
+                values[(name, metric)] = stats.get(metric)
+    return values
+
+
+def compare(report, baseline, tolerance):
+    """Régressions de plus de `tolerance` (fraction) par rapport à la référence"""
+    baseline_results = {result['size']: result for result in baseline.get('results', [])}
+    regressions = []
+    for result in report['results']:
+        reference = baseline_results.get(result['size'])
+        if reference is None:
+            continue
+        reference_values = flatten(reference)
+        for key, value in flatten(result).items():
+            old = reference_values.get(key)
+            if value is None or not old:
+                continue
+            name, metric = key
+            change = (value - old) / old
+            if METRICS[metric]:
+                change = -change
+            if change > tolerance:
+                regressions.append({
+                    'size': result['size'],
+                    'name': name,
+                    'metric': metric,
+                    'baseline': old,
+                    'value': value,
+                    'change': round(change, 3),
+                })
+    return regressions
+
+
+def print_report(report):
+    for result in report['results']:
+        print(
+            f"\n{result['size']} patients ({result['cases']} cas, {result['profiles']} profils) : "
+            f"chargement {result['load_seconds']} s, base de connaissances "
+            f"{result['knowledge_base_seconds']} s, RSS max {result['peak_rss_mb']} Mo"
+        )
+        rows = list(result['backends'].items()) + list(result.get('http', {}).items())
+        for name, stats in rows:
+            print(
+                f"  {name:<22} p50 {stats['p50_ms']:>9.3f} ms  p99 {stats['p99_ms']:>9.3f} ms  "
+                f"{stats['throughput_qps']:>9} req/s  ({stats['queries']} requêtes)"
+            )
+    for regression in report.get('regressions', []):
+        print(
+            f"RÉGRESSION {regression['size']} {regression['name']} {regression['metric']}: "
+            f"{regression['baseline']} -> {regression['value']} ({regression['change']:+.0%})"
+        )
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Banc d'essai du diagnostic")
+    parser.add_argument('--sizes', default=','.join(map(str, DEFAULT_SIZES)),
+                        help="tailles de base (patients), séparées par des virgules")
+    parser.add_argument('--backends', default=','.join(BACKENDS))
+    parser.add_argument('--weightings', default='uniform',
+                        help=f"pondérations mesurées parmi {', '.join(WEIGHTINGS)}")
+    parser.add_argument('--shards', type=int, default=0,
+                        help="mesure aussi le moteur 'sharded' avec N processus")
+    parser.add_argument('--queries', type=int, default=2000,
+                        help="nombre de requêtes par moteur")
+    parser.add_argument('--max-seconds', type=float, default=20.0,
+                        help="durée maximale des requêtes d'un moteur")
+    parser.add_argument('--http', action='store_true',
+                        help="mesure aussi POST /api/diagnose (client de test Flask)")
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--data-dir', default=DATA_DIR)
+    parser.add_argument('--output', default=OUTPUT_PATH)
+    parser.add_argument('--baseline', default=BASELINE_PATH)
+    parser.add_argument('--save-baseline', action='store_true',
+                        help="enregistre le résultat comme nouvelle référence")
+    parser.add_argument('--tolerance', type=float, default=0.25,
+                        help="dégradation tolérée par rapport à la référence (fraction)")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    logging.basicConfig(level=logging.INFO)
+    os.makedirs(args.data_dir, exist_ok=True)
+
+    options = {
+        'backends': [b for b in args.backends.split(',') if b],
+        'weightings': [w for w in args.weightings.split(',') if w],
+        'shards': args.shards,
+        'queries': args.queries,
+        'max_seconds': args.max_seconds,
+        'http': args.http,
+        'seed': args.seed,
+    }
+    sizes = [int(size) for size in args.sizes.split(',') if size]
+    report = {
+        'created_at': datetime.now().isoformat(),
+        'environment': {
+            'python': platform.python_version(),
+            'numpy': np.__version__,
+            'platform': platform.platform(),
+            'cpu_count': os.cpu_count(),
+        },
+        'options': options,
+        'results': [],
+    }
+
+    for size in sizes:
+        db_path = database_path(size, args.seed, args.data_dir)
+        # Processus neuf par taille : le pic de mémoire et les caches ne débordent pas d'une taille à l'autre
+        with ProcessPoolExecutor(max_workers=1, mp_context=get_context('spawn')) as pool:
+            result = pool.submit(measure_size, size, db_path, options).result()
+        report['results'].append(result)
+        logger.info(f"Taille {size} mesurée")
+
+    if os.path.exists(args.baseline) and not args.save_baseline:
+        with open(args.baseline, encoding='utf-8') as f:
+            report['baseline'] = args.baseline
+            report['regressions'] = compare(report, json.load(f), args.tolerance)
+
+    os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+    with open(args.output, 'w', encoding='utf-8') as f:
+        json.dump(report, f, indent=2, ensure_ascii=False)
+    if args.save_baseline:
+        with open(args.baseline, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2, ensure_ascii=False)
+
+    print_report(report)
+    return 1 if report.get('regressions') else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
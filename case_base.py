@@ -0,0 +1,333 @@
+import logging
+import threading
+from array import array
+from datetime import date
+
+import numpy as np
+
+from medications import MedicationIndex
+
+logger = logging.getLogger(__name__)
+
+WORD_BITS = 64
+
+# Table de comptage des bits d'un octet, utilisée si numpy n'a pas bitwise_count
+_BYTE_POPCOUNT = np.array([bin(i).count('1') for i in range(256)], dtype=np.uint8)
+
+
+def consultation_day(value):
+    """Numéro de jour (date.toordinal) d'une date de consultation 'AAAA-MM-JJ', 0 si absente ou invalide"""
+    if not isinstance(value, str):
+        return 0
+    try:
+        return date.fromisoformat(value[:10]).toordinal()
+    except ValueError:
+        return 0
+
+
+def popcount(words):
+    """Nombre de bits à 1 de chaque mot d'un tableau uint64"""
+    if hasattr(np, 'bitwise_count'):
+        return np.bitwise_count(words)
+    as_bytes = np.ascontiguousarray(words).view(np.uint8).reshape(words.shape + (8,))
+    return _BYTE_POPCOUNT[as_bytes].sum(axis=-1, dtype=np.uint8)
+
+
+class CaseBase:
+    """Représentation compacte des cas : vocabulaire de symptômes, codes de diagnostic et profils
+
+    Le coefficient de Jaccard d'un cas ne dépend que de son ensemble de
+    symptômes et de son diagnostic. Les cas identiques sont donc regroupés
+    en profils (ensemble de symptômes, diagnostic) -> effectif, et les
+    moteurs de diagnostic parcourent les profils pondérés par leur effectif.
+    """
+
+    def __init__(self, symptoms, diagnostics, profile_diagnostics, profile_counts,
+                 indptr, indices, case_profiles, bits=None, case_days=None):
+        # Vocabulaire : identifiant de symptôme -> nom, et l'inverse
+        self.symptoms = symptoms
+        self.symptom_ids = {name: i for i, name in enumerate(symptoms)}
+        # Codes de diagnostic : identifiant -> nom, et l'inverse
+        self.diagnostics = diagnostics
+        self.diagnostic_ids = {name: i for i, name in enumerate(diagnostics)}
+        # Profils, numérotés dans l'ordre de leur premier cas
+        self.profile_diagnostics = profile_diagnostics
+        self.profile_counts = profile_counts
+        # Symptômes distincts de chaque profil au format CSR (indptr, indices)
+        self.indptr = indptr
+        self.indices = indices
+        self.profile_sizes = np.diff(indptr).astype(np.int16)
+        self.bits = self._pack_bits() if bits is None else bits
+        # Profil de chaque cas (-1 pour un cas retiré)
+        self.case_profiles = case_profiles
+        self.n_retired = 0
+        # Jour de consultation de chaque cas (date.toordinal, 0 si inconnu)
+        if case_days is None:
+            case_days = np.zeros(len(case_profiles), dtype=np.int32)
+        self.case_days = case_days
+        # Statistiques du chargement (renseignées par load_data)
+        self.load_stats = None
+        # Prescriptions par diagnostic et tranche d'âge (renseignées par load_data)
+        self.medications = MedicationIndex()
+        # Ajouts incrémentaux : index des profils (construit au premier ajout) et
+        # tampons à capacité doublée dont les attributs ci-dessus sont des vues
+        self.lock = threading.Lock()
+        self._profile_index = None
+        self._buffers = {}
+
+    @classmethod
+    def from_records(cls, records):
+        """Construit la base compacte à partir de (diagnostic, liste de symptômes[, date de consultation])"""
+        builder = CaseBaseBuilder()
+        for record in records:
+            builder.add(*record)
+        return builder.build()
+
+    def __len__(self):
+        return len(self.case_profiles) - self.n_retired
+
+    @property
+    def n_profiles(self):
+        return len(self.profile_counts)
+
+    @property
+    def n_words(self):
+        return self.bits.shape[0]
+
+    @property
+    def nbytes(self):
+        return (
+            self.bits.nbytes + self.profile_sizes.nbytes + self.profile_diagnostics.nbytes
+            + self.profile_counts.nbytes + self.indptr.nbytes + self.indices.nbytes
+            + self.case_profiles.nbytes + self.case_days.nbytes
+        )
+
+    def _pack_bits(self):
+        """Empaquette les symptômes de chaque profil dans une matrice (mots, profils) de uint64"""
+        # Un mot par ligne : chaque ligne est contiguë pour les opérations vectorisées
+        n_words = max(1, -(-len(self.symptoms) // WORD_BITS))
+        bits = np.zeros((n_words, self.n_profiles), dtype=np.uint64)
+        rows = np.repeat(np.arange(self.n_profiles), np.diff(self.indptr))
+        words = self.indices // WORD_BITS
+        masks = np.left_shift(np.uint64(1), (self.indices % WORD_BITS).astype(np.uint64))
+        np.bitwise_or.at(bits, (words, rows), masks)
+        return bits
+
+    def add_case(self, diagnosis, symptoms, consulted=None):
+        """Ajoute un cas en O(nombre de symptômes) ; retourne (profil, nouveau profil ?)
+
+        Les lecteurs concurrents ne sont pas bloqués : les tableaux d'un
+        nouveau profil sont complétés avant sa colonne de bits, qui le rend
+        visible aux moteurs.
+        """
+        with self.lock:
+            diagnostic_id = self._diagnostic_id(diagnosis)
+            case_symptoms = ()
+            if isinstance(symptoms, list):
+                case_symptoms = tuple(sorted({self._symptom_id(s) for s in symptoms}))
+
+            key = (case_symptoms, diagnostic_id)
+            profile_index = self._get_profile_index()
+            profile_id = profile_index.get(key)
+            is_new = profile_id is None
+            if is_new:
+                profile_id = self._add_profile(case_symptoms, diagnostic_id)
+                profile_index[key] = profile_id
+            else:
+                self._writable('profile_counts')[profile_id] += 1
+            # Le jour est ajouté avant le profil : case_days couvre toujours case_profiles
+            self._append('case_days', [consultation_day(consulted)])
+            self._append('case_profiles', [profile_id])
+            return profile_id, is_new
+
+    def remove_case(self, diagnosis, symptoms, consulted=None):
+        """Retire un cas identique à (diagnostic, symptômes) ; retourne son profil ou None
+
+        L'effectif du profil diminue et le dernier cas de ce profil (de même
+        date de consultation si possible) est marqué retiré ; un profil vide
+        reste en place avec un effectif nul.
+        """
+        with self.lock:
+            diagnostic_id = self.diagnostic_ids.get(diagnosis)
+            symptom_ids = self.symptom_ids
+            if diagnostic_id is None or not all(s in symptom_ids for s in symptoms):
+                return None
+            key = (tuple(sorted({symptom_ids[s] for s in symptoms})), diagnostic_id)
+            profile_id = self._get_profile_index().get(key)
+            if profile_id is None or self.profile_counts[profile_id] == 0:
+                return None
+            self._writable('profile_counts')[profile_id] -= 1
+            case_profiles = self._writable('case_profiles')
+            cases = np.flatnonzero(case_profiles == profile_id)
+            same_day = cases[self.case_days[cases] == consultation_day(consulted)]
+            case_profiles[(same_day if len(same_day) else cases)[-1]] = -1
+            self.n_retired += 1
+            return profile_id
+
+    def _diagnostic_id(self, diagnosis):
+        diagnostic_id = self.diagnostic_ids.get(diagnosis)
+        if diagnostic_id is None:
+            diagnostic_id = len(self.diagnostics)
+            self.diagnostics.append(diagnosis)
+            self.diagnostic_ids[diagnosis] = diagnostic_id
+        return diagnostic_id
+
+    def _symptom_id(self, name):
+        symptom_id = self.symptom_ids.get(name)
+        if symptom_id is None:
+            symptom_id = len(self.symptoms)
+            # La matrice de bits gagne un mot avant que le symptôme soit visible
+            if symptom_id >= self.n_words * WORD_BITS:
+                self._grow_bits(self.n_words + 1, self.n_profiles)
+            self.symptoms.append(name)
+            self.symptom_ids[name] = symptom_id
+        return symptom_id
+
+    def _get_profile_index(self):
+        if self._profile_index is None:
+            diagnostics = self.profile_diagnostics.tolist()
+            indptr = self.indptr.tolist()
+            indices = self.indices.tolist()
+            self._profile_index = {
+                (tuple(indices[indptr[p]:indptr[p + 1]]), diagnostics[p]): p
+                for p in range(self.n_profiles)
+            }
+        return self._profile_index
+
+    def _add_profile(self, case_symptoms, diagnostic_id):
+        profile_id = self.n_profiles
+        self._append('profile_diagnostics', [diagnostic_id])
+        self._append('profile_sizes', [len(case_symptoms)])
+        self._append('indices', case_symptoms)
+        self._append('indptr', [len(self.indices)])
+        self._append('profile_counts', [1])
+
+        column = np.zeros(self.n_words, dtype=np.uint64)
+        for symptom_id in case_symptoms:
+            column[symptom_id // WORD_BITS] |= np.uint64(1) << np.uint64(symptom_id % WORD_BITS)
+        self._grow_bits(self.n_words, profile_id + 1)
+        buffer = self._buffers['bits']
+        buffer[:, profile_id] = column
+        self.bits = buffer[:, :profile_id + 1]
+        return profile_id
+
+    def _writable(self, name):
+        """Tableau modifiable (copie des tableaux en lecture seule d'un instantané projeté)"""
+        array = getattr(self, name)
+        if not array.flags.writeable:
+            self._append(name, [])
+            array = getattr(self, name)
+        return array
+
+    def _append(self, name, values):
+        """Ajoute des valeurs à un tableau 1D en doublant la capacité de son tampon si besoin"""
+        current = getattr(self, name)
+        size = len(current) + len(values)
+        buffer = self._buffers.get(name)
+        if buffer is None or size > len(buffer):
+            buffer = np.empty(max(16, 2 * size), dtype=current.dtype)
+            buffer[:len(current)] = current
+            self._buffers[name] = buffer
+        buffer[len(current):size] = values
+        setattr(self, name, buffer[:size])
+
+    def _grow_bits(self, n_words, n_profiles):
+        """Agrandit le tampon de la matrice de bits ; self.bits n'est remplacé que pour un mot de plus"""
+        buffer = self._buffers.get('bits')
+        if buffer is not None and buffer.shape[0] >= n_words and buffer.shape[1] >= n_profiles:
+            return
+        capacity = n_profiles if buffer is None else max(buffer.shape[1], n_profiles)
+        if buffer is None or buffer.shape[1] < n_profiles:
+            capacity = max(16, 2 * n_profiles)
+        grown = np.zeros((n_words, capacity), dtype=np.uint64)
+        grown[:self.bits.shape[0], :self.bits.shape[1]] = self.bits
+        self._buffers['bits'] = grown
+        if n_words > self.bits.shape[0]:
+            self.bits = grown[:, :self.bits.shape[1]]
+
+    def profile_symptoms(self, profile_id):
+        """Identifiants des symptômes d'un profil"""
+        return self.indices[self.indptr[profile_id]:self.indptr[profile_id + 1]]
+
+    def case_symptoms(self, case_id):
+        """Identifiants des symptômes d'un cas"""
+        return self.profile_symptoms(self.case_profiles[case_id])
+
+    def query_mask(self, symptoms):
+        """Retourne le masque de bits des symptômes connus et le nombre de symptômes distincts"""
+        input_symptoms = set(symptoms)
+        mask = np.zeros(self.n_words, dtype=np.uint64)
+        for symptom in input_symptoms:
+            symptom_id = self.symptom_ids.get(symptom)
+            if symptom_id is not None:
+                mask[symptom_id // WORD_BITS] |= np.uint64(1) << np.uint64(symptom_id % WORD_BITS)
+        # Les symptômes inconnus comptent dans l'union du coefficient de Jaccard
+        return mask, len(input_symptoms)
+
+
+class CaseBaseBuilder:
+    """Construit une CaseBase cas par cas, sans matérialiser de liste intermédiaire"""
+
+    def __init__(self):
+        self.symptom_ids = {}
+        self.diagnostic_ids = {}
+        self.profile_ids = {}
+        self.profile_diagnostics = array('i')
+        self.profile_counts = array('q')
+        self.indptr = array('q', [0])
+        self.indices = array('i')
+        # Un entier machine par cas plutôt qu'une liste Python
+        self.case_profiles = array('i')
+        self.case_days = array('i')
+        # Dates déjà converties : les dates de consultation se répètent beaucoup
+        self.days = {}
+
+    def __len__(self):
+        return len(self.case_profiles)
+
+    def add(self, diagnosis, symptoms, consulted=None):
+        """Ajoute un cas ; les symptômes qui ne sont pas une liste sont ignorés"""
+        diagnostic_id = self.diagnostic_ids.setdefault(diagnosis, len(self.diagnostic_ids))
+        case_symptoms = ()
+        if isinstance(symptoms, list):
+            symptom_ids = self.symptom_ids
+            case_symptoms = tuple(sorted({
+                symptom_ids.setdefault(symptom, len(symptom_ids))
+                for symptom in symptoms
+            }))
+
+        key = (case_symptoms, diagnostic_id)
+        profile_id = self.profile_ids.get(key)
+        if profile_id is None:
+            profile_id = self.profile_ids[key] = len(self.profile_counts)
+            self.profile_diagnostics.append(diagnostic_id)
+            self.profile_counts.append(0)
+            self.indices.extend(case_symptoms)
+            self.indptr.append(len(self.indices))
+        self.profile_counts[profile_id] += 1
+        self.case_profiles.append(profile_id)
+        day = 0
+        if isinstance(consulted, str):
+            day = self.days.get(consulted)
+            if day is None:
+                day = self.days[consulted] = consultation_day(consulted)
+        self.case_days.append(day)
+
+    def build(self):
+        case_base = CaseBase(
+            list(self.symptom_ids),
+            list(self.diagnostic_ids),
+            np.array(self.profile_diagnostics, dtype=np.int32),
+            np.array(self.profile_counts, dtype=np.int64),
+            np.array(self.indptr, dtype=np.int64),
+            np.array(self.indices, dtype=np.int32),
+            np.array(self.case_profiles, dtype=np.int32),
+            case_days=np.array(self.case_days, dtype=np.int32),
+        )
+        case_base._profile_index = self.profile_ids
+        logger.info(
+            f"Base de cas compacte: {len(case_base)} cas, {case_base.n_profiles} profils, "
+            f"{len(case_base.symptoms)} symptômes, "
+            f"{case_base.nbytes / max(len(case_base), 1):.1f} octets/cas"
+        )
+        return case_base
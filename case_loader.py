@@ -0,0 +1,194 @@
+import json
+import logging
+import re
+import time
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+try:
+    import ijson
+except ImportError:
+    ijson = None
+
+from db_schema import table_exists
+
+logger = logging.getLogger(__name__)
+
+# Nombre de lignes lues par appel à fetchmany
+FETCH_SIZE = 10000
+# Taille des blocs lus dans le fichier JSON en l'absence d'ijson
+JSON_READ_SIZE = 1 << 16
+
+
+def peak_rss_mb():
+    """Pic de mémoire résidente du processus en Mo (None si indisponible)"""
+    if resource is None:
+        return None
+    # ru_maxrss est en kilo-octets sous Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def iter_sqlite_cases(conn, fetch_size=FETCH_SIZE):
+    """Parcourt les patients de la base par blocs et produit des triplets (diagnostic, symptômes, date)
+
+    Les lignes sont triées par patient : patient_symptoms étant une table
+    WITHOUT ROWID de clé (patient_id, symptom_id), la jointure se fait dans
+    l'ordre de la clé, sans GROUP BY ni GROUP_CONCAT.
+    """
+    names = dict(conn.execute('SELECT id, name FROM symptom_vocab'))
+    # La date de consultation est absente des bases créées par app.py
+    columns = {row[1] for row in conn.execute('PRAGMA table_info(patients)')}
+    date_column = 'p.date_consultation' if 'date_consultation' in columns else 'NULL'
+    cursor = conn.execute(f'''
+        SELECT p.id, p.diagnostic, {date_column}, ps.symptom_id
+        FROM patients p
+        LEFT JOIN patient_symptoms ps ON ps.patient_id = p.id
+        ORDER BY p.id
+    ''')
+    current_id = None
+    diagnosis = None
+    consulted = None
+    symptoms = []
+    while True:
+        rows = cursor.fetchmany(fetch_size)
+        if not rows:
+            break
+        for patient_id, row_diagnosis, row_consulted, symptom_id in rows:
+            if patient_id != current_id:
+                if current_id is not None:
+                    yield diagnosis, symptoms, consulted
+                current_id = patient_id
+                diagnosis = row_diagnosis
+                consulted = row_consulted
+                symptoms = []
+            if symptom_id is not None:
+                symptoms.append(names[symptom_id])
+    if current_id is not None:
+        yield diagnosis, symptoms, consulted
+
+
+def load_medication_rows(conn):
+    """Effectifs agrégés par SQLite : (diagnostic, âge, patients) et (diagnostic, âge, médicament, patients traités)
+
+    Les prescriptions suivent l'ordre de la table medications (première
+    ligne de chaque groupe). Listes vides si la base n'a pas de table medications.
+    """
+    if not table_exists(conn, 'medications'):
+        return [], []
+    patient_rows = conn.execute(
+        'SELECT diagnostic, age, COUNT(*) FROM patients GROUP BY diagnostic, age'
+    ).fetchall()
+    medication_rows = conn.execute('''
+        SELECT p.diagnostic, p.age, m.medication, COUNT(DISTINCT m.patient_id)
+        FROM medications m
+        JOIN patients p ON p.id = m.patient_id
+        GROUP BY p.diagnostic, p.age, m.medication
+        ORDER BY MIN(m.rowid)
+    ''').fetchall()
+    return patient_rows, medication_rows
+
+
+def iter_json_array(f, key, read_size=JSON_READ_SIZE):
+    """Décode un à un les éléments du tableau `key` d'un objet JSON, sans charger tout le fichier
+
+    Utilisé en l'absence d'ijson : le tableau doit être un champ de l'objet
+    racine, et le nom de champ ne doit pas apparaître plus tôt dans le fichier.
+    """
+    decoder = json.JSONDecoder()
+    start = re.compile(r'"%s"\s*:\s*\[' % re.escape(key))
+    buffer = ''
+    eof = False
+
+    # Recherche du début du tableau
+    while True:
+        match = start.search(buffer)
+        if match:
+            position = match.end()
+            break
+        if eof:
+            return
+        chunk = f.read(read_size)
+        eof = not chunk
+        buffer += chunk
+
+    while True:
+        # Séparateurs entre éléments
+        while position < len(buffer) and buffer[position] in ' \t\r\n,':
+            position += 1
+        if position < len(buffer) and buffer[position] == ']':
+            return
+        try:
+            if position >= len(buffer):
+                raise ValueError("Fin du tampon")
+            item, end = decoder.raw_decode(buffer, position)
+        except ValueError:
+            # Élément incomplet : lecture du bloc suivant
+            if eof:
+                raise ValueError(f"Tableau JSON '{key}' tronqué")
+            chunk = f.read(read_size)
+            eof = not chunk
+            buffer = buffer[position:] + chunk
+            position = 0
+            continue
+        # Un nombre en fin de tampon peut être tronqué : on attend la suite
+        if end == len(buffer) and not eof:
+            chunk = f.read(read_size)
+            eof = not chunk
+            buffer = buffer[position:] + chunk
+            position = 0
+            continue
+        yield item
+        position = end
+
+
+def iter_json_patients(path):
+    """Parcourt les patients du fichier JSON, décodés au fil de l'eau"""
+    if ijson is not None:
+        with open(path, 'rb') as f:
+            yield from ijson.items(f, 'patients.item')
+    else:
+        with open(path, 'r', encoding='utf-8') as f:
+            yield from iter_json_array(f, 'patients')
+
+
+def iter_json_cases(path):
+    """Parcourt les patients du fichier JSON et produit (diagnostic, symptômes, date, âge, médicaments)
+
+    Les médicaments valent None quand les prescriptions du patient ne sont pas connues.
+    """
+    for patient in iter_json_patients(path):
+        medications = patient.get('medications')
+        if not isinstance(medications, list):
+            medications = None
+        yield (
+            patient.get('diagnostic'), patient.get('symptoms'), patient.get('date_consultation'),
+            patient.get('age'), medications,
+        )
+
+
+class LoadReport:
+    """Mesure le débit et le pic de mémoire d'un chargement"""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.rows = {}
+
+    def count(self, source, records):
+        """Compte les enregistrements produits par `records` pour la source donnée"""
+        self.rows.setdefault(source, 0)
+        for record in records:
+            self.rows[source] += 1
+            yield record
+
+    def summary(self):
+        elapsed = time.perf_counter() - self.started
+        total = sum(self.rows.values())
+        return {
+            "rows": dict(self.rows),
+            "seconds": round(elapsed, 3),
+            "rows_per_second": round(total / elapsed) if elapsed > 0 else None,
+            "peak_rss_mb": round(peak_rss_mb(), 1) if resource is not None else None,
+        }
@@ -1,9 +1,13 @@
+import argparse
 import sqlite3
 import json
 import random
 from datetime import datetime, timedelta
+from itertools import islice
 import os
 
+from db_schema import SymptomEncoder, create_symptom_tables, drop_symptom_tables, finalize_schema
+
 # Définition des données médicales
 SYMPTOMS = {
     "respiratoires": [
@@ -24,6 +28,12 @@ SYMPTOMS = {
     ]
 }
 
+DB_PATH = 'data/raw/medical_data.db'
+JSON_PATH = 'data/raw/medical_data.json'
+
+# Nombre de patients insérés par appel à executemany
+CHUNK_SIZE = 50000
+
 SYMPTOMS_FLAT = [item for sublist in SYMPTOMS.values() for item in sublist]
 
 DISEASES = {
@@ -74,7 +84,7 @@ MEDICATIONS = {
     "angine": ["paracetamol", "amoxicilline", "ibuprofene"]
 }
 
-def generate_patient():
+def generate_patient(reference_date=None):
     """Génère des données réalistes pour un patient"""
     age = random.randint(18, 85)
     
@@ -112,7 +122,7 @@ def generate_patient():
     if len(medications) > 2:
         medications = random.sample(medications, random.randint(1, min(3, len(medications))))
     
-    date = datetime.now() - timedelta(days=random.randint(0, 365))
+    date = (reference_date or datetime.now()) - timedelta(days=random.randint(0, 365))
     
     return {
         "age": age,
@@ -122,16 +132,50 @@ def generate_patient():
         "date_consultation": date.strftime("%Y-%m-%d")
     }
 
-def create_sqlite_database(num_patients=1500):
-    """Crée la base de données SQLite avec des patients structurés"""
+def generate_patients(num_patients, seed=None, reference_date=None):
+    """Générateur de patients, reproductible si une graine est fournie"""
+    if seed is not None:
+        random.seed(seed)
+        # Date de référence fixe pour que les dates de consultation soient reproductibles
+        reference_date = reference_date or datetime(2025, 1, 1)
+    for _ in range(num_patients):
+        yield generate_patient(reference_date)
+
+def chunked(iterable, size=CHUNK_SIZE):
+    """Découpe un itérable en listes de taille `size`"""
+    iterator = iter(iterable)
+    while True:
+        chunk = list(islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
+
+def create_sqlite_database(num_patients=1500, db_path=DB_PATH, seed=None, chunk_size=CHUNK_SIZE):
+    """Crée la base de données SQLite avec des patients structurés
+
+    Les insertions sont faites par lots (executemany) dans une seule
+    transaction, avec synchronous=OFF pendant la construction, et les index
+    ne sont créés qu'après le chargement. Les tables d'une base existante
+    sont remplacées.
+
+    La base est laissée en journal WAL (mode persistant, enregistré dans le
+    fichier) : les workers de l'application la lisent pendant que les
+    ingestions y écrivent.
+    """
     try:
-        os.makedirs('data/raw', exist_ok=True)
-        conn = sqlite3.connect('data/raw/medical_data.db')
+        os.makedirs(os.path.dirname(db_path), exist_ok=True)
+        conn = sqlite3.connect(db_path)
         c = conn.cursor()
         
+        # Journal WAL conservé ; réglages pour un chargement en masse
+        c.execute('PRAGMA journal_mode=WAL')
+        c.execute('PRAGMA synchronous=OFF')
+        c.execute('PRAGMA temp_store=MEMORY')
+        c.execute('PRAGMA cache_size=-200000')
+        
         # Suppression des tables existantes pour un redémarrage propre
         c.execute('DROP TABLE IF EXISTS medications')
-        c.execute('DROP TABLE IF EXISTS symptoms')
+        drop_symptom_tables(conn)
         c.execute('DROP TABLE IF EXISTS patients')
         
         # Création des tables
@@ -141,12 +185,91 @@ def create_sqlite_database(num_patients=1500):
                       diagnostic TEXT NOT NULL,
                       date_consultation TEXT NOT NULL)''')
         
-        c.execute('''CREATE TABLE symptoms
-                     (patient_id INTEGER NOT NULL,
-                      symptom TEXT NOT NULL,
-                      FOREIGN KEY(patient_id) REFERENCES patients(id))''')
+        create_symptom_tables(conn)
         
         c.execute('''CREATE TABLE medications
                      (patient_id INTEGER NOT NULL,
                       medication TEXT NOT NULL,
-                      FOREIGN KEY(patient_id) REFERENCES patients(id))''')
\ No newline at end of file
+                      FOREIGN KEY(patient_id) REFERENCES patients(id))''')
+        
+        # Insertion par lots dans une seule transaction
+        encoder = SymptomEncoder(conn)
+        patient_id = 0
+        c.execute('BEGIN')
+        for chunk in chunked(generate_patients(num_patients, seed), chunk_size):
+            first_id = patient_id + 1
+            patient_id += len(chunk)
+            ids = range(first_id, patient_id + 1)
+            c.executemany(
+                'INSERT INTO patients (id, age, diagnostic, date_consultation) VALUES (?, ?, ?, ?)',
+                ((pid, p["age"], p["diagnostic"], p["date_consultation"]) for pid, p in zip(ids, chunk))
+            )
+            c.executemany(
+                'INSERT OR IGNORE INTO patient_symptoms (patient_id, symptom_id) VALUES (?, ?)',
+                encoder.rows((pid, s) for pid, p in zip(ids, chunk) for s in p["symptoms"])
+            )
+            c.executemany(
+                'INSERT INTO medications (patient_id, medication) VALUES (?, ?)',
+                ((pid, m) for pid, p in zip(ids, chunk) for m in p["medications"])
+            )
+        conn.commit()
+        
+        # Index créés après le chargement, beaucoup plus rapide qu'une mise à jour ligne par ligne
+        finalize_schema(conn)
+        c.execute('CREATE INDEX IF NOT EXISTS idx_medications_patient ON medications(patient_id)')
+        conn.commit()
+        c.execute('PRAGMA synchronous=NORMAL')
+        conn.close()
+        
+        print(f"✅ Base de données SQLite créée avec {patient_id} patients: {db_path}")
+        
+    except Exception as e:
+        print(f"❌ Erreur lors de la création de la base SQLite: {str(e)}")
+        raise
+
+def create_json_data(num_patients=200, json_path=JSON_PATH, seed=None):
+    """Crée le fichier JSON de patients complémentaires
+
+    Les patients sont écrits au fil de la génération, un par ligne.
+    """
+    os.makedirs(os.path.dirname(json_path), exist_ok=True)
+    with open(json_path, 'w', encoding='utf-8') as f:
+        f.write('{"patients": [')
+        for i, patient in enumerate(generate_patients(num_patients, seed)):
+            f.write(',\n' if i else '\n')
+            json.dump(patient, f, ensure_ascii=False)
+        f.write('\n]}\n')
+    print(f"✅ Fichier JSON créé avec {num_patients} patients: {json_path}")
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Génère les données médicales d'exemple")
+    parser.add_argument('--patients', type=int, default=1500,
+                        help="nombre de patients de la base SQLite")
+    parser.add_argument('--json-patients', type=int, default=200,
+                        help="nombre de patients du fichier JSON (0 pour ne pas le créer)")
+    parser.add_argument('--seed', type=int, default=None,
+                        help="graine du générateur aléatoire (données reproductibles)")
+    parser.add_argument('--db-path', default=DB_PATH)
+    parser.add_argument('--json-path', default=JSON_PATH)
+    parser.add_argument('--chunk-size', type=int, default=CHUNK_SIZE)
+    parser.add_argument('--force', action='store_true',
+                        help="remplace la base et le fichier JSON existants")
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    args = parse_args(argv)
+    # Ni la base ni le fichier JSON ne sont écrasés sans --force
+    paths = [args.db_path] + ([args.json_path] if args.json_patients > 0 else [])
+    existing = [path for path in paths if os.path.exists(path)]
+    if existing and not args.force:
+        print(f"❌ Fichiers déjà présents, rien n'est généré (--force pour les remplacer): {', '.join(existing)}")
+        return 1
+    create_sqlite_database(args.patients, args.db_path, args.seed, args.chunk_size)
+    if args.json_patients > 0:
+        # Graine décalée pour que le JSON ne duplique pas les premiers patients de la base
+        json_seed = None if args.seed is None else args.seed + 1
+        create_json_data(args.json_patients, args.json_path, json_seed)
+    return 0
+
+if __name__ == '__main__':
+    raise SystemExit(main())
@@ -0,0 +1,217 @@
+import argparse
+import logging
+import sqlite3
+
+logger = logging.getLogger(__name__)
+
+# Version du schéma stockée dans PRAGMA user_version
+# 0 : table `symptoms` (patient_id, symptom) en texte libre
+# 1 : symptômes codés par un dictionnaire (symptom_vocab, patient_symptoms)
+# 2 : compteur d'écritures des patients (source_changes), tenu par des déclencheurs
+# 3 : journal des patients ajoutés (patient_inserts), pour la synchronisation des workers
+SCHEMA_VERSION = 3
+
+
+def get_schema_version(conn):
+    return conn.execute('PRAGMA user_version').fetchone()[0]
+
+
+def table_exists(conn, name, kind='table'):
+    row = conn.execute(
+        'SELECT 1 FROM sqlite_master WHERE type = ? AND name = ?', (kind, name)
+    ).fetchone()
+    return row is not None
+
+
+def drop_symptom_tables(conn):
+    """Supprime les tables de symptômes, quel que soit le schéma de la base"""
+    # `symptoms` est une table dans l'ancien schéma et une vue dans le nouveau
+    if table_exists(conn, 'symptoms', kind='view'):
+        conn.execute('DROP VIEW symptoms')
+    conn.execute('DROP TABLE IF EXISTS symptoms')
+    conn.execute('DROP TABLE IF EXISTS patient_symptoms')
+    conn.execute('DROP TABLE IF EXISTS symptom_vocab')
+
+
+def create_symptom_tables(conn):
+    """Crée les tables du schéma normalisé (sans l'index secondaire, créé après chargement)"""
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS symptom_vocab (
+            id INTEGER PRIMARY KEY,
+            name TEXT NOT NULL UNIQUE
+        )
+    ''')
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS patient_symptoms (
+            patient_id INTEGER NOT NULL,
+            symptom_id INTEGER NOT NULL REFERENCES symptom_vocab (id),
+            PRIMARY KEY (patient_id, symptom_id)
+        ) WITHOUT ROWID
+    ''')
+
+
+def create_change_tracking(conn):
+    """Crée le compteur d'écritures des patients et les déclencheurs qui l'incrémentent
+
+    Tout ajout, modification ou suppression d'un patient incrémente le
+    compteur, quel que soit le processus qui écrit ; les lectures ne le
+    modifient jamais, contrairement aux fichiers -wal et -shm qu'elles
+    créent et suppriment. Chaque ajout est aussi journalisé dans
+    `patient_inserts` sous la valeur du compteur qu'il a produite. Créés
+    après le chargement en masse, les déclencheurs ne le ralentissent pas.
+    """
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS source_changes (
+            id INTEGER PRIMARY KEY CHECK (id = 0),
+            changes INTEGER NOT NULL
+        )
+    ''')
+    conn.execute('INSERT OR IGNORE INTO source_changes (id, changes) VALUES (0, 0)')
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS patient_inserts (
+            change INTEGER PRIMARY KEY,
+            patient_id NOT NULL
+        )
+    ''')
+    for event in ('UPDATE', 'DELETE'):
+        conn.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS patients_{event.lower()}_changes AFTER {event} ON patients
+            BEGIN
+                UPDATE source_changes SET changes = changes + 1;
+            END
+        ''')
+    # Recréé : celui du schéma 2 ne journalisait pas les ajouts
+    conn.execute('DROP TRIGGER IF EXISTS patients_insert_changes')
+    conn.execute('''
+        CREATE TRIGGER patients_insert_changes AFTER INSERT ON patients
+        BEGIN
+            UPDATE source_changes SET changes = changes + 1;
+            INSERT INTO patient_inserts (change, patient_id)
+            SELECT changes, NEW.id FROM source_changes;
+        END
+    ''')
+
+
+def inserted_patients(conn, since, until):
+    """Identifiants des patients ajoutés entre deux valeurs du compteur d'écritures
+
+    Retourne None si d'autres écritures (modifications, suppressions) ont
+    eu lieu dans l'intervalle.
+    """
+    patient_ids = [patient_id for patient_id, in conn.execute(
+        'SELECT patient_id FROM patient_inserts WHERE change > ? AND change <= ? ORDER BY change',
+        (since, until)
+    )]
+    if len(patient_ids) != until - since:
+        return None
+    return patient_ids
+
+
+def database_version(conn):
+    """[version du schéma SQLite, compteur d'écritures des patients] : inchangés par les lectures"""
+    schema_version = conn.execute('PRAGMA schema_version').fetchone()[0]
+    changes = None
+    if table_exists(conn, 'source_changes'):
+        changes = conn.execute('SELECT changes FROM source_changes').fetchone()[0]
+    return [schema_version, changes]
+
+
+def finalize_schema(conn):
+    """Crée les index, la vue de compatibilité `symptoms` et le compteur d'écritures, puis enregistre la version du schéma"""
+    conn.execute(
+        'CREATE INDEX IF NOT EXISTS idx_patient_symptoms_symptom ON patient_symptoms (symptom_id)'
+    )
+    # Vue en lecture seule pour les requêtes et notebooks écrits pour l'ancien schéma
+    conn.execute('''
+        CREATE VIEW IF NOT EXISTS symptoms AS
+        SELECT ps.patient_id AS patient_id, v.name AS symptom
+        FROM patient_symptoms ps
+        JOIN symptom_vocab v ON v.id = ps.symptom_id
+    ''')
+    create_change_tracking(conn)
+    conn.execute(f'PRAGMA user_version = {SCHEMA_VERSION}')
+
+
+class SymptomEncoder:
+    """Attribue les identifiants de symptom_vocab, en insérant les nouveaux noms à la volée"""
+
+    def __init__(self, conn):
+        self.conn = conn
+        self.ids = {
+            name: symptom_id
+            for symptom_id, name in conn.execute('SELECT id, name FROM symptom_vocab')
+        }
+
+    def encode(self, name):
+        symptom_id = self.ids.get(name)
+        if symptom_id is None:
+            symptom_id = self.conn.execute(
+                'INSERT INTO symptom_vocab (name) VALUES (?)', (name,)
+            ).lastrowid
+            self.ids[name] = symptom_id
+        return symptom_id
+
+    def rows(self, patient_symptoms):
+        """Convertit des couples (patient_id, nom de symptôme) en lignes de patient_symptoms"""
+        for patient_id, name in patient_symptoms:
+            yield patient_id, self.encode(name)
+
+
+def migrate_database(db_path):
+    """Migre une base à un ancien schéma vers le schéma courant (sans effet si déjà migrée)
+
+    Retourne True si une migration a été effectuée.
+    """
+    conn = sqlite3.connect(db_path, timeout=30, isolation_level=None)
+    try:
+        if get_schema_version(conn) >= SCHEMA_VERSION:
+            return False
+
+        # Verrou d'écriture : un seul processus migre, les autres revérifient la version
+        conn.execute('BEGIN IMMEDIATE')
+        if get_schema_version(conn) >= SCHEMA_VERSION:
+            conn.execute('ROLLBACK')
+            return False
+
+        logger.info(f"Migration de {db_path} vers le schéma version {SCHEMA_VERSION}...")
+        create_symptom_tables(conn)
+        if table_exists(conn, 'symptoms'):
+            conn.execute('''
+                INSERT OR IGNORE INTO symptom_vocab (name)
+                SELECT DISTINCT symptom FROM symptoms WHERE symptom IS NOT NULL ORDER BY symptom
+            ''')
+            conn.execute('''
+                INSERT OR IGNORE INTO patient_symptoms (patient_id, symptom_id)
+                SELECT s.patient_id, v.id
+                FROM symptoms s
+                JOIN symptom_vocab v ON v.name = s.symptom
+            ''')
+            conn.execute('DROP TABLE symptoms')
+        finalize_schema(conn)
+        conn.execute('COMMIT')
+
+        counts = conn.execute(
+            'SELECT (SELECT COUNT(*) FROM symptom_vocab), (SELECT COUNT(*) FROM patient_symptoms)'
+        ).fetchone()
+        logger.info(f"Migration terminée: {counts[0]} symptômes, {counts[1]} associations")
+        return True
+    except Exception:
+        if conn.in_transaction:
+            conn.execute('ROLLBACK')
+        raise
+    finally:
+        conn.close()
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser(description="Migre medical_data.db vers le schéma normalisé")
+    parser.add_argument('db_path', nargs='?', default='data/raw/medical_data.db')
+    parser.add_argument('--vacuum', action='store_true',
+                        help="compacte le fichier après migration")
+    args = parser.parse_args()
+
+    if migrate_database(args.db_path) and args.vacuum:
+        conn = sqlite3.connect(args.db_path)
+        conn.execute('VACUUM')
+        conn.close()
@@ -0,0 +1,237 @@
+import logging
+
+import numpy as np
+
+from case_base import popcount
+
+logger = logging.getLogger(__name__)
+
+# Nombre de diagnostics retournés et seuil minimal de similarité moyenne
+TOP_K = 3
+MIN_SCORE = 0.1
+# Chiffres conservés avant l'arrondi des probabilités à deux décimales
+PROBABILITY_DIGITS = 9
+
+# Nombre maximal de cellules (requêtes x profils) de la matrice d'intersections d'un bloc
+BATCH_CELLS = 1 << 22
+
+# Nombre de profils ajoutés à un symptôme avant fusion dans sa liste principale
+PENDING_MERGE_SIZE = 256
+
+
+def probability(score):
+    """Score moyen en pourcentage à deux décimales, insensible à l'ordre des additions"""
+    # Arrondi intermédiaire : les écarts au dernier bit (sommes partielles des shards,
+    # bincount ou parcours complet) ne font pas basculer un score situé sur une demi-unité
+    return round(round(score * 100, PROBABILITY_DIGITS), 2)
+
+
+def rank_diagnoses(average_scores):
+    """Trie les scores moyens et retourne les meilleurs diagnostics au-dessus du seuil"""
+    # Tri sur la probabilité arrondie : les sommes de bincount et du parcours complet
+    # peuvent différer au dernier bit. Le tri est stable : à probabilité égale,
+    # l'ordre de première apparition est conservé
+    sorted_diagnoses = sorted(
+        ((diag, score, probability(score)) for diag, score in average_scores),
+        key=lambda x: x[2],
+        reverse=True
+    )
+    return [
+        {"diagnostic": diag, "probability": rounded}
+        for diag, score, rounded in sorted_diagnoses[:TOP_K]
+        if score > MIN_SCORE
+    ]
+
+
+def profile_weights(profile_ids, case_base, weights=None):
+    """Poids des profils : leur effectif, ou les poids cumulés fournis (0 pour un profil plus récent)"""
+    if weights is None:
+        return case_base.profile_counts[profile_ids]
+    selected = np.zeros(len(profile_ids))
+    known = profile_ids < len(weights)
+    selected[known] = weights[profile_ids[known]]
+    return selected
+
+
+def group_means(profile_ids, similarities, case_base, weights=None):
+    """Moyenne des similarités par diagnostic, dans l'ordre de première apparition"""
+    query_ids = np.zeros(len(profile_ids), dtype=np.int64)
+    return group_means_batch(query_ids, profile_ids, similarities, case_base, 1, weights)[0]
+
+
+def group_means_batch(query_ids, profile_ids, similarities, case_base, n_queries, weights=None):
+    """Moyennes par (requête, diagnostic) ; les couples doivent être triés par requête puis par profil
+
+    Sans `weights`, chaque profil compte autant de fois qu'il regroupe de
+    cas ; sinon il compte pour son poids cumulé (pondération par récence).
+    """
+    diagnostics = case_base.diagnostics
+    n_codes = len(diagnostics)
+    keys = query_ids * n_codes + case_base.profile_diagnostics[profile_ids]
+    weights = profile_weights(profile_ids, case_base, weights)
+    sums = np.bincount(keys, weights=similarities * weights, minlength=n_queries * n_codes)
+    counts = np.bincount(keys, weights=weights, minlength=n_queries * n_codes)
+
+    # Les profils étant numérotés dans l'ordre de leur premier cas, le premier
+    # profil rencontré donne l'ordre d'apparition des diagnostics du parcours complet
+    first_seen = np.full(n_queries * n_codes, len(keys), dtype=np.int64)
+    np.minimum.at(first_seen, keys, np.arange(len(keys)))
+
+    results = []
+    for query in range(n_queries):
+        offset = query * n_codes
+        order = np.flatnonzero(counts[offset:offset + n_codes])
+        order = order[np.argsort(first_seen[offset + order], kind='stable')]
+        results.append([
+            (diagnostics[code], float(sums[offset + code] / counts[offset + code]))
+            for code in order
+        ])
+    return results
+
+
+class InvertedIndexEngine:
+    """Moteur de diagnostic basé sur un index inversé symptôme -> profils de cas"""
+
+    def __init__(self, case_base):
+        self.case_base = case_base
+        # postings : identifiant de symptôme -> tableau trié des identifiants de profils
+        rows = np.repeat(
+            np.arange(case_base.n_profiles, dtype=np.int32), case_base.profile_sizes
+        )
+        order = np.argsort(case_base.indices, kind='stable')
+        counts = np.bincount(case_base.indices, minlength=len(case_base.symptoms))
+        self.postings = np.split(rows[order], np.cumsum(counts)[:-1])
+        # Profils ajoutés depuis la construction, par symptôme (fusionnés au-delà d'un seuil)
+        self.pending = {}
+        logger.info(
+            f"Index inversé construit: {case_base.n_profiles} profils, {len(self.postings)} symptômes"
+        )
+
+    def add_profile(self, profile_id):
+        """Ajoute un nouveau profil aux listes de ses symptômes en O(nombre de symptômes)"""
+        for symptom_id in self.case_base.profile_symptoms(profile_id).tolist():
+            pending = self.pending.setdefault(symptom_id, [])
+            pending.append(profile_id)
+            if len(pending) >= PENDING_MERGE_SIZE:
+                self._merge(symptom_id)
+
+    def _merge(self, symptom_id):
+        # La liste fusionnée est publiée avant le retrait des ajouts en attente :
+        # un lecteur concurrent voit toujours les nouveaux profils dans l'une ou l'autre
+        merged = np.array(self.pending[symptom_id], dtype=np.int32)
+        if symptom_id < len(self.postings):
+            merged = np.concatenate([self.postings[symptom_id], merged])
+        else:
+            self.postings.extend(
+                np.empty(0, dtype=np.int32)
+                for _ in range(symptom_id + 1 - len(self.postings))
+            )
+        self.postings[symptom_id] = merged
+        del self.pending[symptom_id]
+
+    def _posting(self, symptom_id):
+        """Liste triée des profils d'un symptôme, y compris les ajouts récents"""
+        # Ajouts en attente lus avant la liste principale (ordre inverse de _merge)
+        pending = self.pending.get(symptom_id)
+        posting = self.postings[symptom_id] if symptom_id < len(self.postings) else None
+        if not pending:
+            return posting
+        pending = np.array(pending, dtype=np.int32)
+        if posting is None:
+            return pending
+        if len(posting):
+            # Pendant une fusion, les profils en attente figurent déjà en fin de liste principale
+            pending = pending[pending > posting[-1]]
+        return np.concatenate([posting, pending])
+
+    def average_scores(self, symptoms, weights=None):
+        """Retourne les couples (diagnostic, similarité de Jaccard moyenne) des cas correspondants"""
+        case_base = self.case_base
+        input_symptoms = set(symptoms)
+        lists = [
+            self._posting(case_base.symptom_ids[symptom])
+            for symptom in input_symptoms
+            if symptom in case_base.symptom_ids
+        ]
+        lists = [posting for posting in lists if posting is not None]
+        if not lists:
+            return []
+
+        # Taille de l'intersection pour chaque profil présent dans au moins une liste
+        profile_ids, intersections = np.unique(
+            np.concatenate(lists), return_counts=True
+        )
+        unions = case_base.profile_sizes[profile_ids] + len(input_symptoms) - intersections
+        return group_means(profile_ids, intersections / unions, case_base, weights)
+
+    def average_scores_batch(self, symptom_lists, weights=None):
+        """Scores moyens de plusieurs requêtes, dans l'ordre d'entrée"""
+        return [self.average_scores(symptoms, weights) for symptoms in symptom_lists]
+
+
+class BitsetEngine:
+    """Moteur de diagnostic vectorisé sur la matrice de bits des profils de cas"""
+
+    def __init__(self, case_base):
+        self.case_base = case_base
+
+    def add_profile(self, profile_id):
+        """Rien à faire : la colonne du profil est ajoutée à la matrice par la base de cas"""
+
+    def average_scores(self, symptoms, weights=None):
+        """Retourne les couples (diagnostic, similarité de Jaccard moyenne) des cas correspondants"""
+        case_base = self.case_base
+        # Matrice lue une seule fois : des profils peuvent être ajoutés pendant le calcul
+        bits = case_base.bits
+        mask, n_input = case_base.query_mask(symptoms)
+        # Seuls les mots contenant des symptômes de la requête sont parcourus
+        words = np.flatnonzero(mask[:bits.shape[0]])
+        if len(words) == 0:
+            return []
+
+        intersections = popcount(bits[words[0]] & mask[words[0]]).astype(np.int32)
+        for word in words[1:]:
+            intersections += popcount(bits[word] & mask[word])
+
+        profile_ids = np.flatnonzero(intersections)
+        if len(profile_ids) == 0:
+            return []
+        matched = intersections[profile_ids]
+        unions = case_base.profile_sizes[profile_ids] + n_input - matched
+        return group_means(profile_ids, matched / unions, case_base, weights)
+
+    def average_scores_batch(self, symptom_lists, weights=None):
+        """Scores moyens de plusieurs requêtes, calculés par blocs de la matrice requêtes x profils"""
+        case_base = self.case_base
+        bits = case_base.bits
+        n_profiles = bits.shape[1]
+        queries = [case_base.query_mask(symptoms) for symptoms in symptom_lists]
+        if not queries:
+            return []
+        masks = np.array([mask[:bits.shape[0]] for mask, _ in queries], dtype=np.uint64)
+        n_inputs = np.array([n_input for _, n_input in queries], dtype=np.int32)
+
+        # Taille des blocs de requêtes pour borner la matrice d'intersections en mémoire
+        block = max(1, BATCH_CELLS // max(n_profiles, 1))
+        results = []
+        for start in range(0, len(queries), block):
+            block_masks = masks[start:start + block]
+            n_queries = len(block_masks)
+            intersections = np.zeros((n_queries, n_profiles), dtype=np.int32)
+            for word in np.flatnonzero(block_masks.any(axis=0)):
+                intersections += popcount(
+                    bits[word][np.newaxis, :] & block_masks[:, word][:, np.newaxis]
+                )
+
+            # Couples (requête, profil) correspondants, triés par requête puis par profil
+            query_ids, profile_ids = np.nonzero(intersections)
+            matched = intersections[query_ids, profile_ids]
+            unions = (
+                case_base.profile_sizes[profile_ids]
+                + n_inputs[start:start + block][query_ids]
+                - matched
+            )
+            results.extend(group_means_batch(
+                query_ids, profile_ids, matched / unions, case_base, n_queries, weights
+            ))
+        return results
@@ -0,0 +1,16 @@
+# Configuration Gunicorn lue automatiquement depuis le répertoire de travail
+import sys
+
+
+def on_reload(server):
+    """kill -HUP <maître> : avec --preload, le maître recharge la base avant de relancer les workers"""
+    app_module = sys.modules.get('app')
+    if app_module is not None:
+        app_module.reloader.reload(wait=True)
+
+
+def post_worker_init(worker):
+    """kill -HUP <worker> : recharge la base de ce worker seulement"""
+    app_module = sys.modules.get('app')
+    if app_module is not None:
+        app_module.reloader.install_signal_handler()
@@ -0,0 +1,86 @@
+import logging
+import threading
+import time
+from datetime import datetime
+
+logger = logging.getLogger(__name__)
+
+# Âge maximal de l'instantané servi par /health/ready, en secondes
+SNAPSHOT_INTERVAL = 2.0
+# Intervalle minimal entre deux vérifications de la base SQLite, en secondes
+DATABASE_INTERVAL = 30.0
+
+
+class HealthMonitor:
+    """Instantané de l'état du service pour la sonde de disponibilité
+
+    Les requêtes lisent l'instantané courant sans attendre ; lorsqu'il est
+    trop ancien, un seul thread le reconstruit en arrière-plan. La
+    vérification de la base (entrées/sorties) n'est faite qu'une fois par
+    `database_interval` secondes, quel que soit le nombre de sondes.
+    """
+
+    def __init__(self, collect, check_database, interval=SNAPSHOT_INTERVAL,
+                 database_interval=DATABASE_INTERVAL):
+        # collect() : état en mémoire (sans entrée/sortie) ; check_database() : vérification profonde
+        self.collect = collect
+        self.check_database = check_database
+        self.interval = interval
+        self.database_interval = database_interval
+        self._snapshot = None
+        self._refreshed_at = None
+        self._database = {"status": "unknown"}
+        self._database_checked_at = None
+        self._refreshing = False
+        self._lock = threading.Lock()
+        self.database_checks = 0
+
+    def snapshot(self):
+        """Dernier instantané ; sa reconstruction est lancée en arrière-plan s'il est périmé"""
+        if self._snapshot is None:
+            # Premier appel : état en mémoire seulement, la base est vérifiée en arrière-plan
+            self._refreshed_at = time.monotonic()
+            self._snapshot = self._build()
+        elif time.monotonic() - self._refreshed_at < self.interval:
+            return self._snapshot
+        with self._lock:
+            if self._refreshing:
+                return self._snapshot
+            self._refreshing = True
+        threading.Thread(target=self._refresh, name='health-refresh', daemon=True).start()
+        return self._snapshot
+
+    def _refresh(self):
+        try:
+            checked_at = self._database_checked_at
+            if checked_at is None or time.monotonic() - checked_at >= self.database_interval:
+                self._database = self._check_database()
+                self._database_checked_at = time.monotonic()
+            self._refreshed_at = time.monotonic()
+            self._snapshot = self._build()
+        except Exception as e:
+            logger.warning(f"Rafraîchissement de l'état de santé: {str(e)}")
+        finally:
+            self._refreshing = False
+
+    def _check_database(self):
+        self.database_checks += 1
+        started = time.perf_counter()
+        try:
+            result = {"status": "connected", **self.check_database()}
+        except Exception as e:
+            result = {"status": "error", "error": str(e)}
+        result["checked_at"] = datetime.now().isoformat()
+        result["duration_ms"] = round((time.perf_counter() - started) * 1000, 3)
+        return result
+
+    def _build(self):
+        state = self.collect()
+        database = self._database
+        return {
+            # Prêt si les données sont chargées et que la dernière vérification de la base n'a pas échoué
+            "ready": state.get("data_loaded", False) and database["status"] != "error",
+            **state,
+            "database": database,
+            "snapshot_at": datetime.now().isoformat(),
+        }
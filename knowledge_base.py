@@ -0,0 +1,282 @@
+import logging
+import os
+import signal
+import threading
+import time
+from datetime import datetime
+
+from diagnosis_engine import BitsetEngine, InvertedIndexEngine
+from recency import HALF_LIFE_DAYS, RecencyWeights
+from rule_engine import RuleEngine
+from sharded_engine import ShardedEngine
+from similar_cases import SimilarCaseIndex
+from snapshot import source_signature
+from symptom_suggest import SymptomSuggester
+
+logger = logging.getLogger(__name__)
+
+
+class KnowledgeBase:
+    """Base de cas et moteurs construits ensemble, remplacés d'un seul bloc au rechargement
+
+    Les requêtes lisent la base courante une seule fois et travaillent sur
+    cet objet jusqu'à la fin : un rechargement concurrent ne leur montre
+    jamais une base à moitié construite ni des moteurs d'une autre génération.
+    """
+
+    def __init__(self, case_base, generation, rule_options=None, half_life_days=HALF_LIFE_DAYS,
+                 similarity_options=None, shards=0):
+        self.case_base = case_base
+        self.generation = generation
+        self.engines = {
+            'bitset': BitsetEngine(case_base),
+            'index': InvertedIndexEngine(case_base),
+            'rules': RuleEngine(case_base, **(rule_options or {})),
+        }
+        if shards:
+            # Calcul réparti sur `shards` processus (optionnel)
+            self.engines['sharded'] = ShardedEngine(case_base, shards)
+        # Poids des profils pour la pondération par récence
+        self.recency = RecencyWeights(case_base, half_life_days)
+        # Recherche approchée des cas similaires (MinHash LSH)
+        self.similar_cases = SimilarCaseIndex(case_base, **(similarity_options or {}))
+        # Complétion des noms de symptômes (/api/symptoms/suggest)
+        self.suggestions = SymptomSuggester(case_base)
+        self.loaded_at = datetime.now()
+
+
+class KnowledgeBaseReloader:
+    """Chargement unique et rechargement à chaud de la base de connaissances
+
+    Un seul chargement s'exécute à la fois ; les demandes reçues pendant un
+    rechargement sont regroupées en une seule passe supplémentaire. La
+    nouvelle base est construite en arrière-plan puis publiée par une simple
+    affectation de `current`.
+    """
+
+    def __init__(self, load, paths, rule_options=None, half_life_days=HALF_LIFE_DAYS,
+                 similarity_options=None, shards=0, databases=(), catch_up=None, prepare=None):
+        # load() retourne une nouvelle CaseBase, ou None en cas d'échec
+        self.load = load
+        # prepare() crée ou migre les sources avant chaque chargement ; appelé avant
+        # le relevé de leur signature, il ne fait pas paraître la base périmée
+        self.prepare = prepare
+        # catch_up(database) applique à la base courante les écritures d'autres
+        # processus dans une base source ; False si un rechargement est nécessaire
+        self.catch_up = catch_up
+        # Fichiers sources surveillés (JSON) et bases SQLite (compteur d'écritures)
+        self.paths = paths
+        self.databases = databases
+        # Seuils du moteur de règles (min_support, min_confidence, max_length)
+        self.rule_options = rule_options
+        # Demi-vie de la pondération par récence, en jours
+        self.half_life_days = half_life_days
+        # Découpage des signatures MinHash (bands, rows)
+        self.similarity_options = similarity_options
+        # Nombre de processus du moteur réparti (0 pour le désactiver)
+        self.shards = shards
+        self.current = None
+        # Sérialise les chargements (initial et rechargements)
+        self._load_lock = threading.Lock()
+        # Protège l'état du rechargement en arrière-plan
+        self._state_lock = threading.Lock()
+        self._thread = None
+        self._pending = False
+        self._generation = 0
+        # Signature des sources correspondant à la base courante
+        self._signature = None
+        # Écritures locales dans les sources (ingestion), pour détecter celles
+        # survenues pendant un rechargement
+        self._changes = 0
+        self._watcher_pid = None
+        self._stop_watching = None
+        self.reloads = 0
+        self.failures = 0
+        self.last_reload = None
+        self.last_duration = None
+        self.last_error = None
+
+    def get(self):
+        """Base courante, chargée au premier appel (None si le chargement échoue)"""
+        current = self.current
+        if current is not None:
+            return current
+        with self._load_lock:
+            # Les appels concurrents attendent le premier chargement sans le relancer
+            if self.current is None:
+                self._rebuild()
+            return self.current
+
+    def reload(self, wait=False):
+        """Demande un rechargement en arrière-plan ; retourne True si la base a été remplacée
+
+        Sans `wait`, retourne None immédiatement.
+        """
+        with self._state_lock:
+            self._pending = True
+            if self._thread is None:
+                self._thread = threading.Thread(
+                    target=self._run, name='knowledge-base-reload', daemon=True
+                )
+                self._thread.start()
+            thread = self._thread
+            reloads = self.reloads
+        if not wait:
+            return None
+        thread.join()
+        return self.reloads > reloads
+
+    def _run(self):
+        while True:
+            with self._state_lock:
+                if not self._pending:
+                    self._thread = None
+                    return
+                self._pending = False
+            with self._load_lock:
+                self._rebuild()
+
+    def _rebuild(self):
+        # Appelé avec _load_lock : construit la nouvelle base hors de toute requête
+        started = time.perf_counter()
+        changes = self._changes
+        try:
+            if self.prepare is not None:
+                self.prepare()
+            signature = source_signature(self.paths, self.databases)
+            case_base = self.load()
+            if case_base is None or len(case_base) == 0:
+                raise RuntimeError("Échec du chargement des données")
+            knowledge = KnowledgeBase(
+                case_base, self._generation + 1, self.rule_options, self.half_life_days,
+                self.similarity_options, self.shards,
+            )
+        except Exception as e:
+            self.failures += 1
+            self.last_error = str(e)
+            logger.error(f"Rechargement de la base de connaissances échoué: {str(e)}")
+            return
+
+        # Sources modifiées pendant la lecture : la base peut contenir une partie
+        # de ces écritures, que la signature ne décrit pas
+        stale = source_signature(self.paths, self.databases) != signature
+
+        # Publication atomique : les requêtes en cours gardent l'ancienne base
+        self._generation = knowledge.generation
+        self._signature = None if stale else signature
+        self.current = knowledge
+        self.reloads += 1
+        self.last_reload = knowledge.loaded_at
+        self.last_duration = round(time.perf_counter() - started, 3)
+        self.last_error = None
+        logger.info(
+            f"Base de connaissances génération {knowledge.generation} publiée: "
+            f"{len(case_base)} cas en {self.last_duration} s"
+        )
+
+        if stale or self._changes != changes:
+            # Des cas ont été ajoutés pendant la lecture : nouvelle passe
+            self.reload()
+
+    def database_version(self, database):
+        """database_version d'une base source correspondant à la base courante (None si inconnue)"""
+        signature = self._signature
+        known = signature.get(database) if signature is not None else None
+        return None if known is None else known[1:]
+
+    def record_change(self, database, before, after):
+        """Signale une écriture locale dans une base source, déjà appliquée à la base courante
+
+        `before` et `after` : database_version de la base au début et à la
+        fin de la transaction d'écriture.
+        """
+        self._changes += 1
+        # La surveillance ne doit pas recharger pour une modification déjà connue ;
+        # si une autre écriture (d'un autre processus) l'a précédée, la signature
+        # reste en retard et le rechargement aura lieu
+        signature = self._signature
+        known = signature.get(database) if signature is not None else None
+        if known is not None and known[1:] == before:
+            self._signature = {**signature, database: [known[0], *after]}
+
+    def start_watcher(self, interval, files=True):
+        """Recharge la base quand les sources changent (une fois par processus)
+
+        Les écritures d'autres processus dans les bases SQLite sont d'abord
+        confiées à `catch_up` ; sans `files`, seules ces bases sont surveillées.
+        Les threads ne survivent pas au fork : avec gunicorn --preload, la
+        surveillance démarre dans chaque worker, au premier appel.
+        """
+        pid = os.getpid()
+        if self._watcher_pid == pid:
+            return
+        self._watcher_pid = pid
+        self._stop_watching = threading.Event()
+        thread = threading.Thread(
+            target=self._watch, args=(interval, self._stop_watching, files),
+            name='knowledge-base-watcher', daemon=True,
+        )
+        thread.start()
+        sources = [*self.databases, *(self.paths if files else [])]
+        logger.info(f"Surveillance des sources toutes les {interval} s: {', '.join(sources)}")
+
+    def stop_watcher(self):
+        """Arrête la surveillance des sources du processus courant"""
+        if self._watcher_pid == os.getpid():
+            self._stop_watching.set()
+            self._watcher_pid = None
+
+    def _watch(self, interval, stop, files):
+        paths = self.paths if files else []
+        while not stop.wait(interval):
+            try:
+                signature = source_signature(paths, self.databases)
+                known = self._signature
+                if known is None:
+                    continue
+                changed = [source for source, value in signature.items() if known.get(source) != value]
+                if changed and not all(self._catch_up(source, known, signature) for source in changed):
+                    logger.info("Sources modifiées, rechargement de la base de connaissances")
+                    # Évite de relancer tant que le rechargement n'a pas publié la nouvelle signature
+                    self._signature = {**known, **signature}
+                    self.reload()
+            except Exception as e:
+                logger.warning(f"Surveillance des sources: {str(e)}")
+
+    def _catch_up(self, source, known, signature):
+        # Même fichier de base : les écritures peuvent être appliquées sans rechargement
+        if self.catch_up is None or source not in self.databases:
+            return False
+        if known.get(source) is None or signature[source] is None or known[source][0] != signature[source][0]:
+            return False
+        return self.catch_up(source)
+
+    def install_signal_handler(self, signum=getattr(signal, 'SIGHUP', None)):
+        """Recharge la base à la réception du signal (SIGHUP par défaut)"""
+        if signum is None:
+            return False
+
+        def handle(signum, frame):
+            # Le gestionnaire interrompt le thread principal, qui peut détenir
+            # _state_lock : la demande est faite depuis un autre thread
+            threading.Thread(target=self.reload, daemon=True).start()
+
+        try:
+            signal.signal(signum, handle)
+        except ValueError:
+            # signal.signal n'est autorisé que dans le thread principal
+            return False
+        return True
+
+    def status(self):
+        """État du rechargement exposé par /health et /admin/reload"""
+        current = self.current
+        return {
+            "generation": current.generation if current is not None else None,
+            "loaded_at": current.loaded_at.isoformat() if current is not None else None,
+            "in_progress": self._thread is not None,
+            "reloads": self.reloads,
+            "failures": self.failures,
+            "last_duration_seconds": self.last_duration,
+            "last_error": self.last_error,
+        }
@@ -0,0 +1,128 @@
+import threading
+
+# Limites des tranches d'âge des recommandations (< 18, 18-39, 40-64, 65 et plus)
+AGE_BANDS = (18, 40, 65)
+# Nombre de médicaments recommandés par diagnostic
+MAX_RECOMMENDATIONS = 3
+# Nombre minimal de patients d'une tranche d'âge pour s'y restreindre
+MIN_BAND_PATIENTS = 20
+
+
+def age_band(age):
+    """Indice de la tranche d'âge (None si l'âge est inconnu)"""
+    if not isinstance(age, int) or isinstance(age, bool):
+        return None
+    band = 0
+    while band < len(AGE_BANDS) and age >= AGE_BANDS[band]:
+        band += 1
+    return band
+
+
+class MedicationIndex:
+    """Co-occurrences diagnostic x médicament, par tranche d'âge, tenues à jour cas par cas
+
+    Pour chaque couple (diagnostic, tranche) — la tranche None regroupant
+    tous les âges — l'index compte les patients et les prescriptions de
+    chaque médicament. Le classement d'un couple est calculé à la première
+    demande puis conservé jusqu'à sa prochaine modification : une
+    recommandation est une simple lecture de dictionnaire. À effectif égal,
+    les médicaments gardent l'ordre de la table medications, comme
+    recommend_medications dans references/temp_system.ipynb.
+    """
+
+    def __init__(self):
+        # (diagnostic, âge) -> patients et (diagnostic, âge, médicament) -> prescriptions,
+        # conservés par âge exact pour l'instantané
+        self.patients_by_age = {}
+        self.counts_by_age = {}
+        # (diagnostic, tranche) -> patients et (diagnostic, tranche) -> {médicament: prescriptions}
+        self.patients = {}
+        self.counts = {}
+        # Médicament -> rang de première apparition, départage des effectifs égaux
+        self.order = {}
+        # (diagnostic, tranche) -> recommandations classées
+        self._ranked = {}
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_rows(cls, patient_rows, medication_rows):
+        """Construit l'index à partir de (diagnostic, âge, patients) et (diagnostic, âge, médicament, prescriptions)"""
+        index = cls()
+        for diagnosis, age, count in patient_rows:
+            index._add_patients(diagnosis, age, count)
+        for diagnosis, age, medication, count in medication_rows:
+            index._add_medication(diagnosis, age, medication, count)
+        return index
+
+    def rows(self):
+        """Lignes (patients, prescriptions) par âge exact, inverses de from_rows (ordre des médicaments conservé)"""
+        medication_rows = sorted(
+            ([diagnosis, age, medication, count]
+             for (diagnosis, age, medication), count in self.counts_by_age.items()),
+            key=lambda row: self.order[row[2]],
+        )
+        return (
+            [[diagnosis, age, count] for (diagnosis, age), count in self.patients_by_age.items()],
+            medication_rows,
+        )
+
+    def _add_patients(self, diagnosis, age, count):
+        key = (diagnosis, age)
+        self.patients_by_age[key] = self.patients_by_age.get(key, 0) + count
+        for band in {None, age_band(age)}:
+            key = (diagnosis, band)
+            self.patients[key] = self.patients.get(key, 0) + count
+            self._ranked.pop(key, None)
+
+    def _add_medication(self, diagnosis, age, medication, count):
+        self.order.setdefault(medication, len(self.order))
+        key = (diagnosis, age, medication)
+        self.counts_by_age[key] = self.counts_by_age.get(key, 0) + count
+        if self.counts_by_age[key] <= 0:
+            del self.counts_by_age[key]
+        for band in {None, age_band(age)}:
+            counts = self.counts.setdefault((diagnosis, band), {})
+            counts[medication] = counts.get(medication, 0) + count
+            self._ranked.pop((diagnosis, band), None)
+
+    def add_case(self, diagnosis, age, medications, count=1):
+        """Ajoute (count=-1 : retire) un patient et ses prescriptions"""
+        with self._lock:
+            self._add_patients(diagnosis, age, count)
+            for medication in dict.fromkeys(medications):
+                self._add_medication(diagnosis, age, medication, count)
+
+    def remove_case(self, diagnosis, age, medications):
+        """Retire un patient et ses prescriptions"""
+        self.add_case(diagnosis, age, medications, -1)
+
+    def recommend(self, diagnosis, age=None, limit=MAX_RECOMMENDATIONS):
+        """Médicaments les plus prescrits pour le diagnostic (et la tranche d'âge si elle est assez fournie)"""
+        band = age_band(age)
+        if band is None or self.patients.get((diagnosis, band), 0) < MIN_BAND_PATIENTS:
+            band = None
+        key = (diagnosis, band)
+        ranked = self._ranked.get(key)
+        if ranked is None:
+            with self._lock:
+                patients = self.patients.get(key, 0)
+                counts = self.counts.get(key, {})
+                ranked = [
+                    {
+                        "medication": medication,
+                        "frequency": round(count / patients * 100, 2),
+                        "count": count,
+                    }
+                    for medication, count in sorted(counts.items(), key=lambda item: (-item[1], self.order[item[0]]))
+                    if count > 0 and patients > 0
+                ]
+                self._ranked[key] = ranked
+        return ranked[:limit]
+
+    def stats(self):
+        """Tailles exposées par /health/ready"""
+        return {
+            "diagnostics": len({diagnosis for diagnosis, band in self.patients if band is None}),
+            "medications": len({medication for _, _, medication in self.counts_by_age}),
+            "pairs": sum(len(counts) for (_, band), counts in self.counts.items() if band is None),
+        }
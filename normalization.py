@@ -0,0 +1,75 @@
+import hashlib
+import json
+import unicodedata
+
+# Séparateurs ramenés au tiret bas (espaces, tirets, apostrophes, points)
+SEPARATORS = " \t-'’‘.,/"
+
+# Synonymes et variantes d'orthographe des générateurs, sous forme normalisée -> symptôme canonique
+SYNONYMS = {
+    "mal_de_tete": "maux_de_tete",
+    "mal_a_la_tete": "maux_de_tete",
+    "cephalees": "maux_de_tete",
+    "mal_de_gorge": "maux_de_gorge",
+    "gorge_irritee": "maux_de_gorge",
+    "douleur_en_avalant": "difficulte_deglutition",
+    "courbatures": "douleurs_musculaires",
+    "douleur_abdominale": "douleurs_abdominales",
+    "nez_bouche": "congestion_nasale",
+    "nez_qui_coule": "congestion_nasale",
+    "eternuement": "eternuements",
+    "perte_d_odorat": "perte_gout_odorat",
+    "sensibilite_a_la_lumiere": "sensibilite_lumiere",
+}
+
+# Nombre maximal de formes brutes mémorisées (les requêtes peuvent envoyer n'importe quoi)
+MEMO_SIZE = 1 << 16
+
+
+def fold(text):
+    """Forme normalisée d'un libellé : minuscules, sans accents, séparateurs réduits à un tiret bas"""
+    text = unicodedata.normalize('NFKD', text.strip().lower())
+    text = ''.join(c for c in text if not unicodedata.combining(c))
+    for separator in SEPARATORS:
+        text = text.replace(separator, '_')
+    return '_'.join(part for part in text.split('_') if part)
+
+
+class SymptomNormalizer:
+    """Ramène chaque libellé de symptôme à son nom canonique
+
+    La table de synonymes est compilée une fois en un dictionnaire forme
+    normalisée -> nom canonique ; les formes brutes déjà vues sont
+    mémorisées, de sorte qu'un symptôme coûte un hachage de sa chaîne
+    (O(longueur)). Appliquée au chargement, aux ajouts de cas et aux
+    requêtes, elle fait correspondre `fièvre`, `Fievre` et `fievre`.
+    """
+
+    def __init__(self, synonyms=SYNONYMS, memo_size=MEMO_SIZE):
+        self.aliases = {fold(alias): fold(canonical) for alias, canonical in synonyms.items()}
+        # Empreinte de la table : un instantané construit avec une autre table est périmé
+        self.version = hashlib.sha1(
+            json.dumps(sorted(self.aliases.items())).encode('utf-8')
+        ).hexdigest()[:12]
+        self.memo_size = memo_size
+        self._memo = {}
+
+    def normalize(self, symptom):
+        """Nom canonique d'un symptôme (les valeurs qui ne sont pas des chaînes sont inchangées)"""
+        if not isinstance(symptom, str):
+            return symptom
+        canonical = self._memo.get(symptom)
+        if canonical is not None:
+            return canonical
+        folded = fold(symptom)
+        canonical = self.aliases.get(folded, folded)
+        if len(self._memo) < self.memo_size:
+            self._memo[symptom] = canonical
+        return canonical
+
+    def normalize_list(self, symptoms):
+        """Noms canoniques d'une liste de symptômes (une valeur qui n'est pas une liste est inchangée)"""
+        if not isinstance(symptoms, list):
+            return symptoms
+        normalize = self.normalize
+        return [normalize(symptom) for symptom in symptoms]
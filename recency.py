@@ -0,0 +1,76 @@
+import threading
+from datetime import date
+
+import numpy as np
+
+# Limites des tranches d'ancienneté des consultations, en jours
+BUCKET_EDGES = np.array([30, 90, 180, 365, 730, 1825])
+# Demi-vie par défaut du poids d'un cas, en jours
+HALF_LIFE_DAYS = 180
+
+
+class RecencyWeights:
+    """Pondération des cas par l'ancienneté de leur consultation, par tranches précalculées
+
+    Chaque cas reçoit le poids de sa tranche d'ancienneté (décroissance
+    exponentielle évaluée au milieu de la tranche) ; les poids sont cumulés
+    par profil pour que la moyenne pondérée reste une réduction vectorisée.
+    Les cumuls sont recalculés depuis les tableaux de la base au premier
+    appel de la journée ou après un retrait, et complétés pour les cas ajoutés.
+    """
+
+    def __init__(self, case_base, half_life_days=HALF_LIFE_DAYS):
+        self.case_base = case_base
+        self.half_life_days = half_life_days
+        # Poids des tranches ; la dernière tranche reçoit aussi les cas sans date
+        lower = np.concatenate([[0], BUCKET_EDGES])
+        upper = np.concatenate([BUCKET_EDGES, [BUCKET_EDGES[-1]]])
+        self.bucket_weights = 0.5 ** ((lower + upper) / 2 / half_life_days)
+        self.profile_weights = np.zeros(0)
+        # (jour, nombre de cas retirés) et nombre de cas couverts par profile_weights
+        self._key = None
+        self._n_cases = 0
+        self._lock = threading.Lock()
+
+    def _case_weights(self, profiles, days, today):
+        buckets = np.searchsorted(BUCKET_EDGES, today.toordinal() - days, side='right')
+        buckets[days == 0] = len(BUCKET_EDGES)
+        weights = self.bucket_weights[buckets]
+        # Cas retirés
+        weights[profiles < 0] = 0
+        return weights
+
+    def case_weights(self, today=None):
+        """Poids de chaque cas à la date donnée (0 pour un cas retiré)"""
+        profiles = self.case_base.case_profiles
+        days = self.case_base.case_days[:len(profiles)]
+        return self._case_weights(profiles, days, today or date.today())
+
+    def weights(self):
+        """Poids cumulés de chaque profil, à jour pour la date du jour et les cas ajoutés"""
+        today = date.today()
+        case_base = self.case_base
+        key = (today, case_base.n_retired)
+        n_cases = len(case_base.case_profiles)
+        if key == self._key and n_cases == self._n_cases:
+            return self.profile_weights
+
+        with self._lock:
+            # Tranches du jour ou retrait : recalcul complet ; sinon seuls les cas ajoutés
+            start = self._n_cases if key == self._key else 0
+            if start >= n_cases:
+                return self.profile_weights
+            profiles = case_base.case_profiles[start:n_cases]
+            days = case_base.case_days[start:n_cases]
+            weights = np.bincount(
+                np.maximum(profiles, 0),
+                weights=self._case_weights(profiles, days, today),
+                minlength=case_base.n_profiles,
+            )
+            if start:
+                weights[:len(self.profile_weights)] += self.profile_weights
+            # Publication d'un nouveau tableau : les lecteurs gardent l'ancien
+            self.profile_weights = weights
+            self._key = key
+            self._n_cases = n_cases
+            return weights
@@ -0,0 +1,212 @@
+import gzip
+import hashlib
+import json
+import threading
+import time
+from collections import OrderedDict
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+
+class DiagnosisCache:
+    """Cache LRU borné et thread-safe des diagnostics, avec expiration (TTL)
+
+    Les entrées sont indexées par l'ensemble canonique des symptômes et
+    rattachées à une génération de données : toute nouvelle génération
+    vide le cache, les résultats d'une génération antérieure sont ignorés.
+    """
+
+    def __init__(self, max_size=1024, ttl=300.0):
+        self.max_size = max_size
+        # Durée de vie des entrées en secondes (0 : pas d'expiration)
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._generation = None
+        # Incrémenté à chaque invalidation partielle : un résultat calculé avant
+        # une invalidation n'est pas enregistré
+        self.epoch = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+
+    @staticmethod
+    def make_key(symptoms, backend=None):
+        """Clé canonique : tuple trié et dédoublonné des symptômes (None si impossible)"""
+        try:
+            return backend, tuple(sorted(set(symptoms)))
+        except TypeError:
+            return None
+
+    def _check_generation(self, generation):
+        # Appelé avec le verrou : une nouvelle génération invalide toutes les entrées ;
+        # une génération antérieure (requête commencée avant un rechargement) est
+        # refusée sans toucher aux entrées de la génération courante
+        if generation == self._generation:
+            return True
+        if self._generation is not None and generation < self._generation:
+            return False
+        if self._entries:
+            self.invalidations += 1
+        self._entries.clear()
+        self._generation = generation
+        return True
+
+    def get(self, key, generation):
+        """Retourne la valeur en cache ou None"""
+        if key is None or self.max_size <= 0:
+            return None
+        with self._lock:
+            if not self._check_generation(generation):
+                self.misses += 1
+                return None
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            expires_at, value = entry
+            if expires_at is not None and expires_at <= time.monotonic():
+                del self._entries[key]
+                self.expirations += 1
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key, value, generation, epoch=None):
+        """Enregistre une valeur calculée pour la génération (et l'époque) donnée"""
+        if key is None or self.max_size <= 0:
+            return
+        expires_at = time.monotonic() + self.ttl if self.ttl > 0 else None
+        with self._lock:
+            if epoch is not None and epoch != self.epoch:
+                return
+            if not self._check_generation(generation):
+                return
+            self._entries[key] = (expires_at, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def invalidate_symptoms(self, symptoms, variants=()):
+        """Supprime les entrées dont la requête partage au moins un symptôme avec `symptoms`
+
+        Un nouveau cas ne modifie que les moyennes des requêtes qui le
+        rencontrent, c'est-à-dire celles ayant un symptôme en commun avec lui.
+        Les entrées des variantes `variants` (moteur dont tous les résultats
+        ont pu changer, par exemple les règles après un changement de seuil)
+        sont toutes supprimées.
+        """
+        symptoms = set(symptoms)
+        with self._lock:
+            stale = [
+                key for key in self._entries
+                if key[0] in variants or not symptoms.isdisjoint(key[1])
+            ]
+            for key in stale:
+                del self._entries[key]
+            self.invalidations += len(stale)
+            self.epoch += 1
+        return len(stale)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        """Compteurs exposés par /health"""
+        with self._lock:
+            return {
+                "size": len(self._entries),
+                "max_size": self.max_size,
+                "ttl_seconds": self.ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+                "invalidations": self.invalidations,
+            }
+
+
+class EncodedResponse:
+    """Réponse JSON encodée et compressée une seule fois par version des données
+
+    Chaque variante (identité, gzip et brotli s'il est installé) est servie
+    avec un ETag dérivé du contenu : deux générations ou deux workers ayant
+    le même contenu donnent le même ETag.
+    """
+
+    def __init__(self):
+        # (version, {encodage: (corps, etag)}), remplacé d'un bloc
+        self._current = None
+        self._lock = threading.Lock()
+        self.builds = 0
+
+    def get(self, version, payload):
+        """Variantes de la version ; payload() n'est appelé que lorsque la version change"""
+        current = self._current
+        if current is not None and current[0] == version:
+            return current[1]
+        with self._lock:
+            current = self._current
+            if current is None or current[0] != version:
+                current = (version, self._encode(payload()))
+                self._current = current
+                self.builds += 1
+            return current[1]
+
+    @staticmethod
+    def _encode(payload):
+        body = json.dumps(payload, separators=(',', ':')).encode('utf-8')
+        digest = hashlib.sha256(body).hexdigest()[:20]
+        variants = {'identity': (body, f'"{digest}"')}
+        compressed = {'gzip': gzip.compress(body, 9, mtime=0)}
+        if brotli is not None:
+            compressed['br'] = brotli.compress(body)
+        for encoding, data in compressed.items():
+            # Une variante compressée plus grande que l'original n'est pas servie
+            if len(data) < len(body):
+                variants[encoding] = (data, f'"{digest}-{encoding}"')
+        return variants
+
+    @staticmethod
+    def choose(variants, accept_encoding):
+        """Encodage à servir d'après l'en-tête Accept-Encoding (brotli, puis gzip, sinon identité)"""
+        accepted = {}
+        for part in (accept_encoding or '').split(','):
+            name, _, params = part.strip().partition(';')
+            quality = 1.0
+            if params.strip().startswith('q='):
+                try:
+                    quality = float(params.strip()[2:])
+                except ValueError:
+                    quality = 0.0
+            accepted[name.strip().lower()] = quality
+        for encoding in ('br', 'gzip'):
+            quality = accepted.get(encoding, accepted.get('*', 0.0))
+            if encoding in variants and quality > 0:
+                return encoding
+        return 'identity'
+
+    @staticmethod
+    def matches(variants, if_none_match):
+        """True si l'en-tête If-None-Match désigne l'une des variantes (le client a déjà ce contenu)"""
+        if not if_none_match:
+            return False
+        if if_none_match.strip() == '*':
+            return True
+        etags = {etag for _, etag in variants.values()}
+        for tag in if_none_match.split(','):
+            tag = tag.strip()
+            if tag.startswith('W/'):
+                tag = tag[2:]
+            if tag in etags:
+                return True
+        return False
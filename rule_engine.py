@@ -0,0 +1,390 @@
+import logging
+import math
+import time
+from itertools import combinations
+
+import numpy as np
+
+from case_base import WORD_BITS
+
+logger = logging.getLogger(__name__)
+
+# Seuils par défaut des règles d'association
+MIN_SUPPORT = 0.005
+MIN_CONFIDENCE = 0.2
+# Nombre maximal d'items d'un itemset (antécédent + diagnostic)
+MAX_LENGTH = 5
+# Seuil de suivi des itemsets, en fraction du support minimal : les itemsets
+# « presque fréquents » sont comptés aussi, ce qui évite de réextraire les
+# règles tant que la base n'a pas perdu la moitié de ses cas
+PRE_LARGE_RATIO = 0.5
+
+
+class FPNode:
+    __slots__ = ('item', 'count', 'parent', 'children')
+
+    def __init__(self, item, parent):
+        self.item = item
+        self.count = 0
+        self.parent = parent
+        self.children = {}
+
+
+class FPTree:
+    """Arbre FP : transactions pondérées partageant leurs préfixes, et table d'en-tête item -> nœuds"""
+
+    def __init__(self, transactions, min_count):
+        transactions = list(transactions)
+        counts = {}
+        for items, count in transactions:
+            for item in items:
+                counts[item] = counts.get(item, 0) + count
+        # Seuls les items fréquents entrent dans l'arbre
+        self.counts = {item: count for item, count in counts.items() if count >= min_count}
+        # Items triés par support décroissant : les préfixes partagés sont les plus longs
+        self.order = sorted(self.counts, key=lambda item: (-self.counts[item], item))
+        rank = {item: position for position, item in enumerate(self.order)}
+
+        self.root = FPNode(None, None)
+        self.header = {item: [] for item in self.order}
+        for items, count in transactions:
+            node = self.root
+            for item in sorted((item for item in items if item in rank), key=rank.__getitem__):
+                child = node.children.get(item)
+                if child is None:
+                    child = node.children[item] = FPNode(item, node)
+                    self.header[item].append(child)
+                child.count += count
+                node = child
+
+    def prefix_paths(self, item):
+        """Base conditionnelle d'un item : chemins depuis la racine, pondérés par le nœud de l'item"""
+        for node in self.header[item]:
+            path = []
+            parent = node.parent
+            while parent.item is not None:
+                path.append(parent.item)
+                parent = parent.parent
+            if path:
+                yield path, node.count
+
+
+def fp_growth(tree, min_count, max_length, suffix=()):
+    """Produit les couples (itemset, effectif) fréquents de l'arbre, du moins fréquent au plus fréquent"""
+    for item in reversed(tree.order):
+        itemset = suffix + (item,)
+        yield itemset, tree.counts[item]
+        if len(itemset) < max_length:
+            conditional = FPTree(tree.prefix_paths(item), min_count)
+            if conditional.counts:
+                yield from fp_growth(conditional, min_count, max_length, itemset)
+
+
+class RuleEngine:
+    """Moteur de diagnostic par règles d'association symptômes -> diagnostic (FP-Growth)
+
+    Les transactions sont les profils de la base de cas pondérés par leur
+    effectif : l'arbre FP ne contient qu'un chemin par profil distinct,
+    quel que soit le nombre de cas. Le diagnostic est un item de la
+    transaction (l'identifiant ~code, négatif), et seules les règles dont il
+    est l'unique conséquent sont conservées.
+
+    Les ajouts et retraits de cas sont appliqués de façon incrémentale
+    (FUP avec itemsets « presque fréquents ») : l'effectif exact de tout
+    itemset atteignant le seuil de suivi est conservé, et un cas ne met à
+    jour que les itemsets qu'il contient puis les règles qui en dépendent.
+    """
+
+    def __init__(self, case_base, min_support=MIN_SUPPORT, min_confidence=MIN_CONFIDENCE,
+                 max_length=MAX_LENGTH):
+        self.case_base = case_base
+        self.min_support = min_support
+        self.min_confidence = min_confidence
+        self.max_length = max_length
+        # Index des règles : antécédent (frozenset d'identifiants de symptômes) ->
+        # liste de (code du diagnostic, confiance, effectif) ; le support et le
+        # lift, qui dépendent du nombre total de cas, sont calculés à la lecture
+        self.rules = {}
+        self.max_antecedent = 0
+        # Effectifs exacts des itemsets suivis (fermés par inclusion)
+        self.supports = {}
+        self.total = 0
+        # Seuil de suivi fixé à l'extraction : tout itemset non suivi a un effectif inférieur
+        self.lower_count = 1
+        self.mined_count = 0
+        self.updated_count = 0
+        self.mine()
+
+    def transactions(self):
+        """Transactions (symptômes + item du diagnostic, effectif) des profils de la base"""
+        case_base = self.case_base
+        counts = case_base.profile_counts.tolist()
+        diagnostics = case_base.profile_diagnostics[:len(counts)].tolist()
+        indptr = case_base.indptr[:len(counts) + 1].tolist()
+        indices = case_base.indices[:indptr[-1]].tolist()
+        for profile_id, count in enumerate(counts):
+            if count == 0:
+                continue
+            items = indices[indptr[profile_id]:indptr[profile_id + 1]]
+            items.append(~diagnostics[profile_id])
+            yield items, count
+
+    @property
+    def min_count(self):
+        """Effectif minimal d'une règle pour le nombre de cas courant"""
+        return max(1, math.ceil(self.min_support * self.total))
+
+    def mine(self):
+        """Extrait les itemsets suivis par FP-Growth et reconstruit l'index des règles"""
+        started = time.perf_counter()
+        transactions = list(self.transactions())
+        self.total = sum(count for _, count in transactions)
+        self.lower_count = max(1, math.ceil(self.min_support * PRE_LARGE_RATIO * self.total))
+        tree = FPTree(transactions, self.lower_count)
+        self.supports = {
+            frozenset(itemset): count
+            for itemset, count in fp_growth(tree, self.lower_count, self.max_length)
+        }
+        self._derive_all()
+        self.mined_count += 1
+        logger.info(
+            f"Règles d'association extraites: {self.n_rules} règles, {len(self.supports)} itemsets "
+            f"suivis sur {self.total} cas en {time.perf_counter() - started:.2f} s"
+        )
+
+    def _rule(self, antecedent, diagnostic):
+        """Règle antécédent -> diagnostic si elle atteint les seuils, sinon None"""
+        count = self.supports.get(antecedent | {diagnostic}, 0)
+        if count < self.min_count:
+            return None
+        # Un sous-ensemble d'un itemset suivi est suivi : son effectif est connu
+        confidence = count / self.supports[antecedent]
+        if confidence < self.min_confidence:
+            return None
+        return ~diagnostic, confidence, count
+
+    def _derive_all(self):
+        rules = {}
+        for itemset in self.supports:
+            diagnostics = [item for item in itemset if item < 0]
+            if len(itemset) < 2 or not diagnostics:
+                continue
+            antecedent = itemset - {diagnostics[0]}
+            rule = self._rule(antecedent, diagnostics[0])
+            if rule is not None:
+                rules.setdefault(antecedent, []).append(rule)
+        self.rules = rules
+        self.max_antecedent = max((len(antecedent) for antecedent in rules), default=0)
+
+    def _derive(self, antecedent, diagnostics=None):
+        """Recalcule les règles d'un antécédent (liste remplacée d'un bloc pour les lecteurs)
+
+        Seules les règles vers `diagnostics` (items ~code) sont réévaluées,
+        ou toutes les règles possibles si `diagnostics` vaut None.
+        """
+        if diagnostics is None:
+            diagnostics = [~code for code in range(len(self.case_base.diagnostics))]
+            rules = []
+        else:
+            rules = [rule for rule in self.rules.get(antecedent, ()) if ~rule[0] not in diagnostics]
+        for diagnostic in diagnostics:
+            rule = self._rule(antecedent, diagnostic)
+            if rule is not None:
+                rules.append(rule)
+        if rules:
+            self.rules[antecedent] = rules
+            self.max_antecedent = max(self.max_antecedent, len(antecedent))
+        else:
+            self.rules.pop(antecedent, None)
+
+    def count_itemset(self, itemset):
+        """Effectif exact d'un itemset, compté sur la matrice de bits des profils"""
+        case_base = self.case_base
+        bits = case_base.bits
+        n_profiles = bits.shape[1]
+        match = np.ones(n_profiles, dtype=bool)
+        masks = {}
+        for item in itemset:
+            if item < 0:
+                match &= case_base.profile_diagnostics[:n_profiles] == ~item
+            else:
+                word = item // WORD_BITS
+                masks[word] = masks.get(word, 0) | (1 << (item % WORD_BITS))
+        for word, mask in masks.items():
+            mask = np.uint64(mask)
+            match &= (bits[word] & mask) == mask
+        return int(case_base.profile_counts[:n_profiles][match].sum())
+
+    def add_case(self, profile_id):
+        """Prend en compte un cas ajouté à la base (à appeler après CaseBase.add_case)"""
+        self._update([profile_id], 1)
+
+    def add_cases(self, profile_ids):
+        """Prend en compte un lot de cas ajoutés (à appeler après CaseBase.add_case de tout le lot)
+
+        Les règles touchées par l'ensemble du lot ne sont recalculées qu'une fois.
+        """
+        self._update(profile_ids, 1)
+
+    def remove_case(self, profile_id):
+        """Prend en compte un cas retiré de la base (à appeler après CaseBase.remove_case)"""
+        self._update([profile_id], -1)
+
+    def _update(self, profile_ids, sign):
+        """Met à jour les effectifs des itemsets contenus dans les cas, puis les règles touchées
+
+        Les appels doivent être sérialisés, dans l'ordre des mises à jour de la base de cas.
+        """
+        case_base = self.case_base
+        min_count = self.min_count
+        self.total += sign * len(profile_ids)
+        if self.min_count < self.lower_count:
+            # Des itemsets non suivis pourraient devenir fréquents : réextraction
+            self.mine()
+            return
+
+        changed = set()
+        # Itemsets comptés sur la base pendant ce lot : ils incluent déjà tous ses cas
+        counted = set()
+        for profile_id in profile_ids:
+            items = sorted(case_base.profile_symptoms(profile_id).tolist())
+            items.insert(0, ~int(case_base.profile_diagnostics[profile_id]))
+            changed.update(self._update_counts(items, sign, counted))
+            self.updated_count += 1
+
+        if self.min_count != min_count:
+            # Le seuil a bougé : toutes les règles sont réévaluées (sans relire la base)
+            self._derive_all()
+            return
+        # Seules les règles dont l'antécédent ou l'itemset complet a changé sont recalculées :
+        # antécédent -> diagnostics à réévaluer (None : tous)
+        targets = {}
+        for itemset in changed:
+            diagnostics = [item for item in itemset if item < 0]
+            if diagnostics:
+                if len(itemset) > 1:
+                    antecedent = itemset - {diagnostics[0]}
+                    if targets.get(antecedent, ()) is not None:
+                        targets.setdefault(antecedent, set()).add(diagnostics[0])
+            elif sign < 0:
+                # Effectif de l'antécédent en baisse : la confiance de règles absentes
+                # de l'index vers d'autres diagnostics peut atteindre le seuil
+                targets[itemset] = None
+            elif targets.get(itemset, ()) is not None:
+                # Effectif en hausse : seules les règles existantes peuvent perdre en confiance
+                targets.setdefault(itemset, set()).update(
+                    ~code for code, _, _ in self.rules.get(itemset, ())
+                )
+        for antecedent, diagnostics in targets.items():
+            self._derive(antecedent, diagnostics)
+
+    def _update_counts(self, items, sign, counted):
+        """Parcours par niveaux des sous-ensembles du cas ; retourne les itemsets mis à jour
+
+        Un itemset non suivi n'est compté (sur la base) que si tous ses
+        sous-ensembles directs atteignent le seuil de suivi ; sinon son
+        effectif reste inférieur à ce seuil. Seuls les itemsets suivis sont
+        prolongés au niveau suivant. Les itemsets comptés sont ajoutés à
+        `counted` : les cas suivants du lot, déjà dans la base, ne les
+        incrémentent plus.
+        """
+        supports = self.supports
+        changed = []
+        level = [()]
+        for size in range(1, self.max_length + 1):
+            next_level = []
+            for prefix in level:
+                start = items.index(prefix[-1]) + 1 if prefix else 0
+                for item in items[start:]:
+                    candidate = prefix + (item,)
+                    key = frozenset(candidate)
+                    count = supports.get(key)
+                    if count is not None:
+                        if key not in counted:
+                            supports[key] = count + sign
+                    elif sign < 0:
+                        continue
+                    elif size > 1 and any(
+                        supports.get(key - {other}, 0) < self.lower_count for other in candidate
+                    ):
+                        continue
+                    else:
+                        # Le cas (et le reste du lot) est déjà dans la base : le comptage l'inclut
+                        supports[key] = self.count_itemset(candidate)
+                        counted.add(key)
+                    changed.append(key)
+                    next_level.append(candidate)
+            level = next_level
+            if not level:
+                break
+        return changed
+
+    @property
+    def n_rules(self):
+        return sum(len(consequents) for consequents in self.rules.values())
+
+    def add_profile(self, profile_id):
+        """Rien à faire : les effectifs sont mis à jour cas par cas par add_case"""
+
+    def stats(self):
+        """Compteurs exposés par /health"""
+        return {
+            "rules": self.n_rules,
+            "tracked_itemsets": len(self.supports),
+            "cases": self.total,
+            "min_count": self.min_count,
+            "tracking_count": self.lower_count,
+            "full_minings": self.mined_count,
+            "incremental_updates": self.updated_count,
+        }
+
+    def matching_rules(self, symptoms):
+        """Règles dont l'antécédent est inclus dans les symptômes, par consultation de l'index
+
+        Les sous-ensembles de la requête (C(n, ≤ longueur maximale)) sont
+        cherchés dans l'index, sauf s'ils sont plus nombreux que ses
+        antécédents : l'index est alors parcouru une fois.
+        """
+        symptom_ids = self.case_base.symptom_ids
+        known = sorted({symptom_ids[s] for s in symptoms if s in symptom_ids})
+        max_size = min(len(known), self.max_antecedent)
+        n_subsets = sum(math.comb(len(known), size) for size in range(1, max_size + 1))
+        if n_subsets > len(self.rules):
+            # Longue requête : moins d'antécédents dans l'index que de sous-ensembles à essayer
+            query = frozenset(known)
+            for antecedent, rules in list(self.rules.items()):
+                if antecedent <= query:
+                    for rule in rules:
+                        yield tuple(sorted(antecedent)), rule
+            return
+        for size in range(1, max_size + 1):
+            for antecedent in combinations(known, size):
+                for rule in self.rules.get(frozenset(antecedent), ()):
+                    yield antecedent, rule
+
+    def metrics(self, rule):
+        """Support et lift d'une règle de l'index pour le nombre de cas courant"""
+        code, confidence, count = rule
+        diagnostic_count = self.supports[frozenset((~code,))]
+        return count / self.total, confidence * self.total / diagnostic_count
+
+    def average_scores(self, symptoms, weights=None):
+        """Retourne les couples (diagnostic, confiance de la meilleure règle applicable)
+
+        À confiance égale, la règle la plus spécifique puis la plus fréquente
+        l'emporte. Les règles portent sur les effectifs : `weights` est ignoré.
+        """
+        best = {}
+        for antecedent, (code, confidence, count) in self.matching_rules(symptoms):
+            key = (confidence, len(antecedent), count)
+            if code not in best or key > best[code]:
+                best[code] = key
+        diagnostics = self.case_base.diagnostics
+        return [
+            (diagnostics[code], key[0])
+            for code, key in sorted(best.items(), key=lambda item: item[1], reverse=True)
+        ]
+
+    def average_scores_batch(self, symptom_lists, weights=None):
+        """Scores de plusieurs requêtes, dans l'ordre d'entrée"""
+        return [self.average_scores(symptoms) for symptoms in symptom_lists]
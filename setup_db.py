@@ -1,13 +1,12 @@
 import os
 import sqlite3
 import random
-from faker import Faker
 from datetime import datetime, timedelta
 
-os.makedirs("data/raw", exist_ok=True)
-db_path = "data/raw/medical_data.db"
+from db_schema import SymptomEncoder, create_symptom_tables, finalize_schema, migrate_database, table_exists
+
+DB_PATH = "data/raw/medical_data.db"
 
-fake = Faker('fr_FR')
 diagnosisSymptomsMap = {
     "grippe": ["fièvre", "toux", "fatigue", "courbatures"],
     "COVID-19": ["fièvre", "toux sèche", "perte d’odorat", "fatigue"],
@@ -21,48 +20,73 @@ diagnosisSymptomsMap = {
 }
 medicationsList = ["paracétamol", "ibuprofène", "doliprane", "amoxicilline", "ventoline"]
 
-conn = sqlite3.connect(db_path)
-cur = conn.cursor()
-
-cur.execute("""
-CREATE TABLE IF NOT EXISTS patients (
-    id TEXT PRIMARY KEY,
-    age INTEGER,
-    diagnostic TEXT,
-    date_consultation TEXT
-)
-""")
-
-cur.execute("""
-CREATE TABLE IF NOT EXISTS symptoms (
-    patient_id TEXT,
-    symptom TEXT
-)
-""")
-
-cur.execute("""
-CREATE TABLE IF NOT EXISTS medications (
-    patient_id TEXT,
-    medication TEXT
-)
-""")
-
-for i in range(1, 51):
-    pid = f"P{str(i).zfill(3)}"
-    age = random.randint(18, 90)
-    diagnosis = random.choice(list(diagnosisSymptomsMap.keys()))
-    date = (datetime.now() - timedelta(days=random.randint(0, 365))).isoformat()
-    cur.execute("INSERT INTO patients VALUES (?, ?, ?, ?)", (pid, age, diagnosis, date))
-
-    symptoms = random.sample(diagnosisSymptomsMap[diagnosis], k=random.randint(2, 4))
-    for s in symptoms:
-        cur.execute("INSERT INTO symptoms VALUES (?, ?)", (pid, s))
-
-    meds = random.sample(medicationsList, k=random.randint(1, 3))
-    for m in meds:
-        cur.execute("INSERT INTO medications VALUES (?, ?)", (pid, m))
-
-conn.commit()
-conn.close()
-
-print("✅ Base de données SQLite générée dans data/raw/medical_data.db")
+
+def setup_database(db_path=DB_PATH, num_patients=50):
+    """Ajoute des patients d'exemple à la base, au schéma normalisé (symptômes codés)
+
+    Une base existante à un ancien schéma est d'abord migrée : ce script
+    est lancé explicitement, contrairement au chargement de l'application.
+    """
+    os.makedirs(os.path.dirname(db_path) or '.', exist_ok=True)
+    conn = sqlite3.connect(db_path)
+    try:
+        existing = table_exists(conn, 'patients')
+    finally:
+        conn.close()
+    if existing:
+        migrate_database(db_path)
+
+    conn = sqlite3.connect(db_path)
+    cur = conn.cursor()
+
+    cur.execute("""
+    CREATE TABLE IF NOT EXISTS patients (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        age INTEGER NOT NULL,
+        diagnostic TEXT NOT NULL,
+        date_consultation TEXT NOT NULL
+    )
+    """)
+
+    # Les bases créées par app.py n'ont pas de date de consultation
+    columns = {row[1] for row in cur.execute("PRAGMA table_info(patients)")}
+    if 'date_consultation' not in columns:
+        cur.execute("ALTER TABLE patients ADD COLUMN date_consultation TEXT")
+
+    create_symptom_tables(conn)
+
+    cur.execute("""
+    CREATE TABLE IF NOT EXISTS medications (
+        patient_id INTEGER NOT NULL,
+        medication TEXT NOT NULL,
+        FOREIGN KEY(patient_id) REFERENCES patients(id)
+    )
+    """)
+
+    encoder = SymptomEncoder(conn)
+    for _ in range(num_patients):
+        age = random.randint(18, 90)
+        diagnosis = random.choice(list(diagnosisSymptomsMap.keys()))
+        date = (datetime.now() - timedelta(days=random.randint(0, 365))).strftime("%Y-%m-%d")
+        pid = cur.execute(
+            "INSERT INTO patients (age, diagnostic, date_consultation) VALUES (?, ?, ?)", (age, diagnosis, date)
+        ).lastrowid
+
+        symptoms = random.sample(diagnosisSymptomsMap[diagnosis], k=random.randint(2, len(diagnosisSymptomsMap[diagnosis])))
+        cur.executemany(
+            "INSERT OR IGNORE INTO patient_symptoms (patient_id, symptom_id) VALUES (?, ?)",
+            encoder.rows((pid, s) for s in symptoms)
+        )
+
+        meds = random.sample(medicationsList, k=random.randint(1, 3))
+        cur.executemany("INSERT INTO medications (patient_id, medication) VALUES (?, ?)", ((pid, m) for m in meds))
+
+    # Index, vue `symptoms` et compteur d'écritures, puis version du schéma
+    finalize_schema(conn)
+    conn.commit()
+    conn.close()
+
+
+if __name__ == '__main__':
+    setup_database()
+    print(f"✅ Base de données SQLite générée dans {DB_PATH}")
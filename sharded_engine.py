@@ -0,0 +1,235 @@
+import logging
+import multiprocessing
+import os
+import threading
+import weakref
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from multiprocessing import shared_memory
+
+import numpy as np
+
+from case_base import popcount
+
+logger = logging.getLogger(__name__)
+
+# Tableaux d'un shard placés en mémoire partagée : profils de la tranche,
+# effectifs et poids par récence recopiés par le coordinateur quand ils changent
+SHARD_ARRAYS = ('bits', 'profile_sizes', 'profile_diagnostics', 'counts', 'recency')
+
+# Tableaux attachés par le processus d'un shard : nom -> (segment, tableau)
+_shard = {}
+
+
+def _attach(specs):
+    """Initialisation du processus d'un shard : projection de ses segments de mémoire partagée"""
+    for name, (segment_name, dtype, shape) in specs.items():
+        segment = shared_memory.SharedMemory(name=segment_name)
+        _shard[name] = (segment, np.ndarray(shape, dtype=dtype, buffer=segment.buf))
+
+
+def partial_scores(bits, profile_sizes, profile_diagnostics, weights, queries, n_codes, first_id=0):
+    """Sommes et poids des similarités par diagnostic sur une tranche de profils
+
+    Retourne pour chaque requête (masque, nombre de symptômes) les tableaux
+    (sommes, poids, premier profil correspondant) indexés par code de
+    diagnostic ; les profils sont numérotés à partir de `first_id`.
+    """
+    results = []
+    for mask, n_input in queries:
+        intersections = np.zeros(bits.shape[1], dtype=np.int32)
+        for word in np.flatnonzero(mask[:bits.shape[0]]):
+            intersections += popcount(bits[word] & mask[word])
+        profile_ids = np.flatnonzero(intersections)
+        matched = intersections[profile_ids]
+        similarities = matched / (profile_sizes[profile_ids] + n_input - matched)
+        keys = profile_diagnostics[profile_ids]
+        profile_weights = weights[profile_ids]
+        first_seen = np.full(n_codes, np.iinfo(np.int64).max, dtype=np.int64)
+        np.minimum.at(first_seen, keys, profile_ids + first_id)
+        results.append((
+            np.bincount(keys, weights=similarities * profile_weights, minlength=n_codes),
+            np.bincount(keys, weights=profile_weights, minlength=n_codes),
+            first_seen,
+        ))
+    return results
+
+
+def _score_shard(queries, n_codes, first_id, weighting):
+    # Exécuté dans le processus du shard, sur ses tableaux partagés
+    return partial_scores(
+        _shard['bits'][1], _shard['profile_sizes'][1], _shard['profile_diagnostics'][1],
+        _shard[weighting][1], queries, n_codes, first_id,
+    )
+
+
+def _release(segments, owner):
+    # Le créateur supprime les segments ; les vues numpy encore vivantes gardent la projection
+    for segment in segments:
+        try:
+            segment.close()
+        except BufferError:
+            pass
+        if os.getpid() == owner:
+            try:
+                segment.unlink()
+            except FileNotFoundError:
+                pass
+
+
+class ShardedEngine:
+    """Moteur de diagnostic réparti sur plusieurs processus, un par tranche de profils
+
+    Chaque shard reçoit une tranche contiguë des profils en mémoire partagée
+    et retourne, par diagnostic, la somme des similarités et la somme des
+    poids ; le coordinateur les additionne et obtient les mêmes moyennes
+    que les autres moteurs. Les profils ajoutés après la construction sont
+    évalués dans le processus du coordinateur.
+    """
+
+    def __init__(self, case_base, n_shards):
+        self.case_base = case_base
+        self.n_shards = n_shards
+        # Profils répartis entre les shards ; les suivants sont évalués localement
+        self.n_sharded = case_base.n_profiles
+        bounds = np.linspace(0, self.n_sharded, n_shards + 1).astype(np.int64)
+        self.bounds = list(zip(bounds[:-1].tolist(), bounds[1:].tolist()))
+
+        self.shards = []
+        segments = []
+        for lo, hi in self.bounds:
+            arrays = {
+                'bits': case_base.bits[:, lo:hi],
+                'profile_sizes': case_base.profile_sizes[lo:hi],
+                'profile_diagnostics': case_base.profile_diagnostics[lo:hi],
+                'counts': case_base.profile_counts[lo:hi].astype(np.float64),
+                'recency': np.zeros(hi - lo),
+            }
+            shard = {}
+            for name in SHARD_ARRAYS:
+                array = np.ascontiguousarray(arrays[name])
+                segment = shared_memory.SharedMemory(create=True, size=max(array.nbytes, 1))
+                view = np.ndarray(array.shape, dtype=array.dtype, buffer=segment.buf)
+                view[...] = array
+                segments.append(segment)
+                shard[name] = (segment.name, array.dtype.str, array.shape, view)
+            self.shards.append(shard)
+        self._finalizer = weakref.finalize(self, _release, segments, os.getpid())
+
+        # Processus des shards, démarrés au premier appel dans chaque processus
+        # (les workers gunicorn créent les leurs après le fork)
+        self._executors = None
+        self._pid = None
+        # Sérialise la création des processus et les appels aux shards : une
+        # requête ne réécrit pas les tableaux partagés pendant que les shards
+        # calculent ceux d'une autre
+        self._lock = threading.Lock()
+        # État de la base et poids recopiés dans les shards
+        self._synced_counts = None
+        self._synced_recency = None
+        logger.info(
+            f"Moteur réparti: {self.n_sharded} profils en {n_shards} shards, "
+            f"{sum(segment.size for segment in segments) / 1e6:.1f} Mo partagés"
+        )
+
+    def _get_executors(self):
+        # Appelé avec _lock : un seul jeu de processus par processus coordinateur
+        if self._pid != os.getpid():
+            # forkserver : pas de fork d'un processus serveur multi-thread
+            methods = multiprocessing.get_all_start_methods()
+            context = multiprocessing.get_context('forkserver' if 'forkserver' in methods else 'spawn')
+            self._executors = [
+                ProcessPoolExecutor(
+                    max_workers=1, mp_context=context, initializer=_attach,
+                    initargs=({name: spec[:3] for name, spec in shard.items()},),
+                )
+                for shard in self.shards
+            ]
+            self._pid = os.getpid()
+            weakref.finalize(self, _shutdown, self._executors)
+        return self._executors
+
+    def _sync(self, weights):
+        """Recopie dans les shards les effectifs ou les poids par récence s'ils ont changé (appelé avec _lock)"""
+        case_base = self.case_base
+        if weights is None:
+            state = (len(case_base.case_profiles), case_base.n_retired)
+            if state != self._synced_counts:
+                for (lo, hi), shard in zip(self.bounds, self.shards):
+                    shard['counts'][3][...] = case_base.profile_counts[lo:hi]
+                self._synced_counts = state
+            return 'counts'
+        if weights is not self._synced_recency:
+            padded = np.zeros(self.n_sharded)
+            padded[:min(len(weights), self.n_sharded)] = weights[:self.n_sharded]
+            for (lo, hi), shard in zip(self.bounds, self.shards):
+                shard['recency'][3][...] = padded[lo:hi]
+            self._synced_recency = weights
+        return 'recency'
+
+    def add_profile(self, profile_id):
+        """Rien à faire : les profils ajoutés sont évalués par le coordinateur"""
+
+    def average_scores(self, symptoms, weights=None):
+        """Retourne les couples (diagnostic, similarité de Jaccard moyenne) des cas correspondants"""
+        return self.average_scores_batch([symptoms], weights)[0]
+
+    def average_scores_batch(self, symptom_lists, weights=None):
+        """Scores moyens de plusieurs requêtes : une tâche par shard pour tout le lot"""
+        case_base = self.case_base
+        if not symptom_lists:
+            return []
+        queries = [case_base.query_mask(symptoms) for symptoms in symptom_lists]
+        # Matrice lue une seule fois : des profils peuvent être ajoutés pendant le calcul
+        bits = case_base.bits
+        n_codes = len(case_base.diagnostics)
+
+        # Profils ajoutés depuis la répartition, évalués par le coordinateur
+        tail = slice(self.n_sharded, bits.shape[1])
+        if weights is None:
+            tail_weights = case_base.profile_counts[tail]
+        else:
+            # Poids nul pour un profil plus récent que les poids fournis
+            tail_weights = np.zeros(bits.shape[1] - self.n_sharded)
+            known = weights[tail]
+            tail_weights[:len(known)] = known
+        partials = [partial_scores(
+            bits[:, tail], case_base.profile_sizes[tail], case_base.profile_diagnostics[tail],
+            tail_weights, queries, n_codes, self.n_sharded,
+        )]
+
+        with self._lock:
+            weighting = self._sync(weights)
+            executors = self._get_executors()
+            try:
+                futures = [
+                    executor.submit(_score_shard, queries, n_codes, lo, weighting)
+                    for executor, (lo, hi) in zip(executors, self.bounds)
+                ]
+                partials.extend(future.result() for future in futures)
+            except BrokenProcessPool:
+                # Un shard a été tué : les processus restants sont arrêtés et
+                # tous recréés à l'appel suivant
+                _shutdown(executors)
+                self._executors = None
+                self._pid = None
+                raise
+
+        diagnostics = case_base.diagnostics
+        results = []
+        for position in range(len(queries)):
+            sums = sum(partial[position][0] for partial in partials)
+            counts = sum(partial[position][1] for partial in partials)
+            first_seen = np.minimum.reduce([partial[position][2] for partial in partials])
+            # Diagnostics dans l'ordre de leur premier profil, comme un parcours complet
+            order = np.flatnonzero(counts)
+            order = order[np.argsort(first_seen[order], kind='stable')]
+            results.append([
+                (diagnostics[code], float(sums[code] / counts[code])) for code in order
+            ])
+        return results
+
+
+def _shutdown(executors):
+    for executor in executors:
+        executor.shutdown(wait=False)
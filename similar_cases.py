@@ -0,0 +1,204 @@
+import logging
+import threading
+import time
+
+import numpy as np
+
+from case_base import popcount
+
+logger = logging.getLogger(__name__)
+
+# Découpage des signatures MinHash : BANDS bandes de ROWS valeurs. Deux profils
+# de similarité s sont candidats avec une probabilité 1 - (1 - s^ROWS)^BANDS
+# (seuil d'environ (1 / BANDS)^(1 / ROWS), soit 0,5 par défaut)
+BANDS = 16
+ROWS = 4
+# Nombre maximal de candidats réordonnés par le Jaccard exact
+MAX_CANDIDATES = 10000
+# Nombre de profils ajoutés avant fusion dans les tables triées
+PENDING_MERGE_SIZE = 1024
+# Nombre de profils dont les signatures sont calculées à la fois (borne la mémoire)
+SIGNATURE_CHUNK = 16384
+
+# Hachage universel h(x) = (a * x + b) mod p des identifiants de symptômes
+_PRIME = np.uint64((1 << 31) - 1)
+# Signature d'un profil sans symptôme, hors des valeurs de hachage possibles
+_EMPTY = np.uint32(_PRIME)
+
+
+class SimilarCaseIndex:
+    """Recherche approchée des cas les plus similaires : signatures MinHash et LSH par bandes
+
+    Chaque profil est résumé par les clés de ses bandes de signature ; une
+    table triée par bande donne en une recherche dichotomique les profils
+    qui partagent la clé de la requête. Les candidats sont ensuite classés
+    par le coefficient de Jaccard exact, calculé sur la matrice de bits
+    comme dans les moteurs de diagnostic.
+    """
+
+    def __init__(self, case_base, bands=BANDS, rows=ROWS, seed=1):
+        self.case_base = case_base
+        self.bands = bands
+        self.rows = rows
+        rng = np.random.default_rng(seed)
+        n_hashes = bands * rows
+        self._a = rng.integers(1, int(_PRIME), n_hashes, dtype=np.uint64)[:, np.newaxis]
+        self._b = rng.integers(0, int(_PRIME), n_hashes, dtype=np.uint64)[:, np.newaxis]
+        # Multiplicateurs impairs combinant les valeurs d'une bande en une clé
+        self._mix = rng.integers(1, 1 << 63, (bands, rows), dtype=np.uint64) | np.uint64(1)
+
+        started = time.perf_counter()
+        keys = self._profile_keys(np.arange(case_base.n_profiles))
+        order = np.argsort(keys, axis=1).astype(np.int32)
+        # État publié d'un bloc : (clés triées, profils correspondants, profils
+        # en attente de fusion, clés en attente), chaque tableau ayant une ligne par bande
+        self._state = (
+            np.take_along_axis(keys, order, axis=1), order,
+            np.empty(0, dtype=np.int32), np.empty((bands, 0), dtype=np.uint32),
+        )
+        self._lock = threading.Lock()
+        logger.info(
+            f"Index MinHash construit: {case_base.n_profiles} profils, {bands} bandes de {rows} "
+            f"en {time.perf_counter() - started:.3f} s"
+        )
+
+    def _band_keys(self, signatures):
+        """Clés de bande (bandes, profils) d'une matrice de signatures (hachages, profils)"""
+        signatures = signatures.reshape(self.bands, self.rows, -1)
+        # Les multiplications débordent volontairement (arithmétique modulo 2^64) ;
+        # les 32 bits de poids fort suffisent, les candidats étant vérifiés ensuite
+        mixed = (signatures.astype(np.uint64) * self._mix[:, :, np.newaxis]).sum(axis=1, dtype=np.uint64)
+        return (mixed >> np.uint64(32)).astype(np.uint32)
+
+    def _hashes(self, symptom_ids):
+        """Valeurs de hachage (hachages, symptômes) des identifiants de symptômes"""
+        symptom_ids = np.asarray(symptom_ids, dtype=np.uint64)
+        return ((self._a * symptom_ids + self._b) % _PRIME).astype(np.uint32)
+
+    def _profile_keys(self, profile_ids):
+        case_base = self.case_base
+        indptr = case_base.indptr
+        indices = case_base.indices
+        keys = np.empty((self.bands, len(profile_ids)), dtype=np.uint32)
+        if len(profile_ids) == 0:
+            return keys
+        # Hachages de tout le vocabulaire, puis un minimum par rang de symptôme
+        # dans le profil : les profils sont courts, la boucle l'est aussi
+        table = self._hashes(np.arange(len(case_base.symptoms)))
+        for start in range(0, len(profile_ids), SIGNATURE_CHUNK):
+            chunk = profile_ids[start:start + SIGNATURE_CHUNK]
+            begins = indptr[chunk]
+            sizes = case_base.profile_sizes[chunk].astype(np.int64)
+            # Un profil sans symptôme garde une signature neutre et n'est jamais candidat
+            signatures = np.full((len(self._a), len(chunk)), _EMPTY, dtype=np.uint32)
+            non_empty = np.flatnonzero(sizes)
+            begins = begins[non_empty]
+            last = sizes[non_empty] - 1
+            if len(non_empty):
+                signature = table[:, indices[begins]]
+                # Au-delà de sa taille, un profil relit son dernier symptôme
+                for rank in range(1, int(last.max()) + 1):
+                    np.minimum(
+                        signature, table[:, indices[begins + np.minimum(rank, last)]], out=signature
+                    )
+                signatures[:, non_empty] = signature
+            keys[:, start:start + len(chunk)] = self._band_keys(signatures)
+        return keys
+
+    def _query_keys(self, symptom_ids):
+        return self._band_keys(self._hashes(symptom_ids).min(axis=1, keepdims=True))[:, 0]
+
+    def add_profile(self, profile_id):
+        """Ajoute un nouveau profil ; les ajouts sont fusionnés dans les tables par paquets"""
+        with self._lock:
+            sorted_keys, order, pending_ids, pending_keys = self._state
+            keys = self._profile_keys(np.array([profile_id]))
+            pending_ids = np.append(pending_ids, np.int32(profile_id))
+            pending_keys = np.concatenate([pending_keys, keys], axis=1)
+            if len(pending_ids) >= PENDING_MERGE_SIZE:
+                sorted_keys, order = self._merge(sorted_keys, order, pending_ids, pending_keys)
+                pending_ids = np.empty(0, dtype=np.int32)
+                pending_keys = np.empty((self.bands, 0), dtype=np.uint32)
+            self._state = (sorted_keys, order, pending_ids, pending_keys)
+
+    def _merge(self, sorted_keys, order, pending_ids, pending_keys):
+        # Insertion des clés en attente à leur place, bande par bande, en O(profils)
+        merged_keys = []
+        merged_order = []
+        for band in range(self.bands):
+            by_key = np.argsort(pending_keys[band], kind='stable')
+            keys = pending_keys[band][by_key]
+            positions = np.searchsorted(sorted_keys[band], keys, side='right')
+            merged_keys.append(np.insert(sorted_keys[band], positions, keys))
+            merged_order.append(np.insert(order[band], positions, pending_ids[by_key]))
+        return np.array(merged_keys), np.array(merged_order)
+
+    def candidates(self, symptom_ids, bands=None):
+        """Profils partageant au moins une des `bands` premières bandes de la requête, et leur nombre de bandes communes"""
+        sorted_keys, order, pending_ids, pending_keys = self._state
+        bands = self.bands if bands is None else bands
+        query_keys = self._query_keys(symptom_ids)
+        matches = []
+        for band in range(bands):
+            key = query_keys[band]
+            left = np.searchsorted(sorted_keys[band], key, side='left')
+            right = np.searchsorted(sorted_keys[band], key, side='right')
+            matches.append(order[band, left:right])
+            if len(pending_ids):
+                matches.append(pending_ids[pending_keys[band] == key])
+        if not matches:
+            return np.empty(0, dtype=np.int32), np.empty(0, dtype=np.int64)
+        return np.unique(np.concatenate(matches), return_counts=True)
+
+    def similarities(self, symptoms, profile_ids=None):
+        """Jaccard exact de la requête avec les profils donnés (tous par défaut), comme les moteurs de diagnostic"""
+        case_base = self.case_base
+        bits = case_base.bits
+        mask, n_input = case_base.query_mask(symptoms)
+        columns = slice(None) if profile_ids is None else profile_ids
+        if profile_ids is None:
+            profile_ids = np.arange(bits.shape[1])
+        intersections = np.zeros(len(profile_ids), dtype=np.int32)
+        for word in np.flatnonzero(mask[:bits.shape[0]]):
+            intersections += popcount(bits[word, columns] & mask[word])
+        unions = case_base.profile_sizes[profile_ids] + n_input - intersections
+        return profile_ids, intersections / np.maximum(unions, 1)
+
+    def top_k(self, profile_ids, similarities, k):
+        """Les k profils les plus similaires encore représentés par des cas, par similarité décroissante"""
+        case_base = self.case_base
+        counts = case_base.profile_counts
+        keep = (similarities > 0) & (profile_ids < len(counts))
+        keep[keep] = counts[profile_ids[keep]] > 0
+        profile_ids = profile_ids[keep]
+        similarities = similarities[keep]
+        # À similarité égale, le profil le plus ancien d'abord
+        ranked = np.lexsort((profile_ids, -similarities))[:k]
+        return profile_ids[ranked], similarities[ranked]
+
+    def search(self, symptoms, k, bands=None, max_candidates=MAX_CANDIDATES):
+        """Cas les plus similaires à la requête : (profils, similarités, nombre de candidats)
+
+        Moins de bandes sondées ou moins de candidats réordonnés réduisent
+        la latence au prix du rappel.
+        """
+        case_base = self.case_base
+        symptom_ids = [
+            case_base.symptom_ids[symptom] for symptom in set(symptoms)
+            if symptom in case_base.symptom_ids
+        ]
+        if not symptom_ids:
+            return np.empty(0, dtype=np.int32), np.empty(0), 0
+        profile_ids, shared = self.candidates(symptom_ids, bands)
+        n_candidates = len(profile_ids)
+        if n_candidates > max_candidates:
+            # Les candidats partageant le plus de bandes sont les plus similaires en espérance
+            profile_ids = profile_ids[np.argsort(-shared, kind='stable')[:max_candidates]]
+        profile_ids, similarities = self.similarities(symptoms, profile_ids)
+        profile_ids, similarities = self.top_k(profile_ids, similarities, k)
+        return profile_ids, similarities, n_candidates
+
+    def exact_search(self, symptoms, k):
+        """Référence exacte par force brute sur tous les profils : (profils, similarités)"""
+        profile_ids, similarities = self.similarities(symptoms)
+        return self.top_k(profile_ids, similarities, k)
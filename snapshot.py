@@ -0,0 +1,164 @@
+import json
+import logging
+import mmap
+import os
+import sqlite3
+import struct
+import zlib
+from datetime import datetime
+
+import numpy as np
+
+from case_base import CaseBase
+from db_schema import database_version
+from medications import MedicationIndex
+
+logger = logging.getLogger(__name__)
+
+# En-tête : signature, version du format, CRC32 (métadonnées + tableaux), taille des métadonnées
+MAGIC = b'ESCASEDB'
+FORMAT_VERSION = 4
+HEADER = struct.Struct('<8sIIQ')
+ALIGNMENT = 64
+
+# Tableaux de la base compacte enregistrés dans l'instantané
+ARRAYS = ('profile_diagnostics', 'profile_counts', 'indptr', 'indices', 'case_profiles', 'bits', 'case_days')
+
+
+def source_signature(paths, databases=()):
+    """Signature des sources (None pour une source absente)
+
+    Fichiers : taille et date de modification. Bases SQLite : fichier
+    (inode), version du schéma et compteur d'écritures des patients, et non
+    la date du fichier ni celle du journal -wal, que les simples lectures
+    créent, suppriment et font écrire par les checkpoints.
+
+    À relever avant le chargement : une modification pendant la lecture rend
+    ainsi l'instantané périmé au démarrage suivant.
+    """
+    signature = {}
+    for path in paths:
+        try:
+            stat = os.stat(path)
+            signature[path] = [stat.st_mtime_ns, stat.st_size]
+        except FileNotFoundError:
+            signature[path] = None
+    for path in databases:
+        signature[path] = database_signature(path)
+    return signature
+
+
+def database_signature(path):
+    """[inode, version du schéma, compteur d'écritures] d'une base SQLite (None si elle est absente)"""
+    try:
+        inode = os.stat(path).st_ino
+    except FileNotFoundError:
+        return None
+    conn = sqlite3.connect(path, timeout=30)
+    try:
+        return [inode, *database_version(conn)]
+    finally:
+        conn.close()
+
+
+def _align(offset):
+    return -(-offset // ALIGNMENT) * ALIGNMENT
+
+
+def write_snapshot(case_base, path, signature, normalization=None):
+    """Écrit l'instantané de la base de cas de façon atomique (fichier temporaire puis rename)
+
+    `normalization` : version de la normalisation des symptômes appliquée au chargement.
+    """
+    arrays = {name: np.ascontiguousarray(getattr(case_base, name)) for name in ARRAYS}
+    descriptors = {}
+    offset = 0
+    for name, array in arrays.items():
+        descriptors[name] = {
+            "dtype": array.dtype.str,
+            "shape": list(array.shape),
+            "offset": offset,
+        }
+        offset = _align(offset + array.nbytes)
+
+    metadata = json.dumps({
+        "created_at": datetime.now().isoformat(),
+        "sources": signature,
+        "normalization": normalization,
+        "symptoms": case_base.symptoms,
+        "diagnostics": case_base.diagnostics,
+        "medications": case_base.medications.rows(),
+        "arrays": descriptors,
+    }, ensure_ascii=False).encode('utf-8')
+    data_start = _align(HEADER.size + len(metadata))
+
+    # Les tableaux sont alignés : le remplissage fait partie de la somme de contrôle
+    crc = zlib.crc32(metadata)
+    chunks = [b'\0' * (data_start - HEADER.size - len(metadata))]
+    position = 0
+    for name, array in arrays.items():
+        chunks.append(b'\0' * (descriptors[name]["offset"] - position))
+        chunks.append(array.tobytes())
+        position = descriptors[name]["offset"] + array.nbytes
+    for chunk in chunks:
+        crc = zlib.crc32(chunk, crc)
+
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    temp_path = f"{path}.{os.getpid()}.tmp"
+    try:
+        with open(temp_path, 'wb') as f:
+            f.write(HEADER.pack(MAGIC, FORMAT_VERSION, crc, len(metadata)))
+            f.write(metadata)
+            for chunk in chunks:
+                f.write(chunk)
+        os.replace(temp_path, path)
+    except Exception:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+    logger.info(f"Instantané de la base de cas écrit: {path} ({os.path.getsize(path)} octets)")
+
+
+def load_snapshot(path, signature, normalization=None):
+    """Projette l'instantané en mémoire (mmap) ; retourne None s'il est absent, invalide ou périmé"""
+    if not os.path.exists(path):
+        return None
+    try:
+        with open(path, 'rb') as f:
+            buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        magic, version, crc, metadata_size = HEADER.unpack_from(buffer, 0)
+        if magic != MAGIC or version != FORMAT_VERSION:
+            logger.info(f"Instantané ignoré: format inconnu ({path})")
+            return None
+        if zlib.crc32(memoryview(buffer)[HEADER.size:]) != crc:
+            logger.warning(f"Instantané ignoré: somme de contrôle invalide ({path})")
+            return None
+
+        metadata = json.loads(buffer[HEADER.size:HEADER.size + metadata_size].decode('utf-8'))
+        if metadata["sources"] != signature:
+            logger.info("Instantané périmé par rapport à la base SQLite ou au fichier JSON")
+            return None
+        if metadata["normalization"] != normalization:
+            logger.info("Instantané périmé: la normalisation des symptômes a changé")
+            return None
+
+        data_start = _align(HEADER.size + metadata_size)
+        arrays = {}
+        for name in ARRAYS:
+            descriptor = metadata["arrays"][name]
+            dtype = np.dtype(descriptor["dtype"])
+            shape = tuple(descriptor["shape"])
+            # Tableaux en lecture seule, adossés au fichier projeté
+            arrays[name] = np.frombuffer(
+                buffer, dtype=dtype, count=int(np.prod(shape)),
+                offset=data_start + descriptor["offset"]
+            ).reshape(shape)
+
+        case_base = CaseBase(metadata["symptoms"], metadata["diagnostics"], **arrays)
+        case_base.medications = MedicationIndex.from_rows(*metadata["medications"])
+        logger.info(f"Base de cas chargée depuis l'instantané {path}: {len(case_base)} cas")
+        return case_base
+    except Exception as e:
+        logger.warning(f"Instantané illisible, chargement complet: {str(e)}")
+        return None
@@ -0,0 +1,98 @@
+import logging
+import threading
+from bisect import bisect_left, bisect_right
+
+import numpy as np
+
+from normalization import SYNONYMS, fold
+
+logger = logging.getLogger(__name__)
+
+# Nombre de suggestions retournées par défaut
+SUGGESTIONS = 10
+# Borne supérieure des chaînes commençant par un préfixe donné
+_PREFIX_END = chr(0x10FFFF)
+
+
+class SymptomSuggester:
+    """Complétion des symptômes par préfixe, classée par nombre de cas
+
+    Les noms des symptômes (et les synonymes qui y renvoient) sont ramenés
+    à leur forme normalisée puis triés : les entrées commençant par un
+    préfixe forment une tranche contiguë, trouvée par deux recherches
+    dichotomiques. Les nombres de cas de chaque symptôme sont tenus à jour
+    lors des ajouts et retraits de cas.
+    """
+
+    def __init__(self, case_base, synonyms=SYNONYMS):
+        self.case_base = case_base
+        self.aliases = {fold(alias): fold(canonical) for alias, canonical in synonyms.items()}
+        # Nombre de cas de chaque symptôme : effectif des profils qui le contiennent
+        sizes = np.diff(case_base.indptr)
+        self.frequencies = np.bincount(
+            case_base.indices,
+            weights=np.repeat(case_base.profile_counts, sizes),
+            minlength=len(case_base.symptoms),
+        ).astype(np.int64)
+        self._lock = threading.Lock()
+        self._entries = self._build_entries(case_base.symptoms)
+
+    def _build_entries(self, symptoms):
+        """(clés triées, symptôme de chaque clé), publiés d'un bloc"""
+        symptom_ids = {name: i for i, name in enumerate(symptoms)}
+        entries = {fold(name): i for i, name in enumerate(symptoms)}
+        for alias, canonical in self.aliases.items():
+            if canonical in symptom_ids:
+                entries.setdefault(alias, symptom_ids[canonical])
+        keys = sorted(entries)
+        return keys, np.array([entries[key] for key in keys], dtype=np.int32)
+
+    def add_case(self, symptoms, count=1):
+        """Met à jour les nombres de cas après l'ajout (count=-1 : le retrait) d'un cas de la base"""
+        with self._lock:
+            symptom_ids = self.case_base.symptom_ids
+            ids = [symptom_ids[s] for s in set(symptoms) if s in symptom_ids]
+            if ids and max(ids) >= len(self.frequencies):
+                # Nouveaux symptômes : tableau agrandi et clés reconstruites
+                frequencies = np.zeros(len(self.case_base.symptoms), dtype=np.int64)
+                frequencies[:len(self.frequencies)] = self.frequencies
+                self.frequencies = frequencies
+                self._entries = self._build_entries(list(self.case_base.symptoms))
+            self.frequencies[ids] += count
+
+    def remove_case(self, symptoms):
+        self.add_case(symptoms, -1)
+
+    def suggest(self, prefix, limit=SUGGESTIONS):
+        """Symptômes dont le nom (ou un synonyme) commence par `prefix`, sans tenir compte des accents"""
+        keys, targets = self._entries
+        frequencies = self.frequencies
+        key = fold(prefix)
+        start = bisect_left(keys, key)
+        end = bisect_right(keys, key + _PREFIX_END, lo=start)
+        matches = targets[start:end]
+        counts = frequencies[matches]
+        # Un symptôme apparaît au plus une fois par synonyme : assez de candidats pour dédoublonner
+        n_candidates = limit + len(self.aliases)
+        positions = np.arange(len(matches))
+        if len(matches) > n_candidates:
+            positions = np.argpartition(-counts, n_candidates)[:n_candidates]
+        # Par nombre de cas décroissant, puis dans l'ordre alphabétique des clés
+        ranked = positions[np.lexsort((positions, -counts[positions]))]
+        suggestions = []
+        seen = set()
+        for i in ranked:
+            if counts[i] <= 0:
+                # Symptômes sans cas (tous retirés) : plus rien à proposer
+                break
+            symptom_id = int(matches[i])
+            if symptom_id in seen:
+                continue
+            seen.add(symptom_id)
+            suggestions.append({
+                "symptom": self.case_base.symptoms[symptom_id],
+                "count": int(counts[i]),
+            })
+            if len(suggestions) == limit:
+                break
+        return suggestions
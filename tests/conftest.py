@@ -0,0 +1,50 @@
+import numpy as np
+import pytest
+
+import data_generator
+from case_base import CaseBase
+from knowledge_base import KnowledgeBaseReloader
+
+SYMPTOMS = [f"s{i}" for i in range(12)]
+DIAGNOSES = ["grippe", "rhume", "migraine"]
+
+
+def random_records(n_cases=300, seed=3, size=3, diagnoses=DIAGNOSES, symptoms=SYMPTOMS):
+    """Cas (diagnostic, symptômes) tirés au hasard, reproductibles"""
+    rng = np.random.default_rng(seed)
+    return [
+        (str(rng.choice(diagnoses)), list(rng.choice(symptoms, size, replace=False)))
+        for _ in range(n_cases)
+    ]
+
+
+@pytest.fixture
+def make_case_base():
+    """Construit une petite base de cas, aléatoire ou à partir de `records`"""
+    def make(records=None, **options):
+        return CaseBase.from_records(random_records(**options) if records is None else records)
+    return make
+
+
+@pytest.fixture
+def db_path(tmp_path):
+    """Base SQLite générée de 200 patients, au schéma normalisé"""
+    path = str(tmp_path / 'cases.db')
+    data_generator.create_sqlite_database(200, path, seed=1)
+    return path
+
+
+@pytest.fixture
+def service(db_path, tmp_path, monkeypatch):
+    """Module app servant la base `db_path`, sans JSON ni instantané"""
+    import app
+
+    monkeypatch.setattr(app, 'DB_PATH', db_path)
+    monkeypatch.setattr(app, 'JSON_PATH', str(tmp_path / 'absent.json'))
+    monkeypatch.setattr(app, 'SNAPSHOT_PATH', '')
+    reloader = KnowledgeBaseReloader(
+        app.load_data, [], databases=[db_path], catch_up=app.sync_cases, prepare=app.prepare_sources
+    )
+    monkeypatch.setattr(app, 'reloader', reloader)
+    assert reloader.get() is not None
+    return app
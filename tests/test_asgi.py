@@ -0,0 +1,55 @@
+import asyncio
+import json
+import threading
+
+import asgi
+
+
+async def call(method, path, payload=None):
+    """Exécute une requête sur l'application ASGI : (statut, corps décodé)"""
+    body = b'' if payload is None else json.dumps(payload).encode()
+    messages = [{'type': 'http.request', 'body': body, 'more_body': False}]
+    sent = []
+
+    async def receive():
+        return messages.pop(0)
+
+    async def send(message):
+        sent.append(message)
+
+    scope = {'type': 'http', 'method': method, 'path': path, 'headers': []}
+    await asgi.app(scope, receive, send)
+    return sent[0]['status'], json.loads(sent[1]['body'])
+
+
+def test_identical_computations_are_coalesced():
+    coalescer = asgi.RequestCoalescer()
+    release = threading.Event()
+    calls = []
+
+    def compute():
+        calls.append(1)
+        release.wait(5)
+        return ["resultat"]
+
+    async def burst():
+        tasks = [asyncio.ensure_future(coalescer.run("cle", compute)) for _ in range(5)]
+        await asyncio.sleep(0.05)
+        release.set()
+        return await asyncio.gather(*tasks)
+
+    assert asyncio.run(burst()) == [["resultat"]] * 5
+    assert len(calls) == 1
+    assert coalescer.stats() == {"in_flight": 0, "computed": 1, "coalesced": 4}
+
+
+def test_asgi_diagnose_matches_flask(service):
+    payload = {"symptoms": ["fatigue", "toux"], "engine": "index"}
+    status, result = asyncio.run(call('POST', '/api/diagnose', payload))
+    assert status == 200
+    expected = service.app.test_client().post('/api/diagnose', json=payload).get_json()
+    assert result["diagnoses"] == expected["diagnoses"]
+
+    assert asyncio.run(call('POST', '/api/diagnose', {"symptoms": "toux"}))[0] == 400
+    assert asyncio.run(call('GET', '/api/diagnose'))[0] == 405
+    assert asyncio.run(call('GET', '/inconnu'))[0] == 404
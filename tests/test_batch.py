@@ -0,0 +1,38 @@
+import pytest
+
+import app as service
+from diagnosis_engine import BitsetEngine, InvertedIndexEngine, rank_diagnoses
+from knowledge_base import KnowledgeBaseReloader
+
+QUERIES = [["s0"], ["s2", "s5", "s9"], [], ["inconnu"], ["s3", "s4", "s7", "s8"]]
+
+
+def test_batch_scores_match_single_queries(make_case_base):
+    case_base = make_case_base()
+    for engine in (BitsetEngine(case_base), InvertedIndexEngine(case_base)):
+        batch = engine.average_scores_batch(QUERIES)
+        assert [rank_diagnoses(scores) for scores in batch] == \
+            [rank_diagnoses(engine.average_scores(query)) for query in QUERIES]
+
+
+@pytest.fixture
+def client(make_case_base, monkeypatch):
+    case_base = make_case_base()
+    monkeypatch.setattr(service, 'reloader', KnowledgeBaseReloader(lambda: case_base, []))
+    return service.app.test_client()
+
+
+def test_batch_endpoint_reports_errors_per_item(client):
+    response = client.post('/api/diagnose/batch', json={"items": [
+        {"symptoms": ["s0", "s1"]}, {"symptoms": "s0"}, {"symptoms": ["s2"]},
+    ]})
+    assert response.status_code == 200
+    results = response.get_json()["results"]
+    assert [result["error"] is None for result in results] == [True, False, True]
+    assert results[2]["diagnoses"] == service.calculate_diagnosis(["s2"], service.reloader.current, 'bitset')
+
+
+def test_batch_endpoint_rejects_oversized_batches(client, monkeypatch):
+    monkeypatch.setattr(service, 'MAX_BATCH_SIZE', 2)
+    response = client.post('/api/diagnose/batch', json={"items": [{"symptoms": ["s0"]}] * 3})
+    assert response.status_code == 413
@@ -0,0 +1,29 @@
+import json
+
+from bench import run
+
+
+def test_compare_flags_regressions_beyond_tolerance():
+    def report(p99_ms, throughput_qps):
+        return {"results": [{
+            "size": 100, "load_seconds": 1.0,
+            "backends": {"bitset/uniform": {"p50_ms": 1.0, "p99_ms": p99_ms, "throughput_qps": throughput_qps}},
+        }]}
+
+    assert run.compare(report(2.2, 1000), report(2.0, 1000), 0.25) == []
+    regressions = run.compare(report(3.0, 700), report(2.0, 1000), 0.25)
+    assert {(r["metric"], r["change"]) for r in regressions} == {("p99_ms", 0.5), ("throughput_qps", 0.3)}
+
+
+def test_small_run_writes_a_report(tmp_path):
+    output = tmp_path / 'latest.json'
+    argv = [
+        '--sizes', '200', '--backends', 'bitset', '--queries', '30', '--http',
+        '--data-dir', str(tmp_path), '--output', str(output), '--baseline', str(tmp_path / 'baseline.json'),
+    ]
+    assert run.main(argv + ['--save-baseline']) == 0
+    result, = json.loads(output.read_text(encoding='utf-8'))["results"]
+    assert result["size"] == 200 and result["backends"]["bitset/uniform"]["queries"] == 30
+    # Seconde exécution comparée à la référence enregistrée
+    assert run.main(argv + ['--tolerance', '1000']) == 0
+    assert json.loads(output.read_text(encoding='utf-8'))["regressions"] == []
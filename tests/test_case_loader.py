@@ -0,0 +1,46 @@
+import io
+import json
+import sqlite3
+
+import data_generator
+from case_base import CaseBaseBuilder
+from case_loader import iter_json_array, iter_sqlite_cases
+from conftest import random_records
+
+
+def test_builder_matches_from_records(make_case_base):
+    records = random_records() + [("rhume", None)]
+    builder = CaseBaseBuilder()
+    for diagnosis, symptoms in records:
+        builder.add(diagnosis, symptoms)
+    built, expected = builder.build(), make_case_base(records)
+    assert built.symptoms == expected.symptoms and built.diagnostics == expected.diagnostics
+    for name in ('profile_diagnostics', 'profile_counts', 'indptr', 'indices', 'case_profiles'):
+        assert list(getattr(built, name)) == list(getattr(expected, name))
+
+
+def test_sqlite_cases_are_grouped_by_patient(tmp_path):
+    path = str(tmp_path / 'cases.db')
+    data_generator.create_sqlite_database(30, path, seed=2)
+    conn = sqlite3.connect(path)
+    try:
+        # Blocs plus petits qu'un patient : les symptômes sont regroupés d'un bloc à l'autre
+        cases = list(iter_sqlite_cases(conn, fetch_size=2))
+        expected = [
+            (diagnosis, sorted(symptoms.split(',')) if symptoms else [], consulted)
+            for diagnosis, symptoms, consulted in conn.execute('''
+                SELECT p.diagnostic, GROUP_CONCAT(s.symptom), p.date_consultation
+                FROM patients p LEFT JOIN symptoms s ON s.patient_id = p.id
+                GROUP BY p.id ORDER BY p.id
+            ''')
+        ]
+    finally:
+        conn.close()
+    assert [(diagnosis, sorted(symptoms), consulted) for diagnosis, symptoms, consulted in cases] == expected
+
+
+def test_json_array_reader_handles_split_items():
+    patients = [{"diagnostic": "grippe", "symptoms": ["fievre"], "age": 1234567}] * 20
+    text = json.dumps({"metadata": {"total": 20}, "patients": patients})
+    # Blocs de 7 caractères : éléments et nombres coupés entre deux lectures
+    assert list(iter_json_array(io.StringIO(text), 'patients', read_size=7)) == patients
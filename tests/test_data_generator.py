@@ -0,0 +1,61 @@
+import inspect
+import json
+import sqlite3
+
+import data_generator
+
+
+def table_rows(path, query):
+    conn = sqlite3.connect(path)
+    try:
+        return conn.execute(query).fetchall()
+    finally:
+        conn.close()
+
+
+def test_bulk_insert_is_chunked_and_reproducible(tmp_path):
+    paths = [str(tmp_path / f'{name}.db') for name in ('a', 'b')]
+    # Lots de 7 patients : le dernier lot est incomplet
+    data_generator.create_sqlite_database(50, paths[0], seed=5, chunk_size=7)
+    data_generator.create_sqlite_database(50, paths[1], seed=5, chunk_size=50)
+
+    assert table_rows(paths[0], 'SELECT COUNT(*), MIN(id), MAX(id) FROM patients') == [(50, 1, 50)]
+    for query in ('SELECT * FROM patients ORDER BY id', 'SELECT * FROM medications ORDER BY rowid'):
+        assert table_rows(paths[0], query) == table_rows(paths[1], query)
+
+
+def test_cli_keeps_existing_files_without_force(tmp_path):
+    db_path, json_path = str(tmp_path / 'cases.db'), tmp_path / 'cases.json'
+    options = ['--db-path', db_path, '--json-path', str(json_path), '--json-patients', '5', '--seed', '1']
+    assert data_generator.main(['--patients', '20', *options]) == 0
+    assert table_rows(db_path, 'PRAGMA journal_mode') == [('wal',)]
+    patients = json.loads(json_path.read_text(encoding='utf-8'))["patients"]
+    assert len(patients) == 5 and patients[0]["symptoms"]
+
+    content = json_path.read_bytes()
+    assert data_generator.main(['--patients', '30', *options]) == 1
+    assert table_rows(db_path, 'SELECT COUNT(*) FROM patients') == [(20,)]
+    assert json_path.read_bytes() == content
+
+    assert data_generator.main(['--patients', '30', '--force', *options]) == 0
+    assert table_rows(db_path, 'SELECT COUNT(*) FROM patients') == [(30,)]
+
+
+def test_app_generator_streams_and_keeps_an_existing_database(tmp_path, monkeypatch):
+    import app
+
+    db_path, json_path = str(tmp_path / 'raw' / 'cases.db'), tmp_path / 'raw' / 'cases.json'
+    monkeypatch.setattr(app, 'DB_PATH', db_path)
+    monkeypatch.setattr(app, 'JSON_PATH', str(json_path))
+    assert inspect.isgenerator(app.generate_medical_data(10, seed=1))
+
+    assert app.create_sqlite_database(20, seed=1)
+    assert not app.create_sqlite_database(30, seed=1)
+    assert table_rows(db_path, 'SELECT COUNT(*) FROM patients') == [(20,)]
+    assert app.create_sqlite_database(30, seed=1, force=True)
+    assert table_rows(db_path, 'SELECT COUNT(*) FROM patients') == [(30,)]
+    assert table_rows(db_path, 'PRAGMA journal_mode') == [('wal',)]
+
+    app.create_json_data(7, seed=2)
+    data = json.loads(json_path.read_text(encoding='utf-8'))
+    assert len(data["patients"]) == data["metadata"]["total_patients"] == 7
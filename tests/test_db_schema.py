@@ -0,0 +1,71 @@
+import sqlite3
+
+import pytest
+
+import setup_db
+from case_loader import iter_sqlite_cases
+from db_schema import SCHEMA_VERSION, get_schema_version, migrate_database, table_exists
+
+OLD_SYMPTOMS = [(1, "fievre"), (1, "toux"), (2, "toux"), (2, "toux"), (3, "nausee")]
+
+
+def create_old_database(path):
+    conn = sqlite3.connect(path)
+    conn.execute('CREATE TABLE patients (id INTEGER PRIMARY KEY, age INTEGER NOT NULL, diagnostic TEXT NOT NULL)')
+    conn.execute('CREATE TABLE symptoms (patient_id INTEGER NOT NULL, symptom TEXT NOT NULL)')
+    conn.executemany('INSERT INTO patients VALUES (?, 40, ?)', [(1, "grippe"), (2, "rhume"), (3, "gastro")])
+    conn.executemany('INSERT INTO symptoms VALUES (?, ?)', OLD_SYMPTOMS)
+    conn.commit()
+    conn.close()
+
+
+def test_migration_encodes_symptoms_once(tmp_path):
+    path = str(tmp_path / 'old.db')
+    create_old_database(path)
+    assert migrate_database(path)
+    assert not migrate_database(path)
+
+    conn = sqlite3.connect(path)
+    try:
+        assert get_schema_version(conn) == SCHEMA_VERSION
+        assert table_exists(conn, 'symptoms', kind='view')
+        assert conn.execute('SELECT COUNT(*) FROM symptom_vocab').fetchone()[0] == 3
+        # La vue de compatibilité restitue les couples, doublons en moins
+        assert sorted(conn.execute('SELECT patient_id, symptom FROM symptoms')) == sorted(set(OLD_SYMPTOMS))
+    finally:
+        conn.close()
+
+
+def test_loading_an_old_database_requires_an_explicit_migration(tmp_path, monkeypatch):
+    import app
+
+    path = str(tmp_path / 'old.db')
+    create_old_database(path)
+    monkeypatch.setattr(app, 'DB_PATH', path)
+    with pytest.raises(RuntimeError, match='db_schema.py'):
+        app.prepare_sources()
+    conn = sqlite3.connect(path)
+    assert get_schema_version(conn) == 0
+    conn.close()
+
+    monkeypatch.setattr(app, 'MIGRATE_SCHEMA', True)
+    app.prepare_sources()
+    conn = sqlite3.connect(path)
+    assert get_schema_version(conn) == SCHEMA_VERSION
+    conn.close()
+
+
+def test_setup_db_writes_the_current_schema(tmp_path):
+    path = str(tmp_path / 'old.db')
+    create_old_database(path)
+    setup_db.setup_database(path, 20)
+    setup_db.setup_database(path, 20)
+
+    conn = sqlite3.connect(path)
+    try:
+        assert get_schema_version(conn) == SCHEMA_VERSION
+        cases = list(iter_sqlite_cases(conn))
+        assert len(cases) == 43 and all(symptoms for _, symptoms, _ in cases)
+        assert conn.execute('SELECT COUNT(DISTINCT patient_id) FROM medications').fetchone()[0] == 40
+    finally:
+        conn.close()
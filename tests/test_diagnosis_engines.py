@@ -0,0 +1,192 @@
+import os
+import signal
+import threading
+import time
+from concurrent.futures.process import BrokenProcessPool
+
+import numpy as np
+import pytest
+
+import sharded_engine
+from app import scan_average_scores
+from conftest import random_records
+from diagnosis_engine import BitsetEngine, InvertedIndexEngine, rank_diagnoses
+from recency import RecencyWeights
+from sharded_engine import ShardedEngine, _shutdown
+
+QUERIES = [["s0"], ["s0", "s1"], ["s2", "s5", "s9"], ["s3", "s4", "s7", "inconnu"], ["inconnu"]]
+
+# Deux diagnostics de même moyenne exacte (5/12) : le parcours complet et
+# bincount n'additionnent pas les similarités dans le même ordre
+TIE_CASES = [
+    ("allergie", ["fievre", "x1", "x2", "x3", "x4"]),
+    ("allergie", ["fievre"]),
+    ("allergie", ["fievre"]),
+    ("allergie", ["fievre"]),
+    ("migraine", ["fievre"]),
+    ("migraine", ["fievre"]),
+    ("migraine", ["fievre"]),
+    ("migraine", ["fievre", "x1", "x2"]),
+    ("migraine", ["fievre", "x1"]),
+]
+TIE_QUERY = ["fievre", "toux"]
+
+
+def test_engines_match_scan(make_case_base):
+    case_base = make_case_base()
+    for engine in (BitsetEngine(case_base), InvertedIndexEngine(case_base)):
+        for query in QUERIES:
+            # Sommes pondérées par profil : égales au parcours au dernier bit près
+            expected = dict(scan_average_scores(query, case_base))
+            assert dict(engine.average_scores(query)) == pytest.approx(expected)
+            assert rank_diagnoses(engine.average_scores(query)) == \
+                rank_diagnoses(scan_average_scores(query, case_base))
+
+
+def test_rank_diagnoses_ties_keep_first_seen_order():
+    score = 0.2593
+    ranked = rank_diagnoses([("allergie", score), ("migraine", np.nextafter(score, 1.0))])
+    assert [d["diagnostic"] for d in ranked] == ["allergie", "migraine"]
+    assert ranked[0]["probability"] == ranked[1]["probability"] == 25.93
+
+
+def test_engines_rank_ties_like_scan(make_case_base):
+    case_base = make_case_base(TIE_CASES)
+    expected = rank_diagnoses(scan_average_scores(TIE_QUERY, case_base))
+    assert [d["diagnostic"] for d in expected] == ["allergie", "migraine"]
+    for engine in (BitsetEngine(case_base), InvertedIndexEngine(case_base)):
+        assert rank_diagnoses(engine.average_scores(TIE_QUERY)) == expected
+
+
+def test_identical_cases_share_a_weighted_profile(make_case_base):
+    case_base = make_case_base([
+        ("grippe", ["s0", "s1", "s0"]), ("rhume", []), ("grippe", ["s1", "s0"]), ("rhume", None),
+    ])
+    assert len(case_base) == 4 and case_base.n_profiles == 2
+    assert list(case_base.profile_counts) == [2, 2]
+    assert list(case_base.case_profiles) == [0, 1, 0, 1]
+    assert list(case_base.profile_sizes) == [2, 0]
+    # Moyenne pondérée par les effectifs : les deux cas grippe comptent
+    assert BitsetEngine(case_base).average_scores(["s1"]) == [("grippe", 0.5)]
+
+
+def sharded_matches_bitset(case_base, n_shards, queries, added=(), weighted=False):
+    """Classements du moteur réparti, identiques à ceux du moteur bitset"""
+    bitset = BitsetEngine(case_base)
+    sharded = ShardedEngine(case_base, n_shards)
+    try:
+        # Profils ajoutés après la répartition : évalués par le coordinateur
+        for diagnosis, case_symptoms in added:
+            profile_id, is_new = case_base.add_case(diagnosis, case_symptoms)
+            if is_new:
+                bitset.add_profile(profile_id)
+                sharded.add_profile(profile_id)
+        options = {"weights": RecencyWeights(case_base).weights()} if weighted else {}
+        results = sharded.average_scores_batch(queries, **options)
+        for query, scores in zip(queries, results):
+            assert dict(scores) == pytest.approx(dict(bitset.average_scores(query, **options)))
+            assert rank_diagnoses(scores) == rank_diagnoses(bitset.average_scores(query, **options))
+        return [rank_diagnoses(scores) for scores in results]
+    finally:
+        if sharded._executors:
+            _shutdown(sharded._executors)
+
+
+def test_sharded_engine_matches_bitset(make_case_base):
+    records = random_records(seed=7, diagnoses=["diabete", "rhume", "grippe"], symptoms=[f"s{i}" for i in range(20)])
+    case_base = make_case_base(records)
+    queries = [["s0", "s1"], ["s2", "s5", "s9"], ["s3", "s4", "s7", "s8"]]
+    added = [("rhume", ["s0", "s1", "s19"]), ("asthme", ["s2", "nouveau"])]
+    sharded_matches_bitset(case_base, 2, queries, added)
+    # Après un retrait, avec la pondération par récence
+    case_base.remove_case(*records[0])
+    sharded_matches_bitset(case_base, 2, queries, weighted=True)
+
+
+def test_sharded_engine_ranks_ties_like_scan(make_case_base):
+    # Profils des deux diagnostics répartis sur trois shards : les sommes partielles
+    # sont additionnées dans un autre ordre que le parcours complet
+    case_base = make_case_base(TIE_CASES)
+    expected = rank_diagnoses(scan_average_scores(TIE_QUERY, case_base))
+    assert sharded_matches_bitset(case_base, 3, [TIE_QUERY]) == [expected]
+
+
+def test_sharded_engine_serves_concurrent_threads(make_case_base, monkeypatch):
+    case_base = make_case_base()
+    engine = ShardedEngine(case_base, 2)
+    bitset = BitsetEngine(case_base)
+    recency = RecencyWeights(case_base).weights()
+    created = []
+    executor_class = sharded_engine.ProcessPoolExecutor
+
+    def slow_executor(*args, **kwargs):
+        # Création lente : des threads concurrents la lanceraient plusieurs fois
+        created.append(1)
+        time.sleep(0.05)
+        return executor_class(*args, **kwargs)
+
+    monkeypatch.setattr(sharded_engine, 'ProcessPoolExecutor', slow_executor)
+    mismatches = []
+
+    def run(weights):
+        for _ in range(5):
+            for query, scores in zip(QUERIES, engine.average_scores_batch(QUERIES, weights)):
+                # Poids recopiés par une autre requête pendant le calcul : résultats mélangés
+                if dict(scores) != pytest.approx(dict(bitset.average_scores(query, weights))):
+                    mismatches.append(query)
+
+    threads = [threading.Thread(target=run, args=(None if i % 2 else recency,)) for i in range(8)]
+    try:
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+    finally:
+        _shutdown(engine._executors)
+    assert len(created) == engine.n_shards
+    assert mismatches == []
+
+
+def test_broken_shard_pool_is_shut_down_before_restart(make_case_base, monkeypatch):
+    case_base = make_case_base()
+    engine = ShardedEngine(case_base, 2)
+    expected = BitsetEngine(case_base).average_scores(QUERIES[1])
+    assert dict(engine.average_scores(QUERIES[1])) == pytest.approx(dict(expected))
+    executors = engine._executors
+    stopped = []
+    monkeypatch.setattr(sharded_engine, '_shutdown', lambda pools: stopped.append(pools) or _shutdown(pools))
+
+    os.kill(next(iter(executors[0]._processes)), signal.SIGKILL)
+    with pytest.raises(BrokenProcessPool):
+        for _ in range(50):
+            engine.average_scores(QUERIES[1])
+            time.sleep(0.02)
+    # Le shard resté vivant est arrêté avec le shard tué, puis tous sont recréés
+    assert stopped == [executors] and executors[1]._shutdown_thread
+    try:
+        assert dict(engine.average_scores(QUERIES[1])) == pytest.approx(dict(expected))
+        assert engine._executors is not executors
+    finally:
+        _shutdown(engine._executors)
+
+
+def test_posting_during_a_merge_has_no_duplicates(make_case_base):
+    case_base = make_case_base()
+    engine = InvertedIndexEngine(case_base)
+    for symptoms in (["s0", "s1"], ["s0", "nouveau"]):
+        profile_id, is_new = case_base.add_case("asthme", symptoms)
+        assert is_new
+        engine.add_profile(profile_id)
+    symptom_id = case_base.symptom_ids["s0"]
+    expected = engine._posting(symptom_id)
+
+    # État intermédiaire d'une fusion : liste fusionnée publiée, ajouts encore en attente
+    posting = engine.postings[symptom_id]
+    engine.postings[symptom_id] = np.concatenate(
+        [posting, np.array(engine.pending[symptom_id], dtype=np.int32)]
+    )
+    assert np.array_equal(engine._posting(symptom_id), expected)
+    engine.postings[symptom_id] = posting
+    engine._merge(symptom_id)
+    assert np.array_equal(engine._posting(symptom_id), expected)
+    assert symptom_id not in engine.pending
@@ -0,0 +1,45 @@
+import time
+
+from health import HealthMonitor
+
+
+def wait_for(condition, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not condition() and time.monotonic() < deadline:
+        time.sleep(0.01)
+    return condition()
+
+
+def test_probes_share_rate_limited_database_checks():
+    state = {"data_loaded": True}
+    database = {"fail": False}
+
+    def check_database():
+        if database["fail"]:
+            raise FileNotFoundError("Database not found")
+        return {"patients_count": 1}
+
+    monitor = HealthMonitor(lambda: dict(state), check_database, interval=0, database_interval=60)
+    for _ in range(500):
+        monitor.snapshot()
+    assert wait_for(lambda: monitor.snapshot()["database"]["status"] == "connected")
+    assert monitor.database_checks == 1
+
+    monitor.database_interval = 0.05
+    database["fail"] = True
+    assert wait_for(lambda: not monitor.snapshot()["ready"])
+    assert monitor.snapshot()["database"]["error"] == "Database not found"
+
+
+def test_readiness_waits_for_the_data(service, monkeypatch):
+    client = service.app.test_client()
+    assert client.get('/health/live').status_code == 200
+    monitor = HealthMonitor(service.readiness_state, service.check_database)
+    monkeypatch.setattr(service, 'health_monitor', monitor)
+    response = client.get('/health/ready')
+    assert response.status_code == 200
+    assert response.get_json()["cases_count"] == 200
+
+    monkeypatch.setattr(service.reloader, 'current', None)
+    monkeypatch.setattr(service, 'health_monitor', HealthMonitor(service.readiness_state, service.check_database))
+    assert client.get('/health/ready').status_code == 503
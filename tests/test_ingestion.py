@@ -0,0 +1,108 @@
+import sqlite3
+
+import pytest
+
+from db_schema import SymptomEncoder
+from knowledge_base import KnowledgeBase
+
+QUERY = ["fievre", "toux"]
+
+
+@pytest.fixture
+def client(service):
+    return service.app.test_client()
+
+
+def test_ingested_cases_match_a_full_reload(service, client):
+    response = client.post('/api/cases', json={"diagnostic": "grippe", "symptoms": QUERY, "age": 40})
+    assert response.status_code == 201
+    assert response.get_json()["cases_count"] == 201
+
+    response = client.post('/api/cases/bulk', json={"cases": [
+        {"diagnostic": "covid", "symptoms": QUERY + ["perte_odorat"], "age": 30},
+        {"diagnostic": "rhume", "symptoms": ["toux", "symptome_nouveau"], "age": 20},
+    ]})
+    assert response.status_code == 201
+    assert response.get_json()["inserted"] == 2
+
+    knowledge = service.reloader.current
+    fresh = KnowledgeBase(service.load_data(), knowledge.generation + 1)
+    assert len(fresh.case_base) == len(knowledge.case_base) == 203
+    for engine in ('bitset', 'index'):
+        for query in (QUERY, ["symptome_nouveau"]):
+            assert dict(knowledge.engines[engine].average_scores(query)) == \
+                pytest.approx(dict(fresh.engines['bitset'].average_scores(query)))
+
+
+def test_bulk_ingestion_is_all_or_nothing(service, client):
+    response = client.post('/api/cases/bulk', json={"cases": [
+        {"diagnostic": "grippe", "symptoms": QUERY, "age": 40},
+        {"diagnostic": "", "symptoms": QUERY, "age": 40},
+        {"diagnostic": "grippe", "symptoms": QUERY, "age": 400},
+    ]})
+    assert response.status_code == 400
+    assert [detail["index"] for detail in response.get_json()["details"]] == [1, 2]
+    assert len(service.reloader.current.case_base) == len(service.load_data()) == 200
+
+
+def test_retired_cases_match_a_full_reload(service, client):
+    assert client.delete('/api/cases/1').status_code == 200
+    assert client.delete('/api/cases/1').status_code == 404
+
+    knowledge = service.reloader.current
+    fresh = service.load_data()
+    assert len(knowledge.case_base) == len(fresh) == 199
+    for query in (QUERY, ["nausee"]):
+        assert dict(service.scan_average_scores(query, knowledge.case_base)) == \
+            pytest.approx(dict(service.scan_average_scores(query, fresh)))
+        assert dict(knowledge.engines['bitset'].average_scores(query)) == \
+            pytest.approx(dict(service.scan_average_scores(query, fresh)))
+
+
+def other_worker_inserts(db_path, diagnosis, symptoms):
+    conn = sqlite3.connect(db_path, isolation_level=None)
+    try:
+        conn.execute('BEGIN IMMEDIATE')
+        patient_id = conn.execute(
+            "INSERT INTO patients (age, diagnostic, date_consultation) VALUES (40, ?, '2024-01-01')",
+            (diagnosis,)
+        ).lastrowid
+        encoder = SymptomEncoder(conn)
+        conn.executemany(
+            'INSERT INTO patient_symptoms (patient_id, symptom_id) VALUES (?, ?)',
+            encoder.rows((patient_id, s) for s in symptoms)
+        )
+        conn.execute("INSERT INTO medications (patient_id, medication) VALUES (?, 'Paracétamol')", (patient_id,))
+        conn.execute('COMMIT')
+    finally:
+        conn.close()
+    return patient_id
+
+
+def test_other_workers_inserts_are_applied_without_reload(db_path, service):
+    reloader = service.reloader
+    knowledge = reloader.current
+    other_worker_inserts(db_path, "grippe", QUERY)
+    other_worker_inserts(db_path, "covid", QUERY + ["perte_odorat"])
+
+    # Écriture locale après celles de l'autre worker : elles sont rattrapées d'abord
+    service.ingest_cases([{"diagnostic": "rhume", "symptoms": QUERY, "age": 30}], knowledge)
+    assert service.sync_cases(db_path)
+    assert reloader.current is knowledge and reloader.reloads == 1
+    assert len(knowledge.case_base) == 203
+
+    fresh = KnowledgeBase(service.load_data(), 2)
+    assert len(fresh.case_base) == 203
+    for backend in ('bitset', 'rules'):
+        assert service.calculate_diagnosis(QUERY, knowledge, backend) == \
+            service.calculate_diagnosis(QUERY, fresh, backend)
+    assert knowledge.case_base.medications.recommend("covid") == fresh.case_base.medications.recommend("covid")
+
+
+def test_other_workers_deletes_require_reload(db_path, service):
+    other_worker_inserts(db_path, "grippe", ["fievre"])
+    conn = sqlite3.connect(db_path)
+    with conn:
+        conn.execute('DELETE FROM patients WHERE id = 3')
+    conn.close()
+    assert not service.sync_cases(db_path)
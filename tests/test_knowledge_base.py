@@ -0,0 +1,132 @@
+import sqlite3
+import threading
+import time
+
+import pytest
+
+from case_base import CaseBase
+from case_loader import iter_sqlite_cases
+from db_schema import database_version
+from knowledge_base import KnowledgeBaseReloader
+
+WATCH_INTERVAL = 0.02
+
+
+def load_cases(db_path):
+    conn = sqlite3.connect(db_path)
+    try:
+        return CaseBase.from_records(iter_sqlite_cases(conn))
+    finally:
+        conn.close()
+
+
+@pytest.fixture
+def reloader(db_path):
+    reloader = KnowledgeBaseReloader(lambda: load_cases(db_path), [], databases=[db_path])
+    assert reloader.get() is not None
+    reloader.start_watcher(WATCH_INTERVAL)
+    yield reloader
+    reloader.stop_watcher()
+
+
+def wait_for_reloads(reloader, expected, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while reloader.reloads < expected and time.monotonic() < deadline:
+        time.sleep(WATCH_INTERVAL)
+    # Quelques périodes de plus : aucun rechargement supplémentaire
+    time.sleep(10 * WATCH_INTERVAL)
+    return reloader.reloads
+
+
+def test_reload_publishes_a_new_generation_atomically(db_path):
+    started, release = threading.Event(), threading.Event()
+
+    def load():
+        if reloader.current is not None:
+            started.set()
+            release.wait(5)
+        return load_cases(db_path)
+
+    reloader = KnowledgeBaseReloader(load, [], databases=[db_path])
+    first = reloader.get()
+    assert first.generation == 1 and len(first.case_base) == 200
+
+    conn = sqlite3.connect(db_path)
+    with conn:
+        conn.execute('DELETE FROM patients WHERE id = 1')
+    conn.close()
+
+    reloader.reload()
+    assert started.wait(5)
+    # Pendant la reconstruction, les requêtes servent l'ancienne base, intacte
+    reloader.reload()
+    assert reloader.current is first and len(first.case_base) == 200
+    release.set()
+    assert reloader.reload(wait=True)
+
+    # Les demandes reçues pendant la reconstruction sont regroupées en une passe
+    assert reloader.current.generation == reloader.reloads == 3
+    assert len(reloader.current.case_base) == 199 and len(first.case_base) == 200
+
+
+def test_failed_reload_keeps_the_current_base(make_case_base):
+    case_bases = [make_case_base(), None]
+    reloader = KnowledgeBaseReloader(lambda: case_bases.pop(0), [])
+    first = reloader.get()
+    assert reloader.reload(wait=True) is False
+    assert reloader.current is first and reloader.failures == 1
+
+
+def test_read_only_connections_do_not_reload(db_path, reloader):
+    # Chaque lecture crée puis supprime les fichiers -wal et -shm
+    for _ in range(3):
+        conn = sqlite3.connect(f'file:{db_path}?mode=ro', uri=True)
+        assert conn.execute('SELECT COUNT(*) FROM patients').fetchone()[0] == 200
+        time.sleep(3 * WATCH_INTERVAL)
+        conn.close()
+        time.sleep(3 * WATCH_INTERVAL)
+    assert wait_for_reloads(reloader, 1) == 1
+
+
+def test_foreign_writes_reload_but_recorded_writes_do_not(db_path, reloader):
+    conn = sqlite3.connect(db_path, isolation_level=None)
+    try:
+        # Écriture locale signalée au rechargeur : déjà appliquée, pas de rechargement
+        conn.execute('BEGIN IMMEDIATE')
+        before = database_version(conn)
+        conn.execute('DELETE FROM patients WHERE id = 1')
+        after = database_version(conn)
+        conn.execute('COMMIT')
+        reloader.record_change(db_path, before, after)
+        assert wait_for_reloads(reloader, 1) == 1
+
+        # Écriture d'un autre processus : rechargement
+        conn.execute('DELETE FROM patients WHERE id = 2')
+    finally:
+        conn.close()
+    assert wait_for_reloads(reloader, 2) == 2
+
+
+def test_migrating_before_the_first_load_does_not_reload(tmp_path, monkeypatch):
+    import app
+    from test_db_schema import create_old_database
+
+    path = str(tmp_path / 'old.db')
+    create_old_database(path)
+    monkeypatch.setattr(app, 'DB_PATH', path)
+    monkeypatch.setattr(app, 'JSON_PATH', str(tmp_path / 'absent.json'))
+    monkeypatch.setattr(app, 'SNAPSHOT_PATH', '')
+    monkeypatch.setattr(app, 'MIGRATE_SCHEMA', True)
+    reloader = KnowledgeBaseReloader(app.load_data, [], databases=[path], prepare=app.prepare_sources)
+    assert len(reloader.get().case_base) == 3
+
+    # La migration précède la signature : la base publiée n'est pas jugée périmée
+    thread = reloader._thread
+    if thread is not None:
+        thread.join(5)
+    assert reloader.reloads == 1
+    conn = sqlite3.connect(path)
+    try:
+        assert reloader.database_version(path) == database_version(conn)
+    finally:
+        conn.close()
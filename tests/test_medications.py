@@ -0,0 +1,89 @@
+import json
+import sqlite3
+
+from case_loader import iter_json_cases, load_medication_rows
+from medications import MIN_BAND_PATIENTS, MedicationIndex, age_band
+
+
+def brute_force(conn, diagnosis, ages=None):
+    """Fréquences de prescription recalculées patient par patient"""
+    patients = [
+        patient_id for patient_id, age in
+        conn.execute('SELECT id, age FROM patients WHERE diagnostic = ?', (diagnosis,))
+        if ages is None or age in ages
+    ]
+    counts = {}
+    for patient_id in patients:
+        for medication, in conn.execute(
+            'SELECT DISTINCT medication FROM medications WHERE patient_id = ?', (patient_id,)
+        ):
+            counts[medication] = counts.get(medication, 0) + 1
+    return {medication: round(count / len(patients) * 100, 2) for medication, count in counts.items()}
+
+
+def test_index_matches_brute_force_counts(db_path):
+    conn = sqlite3.connect(db_path)
+    try:
+        index = MedicationIndex.from_rows(*load_medication_rows(conn))
+        diagnosis, = conn.execute('SELECT diagnostic FROM patients GROUP BY diagnostic ORDER BY COUNT(*) DESC').fetchone()
+        expected = brute_force(conn, diagnosis)
+        ranked = index.recommend(diagnosis, limit=100)
+        assert {m["medication"]: m["frequency"] for m in ranked} == expected
+        assert [m["frequency"] for m in ranked] == sorted(expected.values(), reverse=True)
+
+        # Tranche d'âge assez fournie : recommandations restreintes à la tranche
+        band_ages = [age for age in range(151) if age_band(age) == age_band(70)]
+        patients = sum(1 for age, in conn.execute(
+            'SELECT age FROM patients WHERE diagnostic = ?', (diagnosis,)) if age in band_ages)
+        expected = brute_force(conn, diagnosis, band_ages if patients >= MIN_BAND_PATIENTS else None)
+        assert {m["medication"]: m["frequency"] for m in index.recommend(diagnosis, 70, limit=100)} == expected
+    finally:
+        conn.close()
+
+
+def test_ingestion_updates_recommendations(service):
+    client = service.app.test_client()
+    case = {"diagnostic": "maladie_rare", "symptoms": ["toux"], "age": 30, "medications": ["Sirop", "Repos"]}
+    response = client.post('/api/cases', json=case)
+    assert response.status_code == 201
+    medications = service.reloader.current.case_base.medications
+    assert [m["medication"] for m in medications.recommend("maladie_rare")] == ["Sirop", "Repos"]
+
+    diagnoses = client.post('/api/diagnose', json={"symptoms": ["toux"], "age": 30}).get_json()["diagnoses"]
+    assert all("medications" in diagnosis for diagnosis in diagnoses)
+
+    assert client.delete(f'/api/cases/{response.get_json()["id"]}').status_code == 200
+    assert medications.recommend("maladie_rare") == []
+
+
+def test_equal_counts_keep_table_order():
+    conn = sqlite3.connect(':memory:')
+    conn.execute('CREATE TABLE patients (id INTEGER PRIMARY KEY, age INTEGER, diagnostic TEXT)')
+    conn.execute('CREATE TABLE medications (patient_id INTEGER, medication TEXT)')
+    conn.executemany('INSERT INTO patients VALUES (?, ?, ?)', [(1, 30, "grippe"), (2, 70, "grippe")])
+    conn.executemany('INSERT INTO medications VALUES (?, ?)', [
+        (1, "Tamiflu"), (1, "Paracétamol"), (2, "Ibuprofène"), (2, "Paracétamol"), (2, "Tamiflu"),
+    ])
+    index = MedicationIndex.from_rows(*load_medication_rows(conn))
+    ranked = [m["medication"] for m in index.recommend("grippe", limit=10)]
+    assert ranked == ["Tamiflu", "Paracétamol", "Ibuprofène"]
+
+    # L'ordre survit à l'instantané et aux ajouts
+    restored = MedicationIndex.from_rows(*index.rows())
+    for medications in (index, restored):
+        medications.add_case("grippe", 40, ["Aspirine", "Ibuprofène"])
+    assert [m["medication"] for m in restored.recommend("grippe", limit=10)] == \
+        [m["medication"] for m in index.recommend("grippe", limit=10)] == \
+        ["Tamiflu", "Paracétamol", "Ibuprofène", "Aspirine"]
+
+
+def test_json_cases_carry_age_and_medications(tmp_path):
+    path = tmp_path / 'cases.json'
+    path.write_text(json.dumps({"patients": [
+        {"diagnostic": "rhume", "symptoms": ["toux"], "age": 8, "medications": ["Sirop"]},
+        {"diagnostic": "grippe", "symptoms": ["fievre"], "date_consultation": "2024-01-02"},
+    ]}), encoding='utf-8')
+    assert list(iter_json_cases(str(path))) == [
+        ("rhume", ["toux"], None, 8, ["Sirop"]),
+        ("grippe", ["fievre"], "2024-01-02", None, None),
+    ]
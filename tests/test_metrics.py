@@ -0,0 +1,33 @@
+import re
+
+from metrics import Gauge, Histogram, MetricsRegistry
+
+# Ligne d'échantillon du format texte de Prometheus : nom{étiquettes} valeur
+SAMPLE = re.compile(r'^[a-zA-Z_:][a-zA-Z0-9_:]*(\{([a-zA-Z_]\w*="([^"\\]|\\.)*",?)*\})? \S+$')
+
+
+def test_histogram_text_format():
+    histogram = Histogram('stage_seconds', 'Durée', ('stage',), buckets=(0.01, 0.1))
+    for value in (0.005, 0.05, 0.05, 3.0):
+        histogram.observe(value, 'score')
+    registry = MetricsRegistry([histogram, Gauge('cases', 'Cas', lambda: {"a\"b": 3}, ('name',))])
+    lines = registry.render().splitlines()
+    assert lines[:2] == ['# HELP stage_seconds Durée', '# TYPE stage_seconds histogram']
+    assert 'stage_seconds_bucket{stage="score",le="0.01"} 1' in lines
+    assert 'stage_seconds_bucket{stage="score",le="0.1"} 3' in lines
+    assert 'stage_seconds_bucket{stage="score",le="+Inf"} 4' in lines
+    assert 'stage_seconds_sum{stage="score"} 3.105' in lines
+    assert 'stage_seconds_count{stage="score"} 4' in lines
+    assert 'cases{name="a\\"b"} 3' in lines
+
+
+def test_metrics_endpoint_exports_stage_timers(service):
+    client = service.app.test_client()
+    assert client.post('/api/diagnose', json={"symptoms": ["fievre", "toux"]}).status_code == 200
+    response = client.get('/metrics')
+    assert response.status_code == 200 and response.mimetype == 'text/plain'
+    lines = response.get_data(as_text=True).splitlines()
+    for line in lines:
+        assert line.startswith('# ') or SAMPLE.match(line), line
+    assert any(line.startswith('diagnosis_stage_seconds_count{stage="score"') for line in lines)
+    assert any(line.startswith('http_request_duration_seconds_count{route="/api/diagnose"') for line in lines)
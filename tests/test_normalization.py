@@ -0,0 +1,47 @@
+from normalization import SymptomNormalizer, fold
+
+
+def test_spelling_variants_share_a_canonical_name():
+    normalizer = SymptomNormalizer()
+    assert fold("  Fièvre ") == "fievre"
+    assert {normalizer.normalize(s) for s in ("Maux de tête", "maux-de-tete", "MAL_DE_TETE", "céphalées")} == \
+        {"maux_de_tete"}
+    assert normalizer.normalize("perte d'odorat") == "perte_gout_odorat"
+    assert normalizer.normalize_list(["Toux", 3]) == ["toux", 3]
+    # Autre table de synonymes : autre version
+    assert SymptomNormalizer({"a": "b"}).version != normalizer.version
+
+
+def test_queries_and_cases_are_normalized(service):
+    case_base = service.reloader.current.case_base
+    # Le générateur écrit « fièvre » : la base de cas ne connaît que la forme canonique
+    assert "fievre" in case_base.symptoms and "fièvre" not in case_base.symptoms
+
+    client = service.app.test_client()
+    diagnoses = [
+        client.post('/api/diagnose', json={"symptoms": symptoms}).get_json()
+        for symptoms in (["fievre", "toux"], ["Fièvre", " TOUX "])
+    ]
+    assert diagnoses[0]["diagnoses"] == diagnoses[1]["diagnoses"]
+    assert diagnoses[1]["symptoms"] == ["Fièvre", " TOUX "]
+
+    client.post('/api/cases', json={"diagnostic": "grippe", "symptoms": ["Mal de tête"], "age": 40})
+    assert "mal_de_tete" not in case_base.symptoms
+
+
+def test_cases_without_a_canonical_name_are_rejected(service):
+    client = service.app.test_client()
+    cases_count = len(service.reloader.current.case_base)
+    for blank in ("  ", "__", "-", " - _ "):
+        for case in (
+            {"diagnostic": "grippe", "symptoms": ["toux", blank], "age": 40},
+            {"diagnostic": blank, "symptoms": ["toux"], "age": 40},
+        ):
+            response = client.post('/api/cases', json=case)
+            assert response.status_code == 400, case
+    response = client.post('/api/cases/bulk', json={"cases": [
+        {"diagnostic": "grippe", "symptoms": ["toux"], "age": 40},
+        {"diagnostic": "grippe", "symptoms": ["__"], "age": 40},
+    ]})
+    assert response.status_code == 400
+    assert len(service.reloader.current.case_base) == cases_count
@@ -0,0 +1,55 @@
+from datetime import date, timedelta
+
+import numpy as np
+import pytest
+
+from app import scan_average_scores
+from conftest import random_records
+from diagnosis_engine import BitsetEngine, InvertedIndexEngine
+from recency import RecencyWeights
+
+QUERIES = [["s0"], ["s2", "s5", "s9"], ["s3", "s4", "s7", "inconnu"]]
+
+
+@pytest.fixture
+def dated_case_base(make_case_base):
+    rng = np.random.default_rng(7)
+    today = date.today()
+    records = [
+        # Un cas sur dix sans date de consultation
+        (diagnosis, symptoms, None if rng.random() < 0.1 else
+         (today - timedelta(days=int(rng.integers(0, 3000)))).isoformat())
+        for diagnosis, symptoms in random_records()
+    ]
+    return make_case_base(records)
+
+
+def test_weighted_engines_match_weighted_scan(dated_case_base):
+    recency = RecencyWeights(dated_case_base)
+    weights, case_weights = recency.weights(), recency.case_weights()
+    assert weights.sum() == pytest.approx(case_weights.sum())
+    for engine in (BitsetEngine(dated_case_base), InvertedIndexEngine(dated_case_base)):
+        for query in QUERIES:
+            assert dict(engine.average_scores(query, weights)) == \
+                pytest.approx(dict(scan_average_scores(query, dated_case_base, case_weights)))
+
+
+def test_added_and_retired_cases_update_the_weights(dated_case_base):
+    recency = RecencyWeights(dated_case_base)
+    recency.weights()
+    dated_case_base.add_case("grippe", ["s0", "s1"], date.today().isoformat())
+    dated_case_base.add_case("asthme", ["s0", "nouveau"])
+    assert recency.weights() == pytest.approx(RecencyWeights(dated_case_base).weights())
+
+    dated_case_base.remove_case("grippe", ["s0", "s1"], date.today().isoformat())
+    assert recency.weights() == pytest.approx(RecencyWeights(dated_case_base).weights())
+
+
+def test_rules_engine_rejects_recency_weighting(service):
+    client = service.app.test_client()
+    response = client.post('/api/diagnose', json={"symptoms": ["fievre"], "weighting": "recency"})
+    assert response.status_code == 200 and response.get_json()["weighting"] == "recency"
+    response = client.post('/api/diagnose', json={
+        "symptoms": ["fievre"], "engine": "rules", "weighting": "recency",
+    })
+    assert response.status_code == 400
@@ -0,0 +1,157 @@
+import asyncio
+import gzip
+import json
+
+import result_cache
+from result_cache import DiagnosisCache, EncodedResponse
+
+
+def test_keys_are_canonical_symptom_sets():
+    assert DiagnosisCache.make_key(["toux", "fievre", "toux"], "bitset") == \
+        DiagnosisCache.make_key(["fievre", "toux"], "bitset")
+    assert DiagnosisCache.make_key(["fievre"], "bitset") != DiagnosisCache.make_key(["fievre"], "index")
+    assert DiagnosisCache.make_key([["fievre"]], "bitset") is None
+
+
+def test_lru_eviction_and_ttl(monkeypatch):
+    now = [100.0]
+    monkeypatch.setattr(result_cache.time, 'monotonic', lambda: now[0])
+    cache = DiagnosisCache(max_size=2, ttl=10)
+    for name in ("a", "b"):
+        cache.put((None, (name,)), [name], generation=1)
+    assert cache.get((None, ("a",)), 1) == ["a"]
+    # "b" est le moins récemment utilisé
+    cache.put((None, ("c",)), ["c"], generation=1)
+    assert cache.get((None, ("b",)), 1) is None and cache.evictions == 1
+
+    now[0] += 11
+    assert cache.get((None, ("a",)), 1) is None and cache.expirations == 1
+
+
+def test_new_generation_clears_entries():
+    cache = DiagnosisCache()
+    cache.put((None, ("a",)), ["a"], generation=1)
+    assert cache.get((None, ("a",)), 2) is None
+    assert cache.invalidations == 1
+
+
+def test_older_generation_does_not_roll_the_cache_back():
+    cache = DiagnosisCache()
+    cache.put((None, ("a",)), ["a"], generation=2)
+    # Calcul commencé avant le rechargement : ni enregistré ni servi
+    cache.put((None, ("b",)), ["b"], generation=1)
+    assert cache.get((None, ("b",)), 1) is None
+    assert cache.get((None, ("a",)), 2) == ["a"] and cache.get((None, ("b",)), 2) is None
+    assert cache.invalidations == 0
+
+
+def test_invalidate_symptoms_drops_overlapping_queries():
+    cache = DiagnosisCache()
+    keys = [
+        DiagnosisCache.make_key(["fievre", "toux"], "bitset"),
+        DiagnosisCache.make_key(["nausee"], "bitset"),
+    ]
+    for key in keys:
+        cache.put(key, [], generation=1)
+    epoch = cache.epoch
+
+    assert cache.invalidate_symptoms(["toux"]) == 1
+    assert cache.get(keys[0], 1) is None and cache.get(keys[1], 1) == []
+    # Résultat calculé avant l'invalidation : non enregistré
+    cache.put(keys[0], [], generation=1, epoch=epoch)
+    assert cache.get(keys[0], 1) is None
+
+
+def test_encoded_response_negotiation():
+    response = EncodedResponse()
+    payload = [f"symptome_{i}" for i in range(200)]
+    variants = response.get(1, lambda: payload)
+    assert response.get(1, lambda: None) is variants and response.builds == 1
+
+    assert EncodedResponse.choose(variants, "gzip;q=0.5, identity") == 'gzip'
+    assert EncodedResponse.choose(variants, "gzip;q=0") == 'identity'
+    body, etag = variants['gzip']
+    assert json.loads(gzip.decompress(body)) == payload
+    assert EncodedResponse.matches(variants, f'"autre", W/{etag}')
+    assert not EncodedResponse.matches(variants, '"autre"')
+    # Même contenu, même ETag d'une version à l'autre
+    assert EncodedResponse().get(2, lambda: payload)['identity'][1] == variants['identity'][1]
+
+
+def test_symptoms_endpoint_revalidates_with_etag(service):
+    client = service.app.test_client()
+    response = client.get('/api/symptoms', headers={"Accept-Encoding": "gzip"})
+    assert response.status_code == 200 and response.headers["Content-Encoding"] == "gzip"
+    symptoms = json.loads(gzip.decompress(response.data))
+    assert symptoms == sorted(service.reloader.current.case_base.symptoms)
+
+    etag = response.headers["ETag"]
+    assert client.get('/api/symptoms', headers={"If-None-Match": etag}).status_code == 304
+
+    # Nouveau symptôme ingéré : nouveau contenu, nouvel ETag
+    client.post('/api/cases', json={"diagnostic": "grippe", "symptoms": ["symptome_nouveau"], "age": 40})
+    response = client.get('/api/symptoms', headers={"If-None-Match": etag})
+    assert response.status_code == 200 and "symptome_nouveau" in response.get_json()
+
+
+def test_invalidate_symptoms_drops_whole_variants():
+    cache = DiagnosisCache()
+    keys = [
+        DiagnosisCache.make_key(["fievre", "toux"], "bitset"),
+        DiagnosisCache.make_key(["nausee"], "bitset"),
+        DiagnosisCache.make_key(["nausee"], "rules"),
+    ]
+    for key in keys:
+        cache.put(key, [], generation=1)
+
+    assert cache.invalidate_symptoms(["toux"]) == 1
+    assert cache.get(keys[1], 1) == [] and cache.get(keys[2], 1) == []
+    # Seuil des règles déplacé : toutes les entrées du moteur de règles sont périmées
+    assert cache.invalidate_symptoms(["toux"], ("rules",)) == 1
+    assert cache.get(keys[1], 1) == [] and cache.get(keys[2], 1) is None
+
+
+def test_rule_threshold_change_clears_cached_rules_diagnoses(service, monkeypatch):
+    monkeypatch.setattr(service, 'diagnosis_cache', DiagnosisCache())
+    knowledge = service.reloader.current
+    # 200 cas : une règle dès 1 cas ; au 201e, il en faut 2
+    assert knowledge.engines['rules'].min_count == 1
+    query = ["vertiges"]
+    for backend in ('rules', 'bitset'):
+        service.cached_diagnosis(query, knowledge, backend)
+
+    # Cas sans symptôme commun avec la requête
+    service.ingest_cases([{"diagnostic": "grippe", "symptoms": ["toux"], "age": 40}], knowledge)
+    assert knowledge.engines['rules'].min_count == 2
+    generation = knowledge.generation
+    assert service.diagnosis_cache.get(DiagnosisCache.make_key(query, 'rules'), generation) is None
+    assert service.diagnosis_cache.get(DiagnosisCache.make_key(query, 'bitset'), generation) is not None
+
+
+def test_failed_diagnoses_are_not_cached(service, monkeypatch):
+    from test_asgi import call
+
+    monkeypatch.setattr(service, 'diagnosis_cache', DiagnosisCache())
+    knowledge = service.reloader.current
+    engine = knowledge.engines['index']
+    payload = {"symptoms": ["fatigue", "toux"], "engine": "index"}
+    key = DiagnosisCache.make_key(payload["symptoms"], service.cache_variant("index"))
+    average_scores = engine.average_scores
+    failing = [True]
+
+    def flaky(*args):
+        if failing:
+            raise MemoryError("moteur indisponible")
+        return average_scores(*args)
+
+    monkeypatch.setattr(engine, 'average_scores', flaky)
+    client = service.app.test_client()
+    assert client.post('/api/diagnose', json=payload).status_code == 500
+    assert asyncio.run(call('POST', '/api/diagnose', payload))[0] == 500
+    assert service.diagnosis_cache.get(key, knowledge.generation) is None
+
+    # Moteur rétabli : le diagnostic est calculé au lieu d'une liste vide en cache
+    failing.clear()
+    status, result = asyncio.run(call('POST', '/api/diagnose', payload))
+    assert status == 200 and result["diagnoses"]
+    assert client.post('/api/diagnose', json=payload).get_json()["diagnoses"] == result["diagnoses"]
@@ -0,0 +1,162 @@
+import numpy as np
+import pytest
+
+import rule_engine
+from conftest import SYMPTOMS
+from rule_engine import RuleEngine
+
+
+@pytest.fixture
+def engine(make_case_base):
+    return RuleEngine(make_case_base(n_cases=400, size=4), min_support=0.01)
+
+
+def matches(engine, symptoms):
+    return sorted((tuple(antecedent), rule) for antecedent, rule in engine.matching_rules(symptoms))
+
+
+def brute_force(engine, symptoms):
+    query = {engine.case_base.symptom_ids[s] for s in symptoms if s in engine.case_base.symptom_ids}
+    return sorted(
+        (tuple(sorted(antecedent)), rule)
+        for antecedent, rules in engine.rules.items() if antecedent <= query
+        for rule in rules
+    )
+
+
+def test_matching_rules_match_brute_force(engine):
+    short = ["s0", "s1", "s2"]
+    assert matches(engine, short) == brute_force(engine, short)
+    assert engine.max_antecedent >= 3
+    assert matches(engine, SYMPTOMS + ["inconnu"]) == brute_force(engine, SYMPTOMS)
+
+
+def test_long_queries_scan_the_index_once(engine, monkeypatch):
+    def combinations(*args):
+        raise AssertionError("sous-ensembles énumérés pour une longue requête")
+
+    # Plus de sous-ensembles que d'antécédents : parcours de l'index
+    monkeypatch.setattr(rule_engine, 'combinations', combinations)
+    query = SYMPTOMS + [f"inconnu{i}" for i in range(100)]
+    assert matches(engine, query) == brute_force(engine, SYMPTOMS)
+
+
+def test_long_queries_are_accepted(service):
+    # Pas de limite de longueur : les règles parcourent alors leur index une fois
+    client = service.app.test_client()
+    short = ["fatigue", "toux"]
+    symptoms = short + [f"inconnu{i}" for i in range(200)]
+    diagnoses = {}
+    for query in (short, symptoms):
+        response = client.post('/api/diagnose', json={"symptoms": query, "engine": "rules"})
+        assert response.status_code == 200
+        diagnoses[len(query)] = response.get_json()["diagnoses"]
+    # Symptômes inconnus des règles : mêmes diagnostics
+    assert diagnoses[len(symptoms)] == diagnoses[len(short)] != []
+    response = client.post('/api/diagnose', json={"symptoms": symptoms, "engine": "bitset"})
+    assert response.status_code == 200
+
+
+def test_rule_confidences_match_case_counts(engine):
+    case_base = engine.case_base
+    profiles = [
+        (set(case_base.profile_symptoms(profile_id).tolist()), case_base.profile_diagnostics[profile_id], count)
+        for profile_id, count in enumerate(case_base.profile_counts.tolist())
+    ]
+    assert engine.n_rules > 0
+    for antecedent, rules in engine.rules.items():
+        covered = [(diagnostic, count) for symptoms, diagnostic, count in profiles if antecedent <= symptoms]
+        for code, confidence, count in rules:
+            hits = sum(n for diagnostic, n in covered if diagnostic == code)
+            assert count == hits
+            assert confidence == pytest.approx(hits / sum(n for _, n in covered))
+            assert confidence >= engine.min_confidence and count >= engine.min_count
+
+
+def test_diagnose_endpoint_selects_the_engine(service):
+    client = service.app.test_client()
+    response = client.post('/api/diagnose', json={"symptoms": ["fievre", "toux"], "engine": "rules"})
+    assert response.status_code == 200
+    assert response.get_json()["engine"] == "rules"
+    response = client.post('/api/diagnose', json={"symptoms": ["fievre"], "engine": "inconnu"})
+    assert response.status_code == 400
+
+
+def rule_index(engine):
+    return {
+        antecedent: sorted((code, round(confidence, 12), count) for code, confidence, count in rules)
+        for antecedent, rules in engine.rules.items()
+    }
+
+
+def assert_matches_full_mining(engine):
+    for itemset, count in engine.supports.items():
+        assert count == engine.count_itemset(sorted(itemset))
+    incremental = rule_index(engine)
+    engine.mine()
+    assert incremental == rule_index(engine)
+
+
+def test_incremental_updates_match_full_mining(engine):
+    base = engine.case_base
+    rng = np.random.default_rng(11)
+    for _ in range(150):
+        profile_id, _ = base.add_case(str(rng.choice(["grippe", "asthme"])), list(rng.choice(SYMPTOMS[:6], 3)))
+        engine.add_case(profile_id)
+    # Premier cas de la base générée
+    engine.remove_case(base.remove_case("migraine", ["s0", "s1", "s2", "s11"]))
+    assert engine.mined_count == 1
+    assert_matches_full_mining(engine)
+
+
+def test_batch_additions_match_full_mining(engine):
+    base = engine.case_base
+    rng = np.random.default_rng(12)
+    # Lot ajouté à la base puis aux règles : les itemsets comptés sur la base
+    # pendant le lot incluent déjà ses cas suivants
+    profile_ids = [
+        base.add_case(str(rng.choice(["grippe", "asthme"])), list(rng.choice(SYMPTOMS[:6], 3)))[0]
+        for _ in range(100)
+    ]
+    engine.add_cases(profile_ids)
+    assert engine.mined_count == 1
+    assert_matches_full_mining(engine)
+
+
+def filler(diagnosis, n_cases):
+    # Cas aux symptômes rares (2 cas chacun), sous le seuil de suivi
+    return [(diagnosis, [f"n{i // 2}"]) for i in range(n_cases)]
+
+
+def test_pre_large_itemset_becomes_a_rule(make_case_base):
+    # 101 cas : règle à partir de 11 cas, itemsets suivis à partir de 6
+    base = make_case_base([("grippe", ["fievre", "toux"])] * 7 + filler("rhume", 94))
+    engine = RuleEngine(base, min_support=0.1, min_confidence=0.5)
+    itemset = frozenset((base.symptom_ids["fievre"], base.symptom_ids["toux"], ~base.diagnostic_ids["grippe"]))
+    assert engine.lower_count == 6 and engine.min_count == 11
+    assert engine.supports[itemset] == 7
+    assert not engine.rules
+
+    engine.add_case(base.add_case("grippe", ["toux", "fievre"])[0])
+    engine.add_cases([base.add_case("grippe", ["toux", "fievre"])[0] for _ in range(3)])
+    assert engine.min_count == 11 and engine.mined_count == 1
+    assert engine.supports[itemset] == 11
+    assert [rule for _, rule in engine.matching_rules(["fievre", "toux"]) if rule[2] == 11]
+    assert_matches_full_mining(engine)
+
+
+def test_retired_case_drops_a_rule_below_min_confidence(make_case_base):
+    # 110 cas : fievre + toux -> grippe avec une confiance de 10/20, au seuil
+    base = make_case_base(
+        [("grippe", ["fievre", "toux"])] * 10 + [("rhume", ["fievre", "toux"])] * 10 + filler("migraine", 90)
+    )
+    engine = RuleEngine(base, min_support=0.05, min_confidence=0.5)
+    antecedent = frozenset((base.symptom_ids["fievre"], base.symptom_ids["toux"]))
+    grippe, rhume = base.diagnostic_ids["grippe"], base.diagnostic_ids["rhume"]
+    assert sorted(code for code, _, _ in engine.rules[antecedent]) == sorted([grippe, rhume])
+
+    engine.remove_case(base.remove_case("grippe", ["fievre", "toux"]))
+    assert engine.min_count == 6 and engine.mined_count == 1
+    # 9/19 < 0.5 : seule la règle vers rhume subsiste
+    assert [code for code, _, _ in engine.rules[antecedent]] == [rhume]
+    assert_matches_full_mining(engine)
@@ -0,0 +1,26 @@
+import numpy as np
+import pytest
+
+import app as service
+
+
+@pytest.fixture
+def sources(db_path, tmp_path, monkeypatch):
+    monkeypatch.setattr(service, 'DB_PATH', db_path)
+    monkeypatch.setattr(service, 'JSON_PATH', str(tmp_path / 'absent.json'))
+    monkeypatch.setattr(service, 'SNAPSHOT_PATH', str(tmp_path / 'case_base.snapshot'))
+    return db_path
+
+
+def test_shared_mode_serves_mapped_read_only_arrays(sources, monkeypatch):
+    monkeypatch.setattr(service, 'SHARED_CASE_BASE', False)
+    private = service.load_data()
+    assert private.bits.flags.writeable
+
+    monkeypatch.setattr(service, 'SHARED_CASE_BASE', True)
+    monkeypatch.setattr(service, 'SNAPSHOT_PATH', service.SNAPSHOT_PATH + '.shared')
+    shared = service.load_data()
+    # Tableaux projetés depuis l'instantané, communs aux workers après le fork
+    assert not shared.bits.flags.writeable
+    assert len(shared) == len(private) == 200
+    assert np.array_equal(shared.bits, private.bits)
@@ -0,0 +1,66 @@
+import numpy as np
+import pytest
+
+from conftest import random_records
+from similar_cases import SimilarCaseIndex
+
+SYMPTOMS = [f"s{i}" for i in range(40)]
+
+
+@pytest.fixture
+def case_base(make_case_base):
+    return make_case_base(random_records(n_cases=2000, size=5, symptoms=SYMPTOMS))
+
+
+def test_identical_profile_ranks_first_with_exact_similarities(case_base):
+    index = SimilarCaseIndex(case_base)
+    for profile_id in range(0, case_base.n_profiles, 97):
+        symptoms = [case_base.symptoms[i] for i in case_base.profile_symptoms(profile_id)]
+        profile_ids, similarities, _ = index.search(symptoms, 5)
+        assert similarities[0] == 1.0 and profile_ids[0] == profile_id
+        _, exact = index.similarities(symptoms, profile_ids)
+        assert np.array_equal(similarities, exact)
+
+
+def test_recall_against_brute_force(case_base):
+    index = SimilarCaseIndex(case_base)
+    rng = np.random.default_rng(5)
+    found = expected = 0
+    for profile_id in rng.choice(case_base.n_profiles, 50, replace=False):
+        # Cas connu dont un symptôme est remplacé
+        query = [case_base.symptoms[i] for i in case_base.profile_symptoms(profile_id)][1:]
+        query.append(str(rng.choice(SYMPTOMS)))
+        _, exact = index.exact_search(query, 3)
+        _, similarities, n_candidates = index.search(query, 3)
+        # Ex aequo du k-ième cas exact comptés comme trouvés
+        found += int((similarities >= exact[-1] - 1e-12).sum())
+        expected += len(exact)
+        assert n_candidates < case_base.n_profiles
+    assert found / expected >= 0.9
+
+
+def test_added_profiles_are_found_before_and_after_merge(case_base, monkeypatch):
+    import similar_cases
+
+    index = SimilarCaseIndex(case_base)
+    monkeypatch.setattr(similar_cases, 'PENDING_MERGE_SIZE', 2)
+    added = []
+    for symptoms in (["nouveau_a", "nouveau_b"], ["nouveau_c"], ["nouveau_d", "s1"]):
+        profile_id, is_new = case_base.add_case("asthme", symptoms)
+        assert is_new
+        index.add_profile(profile_id)
+        added.append((profile_id, symptoms))
+    # Deux profils fusionnés dans les tables triées, le dernier en attente
+    assert len(index._state[2]) == 1
+    for profile_id, symptoms in added:
+        profile_ids, similarities, _ = index.search(symptoms, 1)
+        assert profile_ids[0] == profile_id and similarities[0] == 1.0
+
+
+def test_similar_cases_endpoint_reports_recall(service):
+    client = service.app.test_client()
+    response = client.post('/api/similar-cases?k=3&check=1', json={"symptoms": ["fatigue", "toux"]})
+    assert response.status_code == 200
+    result = response.get_json()
+    assert len(result["cases"]) == 3 and 0 <= result["check"]["recall"] <= 1
+    assert client.get('/api/similar-cases?symptoms=fievre&k=0').status_code == 400
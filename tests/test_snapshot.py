@@ -0,0 +1,54 @@
+import sqlite3
+
+import numpy as np
+
+from diagnosis_engine import BitsetEngine
+from snapshot import load_snapshot, source_signature, write_snapshot
+
+
+def test_snapshot_round_trip_and_staleness(make_case_base, tmp_path):
+    source = tmp_path / 'cases.db'
+    source.write_bytes(b'v1')
+    path = str(tmp_path / 'case_base.snapshot')
+    case_base = make_case_base()
+    signature = source_signature([str(source)])
+    write_snapshot(case_base, path, signature)
+
+    loaded = load_snapshot(path, signature)
+    assert loaded is not None and len(loaded) == len(case_base)
+    assert np.array_equal(loaded.bits, case_base.bits)
+    assert BitsetEngine(loaded).average_scores(["s0", "s1"]) == BitsetEngine(case_base).average_scores(["s0", "s1"])
+
+    # Autre table de normalisation des symptômes : l'instantané est périmé
+    write_snapshot(case_base, path, signature, "v1")
+    assert load_snapshot(path, signature, "v1") is not None
+    assert load_snapshot(path, signature, "v2") is None
+
+    # Source modifiée : l'instantané est périmé
+    source.write_bytes(b'v2 plus long')
+    assert load_snapshot(path, source_signature([str(source)])) is None
+
+
+def test_database_signature_ignores_reads(db_path):
+    signature = source_signature([], [db_path])
+    # Chaque lecture crée puis supprime les fichiers -wal et -shm
+    conn = sqlite3.connect(f'file:{db_path}?mode=ro', uri=True)
+    assert conn.execute('SELECT COUNT(*) FROM patients').fetchone()[0] == 200
+    assert source_signature([], [db_path]) == signature
+    conn.close()
+    assert source_signature([], [db_path]) == signature
+
+    conn = sqlite3.connect(db_path)
+    with conn:
+        conn.execute('DELETE FROM patients WHERE id = 1')
+    conn.close()
+    assert source_signature([], [db_path]) != signature
+
+
+def test_corrupted_snapshot_is_ignored(make_case_base, tmp_path):
+    path = tmp_path / 'case_base.snapshot'
+    write_snapshot(make_case_base(), str(path), {})
+    data = bytearray(path.read_bytes())
+    data[-1] ^= 0xFF
+    path.write_bytes(bytes(data))
+    assert load_snapshot(str(path), {}) is None
@@ -0,0 +1,57 @@
+from normalization import fold
+from symptom_suggest import SymptomSuggester
+
+
+def brute_force(case_base, prefix, limit):
+    """Symptômes commençant par le préfixe (nom ou synonyme), classés par nombre de cas"""
+    suggester = SymptomSuggester(case_base)
+    names = {
+        name for name in case_base.symptoms
+        if fold(name).startswith(fold(prefix)) or any(
+            alias.startswith(fold(prefix)) and canonical == fold(name)
+            for alias, canonical in suggester.aliases.items()
+        )
+    }
+    counts = {}
+    for profile_id, count in enumerate(case_base.profile_counts.tolist()):
+        for i in case_base.profile_symptoms(profile_id).tolist():
+            counts[case_base.symptoms[i]] = counts.get(case_base.symptoms[i], 0) + count
+    ranked = sorted((name for name in names if counts.get(name, 0) > 0), key=lambda name: -counts[name])
+    return [(name, counts[name]) for name in ranked[:limit]]
+
+
+def test_suggestions_match_brute_force(make_case_base):
+    case_base = make_case_base([
+        ("grippe", ["fievre", "frissons", "fatigue"]),
+        ("grippe", ["fievre", "fatigue"]),
+        ("migraine", ["maux_de_tete", "fatigue"]),
+        ("rhume", ["toux"]),
+    ])
+    suggester = SymptomSuggester(case_base)
+    for prefix in ("f", "Fi", "FIÈ", "ce", "mal de", "x", ""):
+        suggestions = [(s["symptom"], s["count"]) for s in suggester.suggest(prefix, 2)]
+        assert [count for _, count in suggestions] == [count for _, count in brute_force(case_base, prefix, 2)]
+        assert set(suggestions) <= set(brute_force(case_base, prefix, 10))
+    # Synonyme (céphalées -> maux_de_tete)
+    assert [s["symptom"] for s in suggester.suggest("céph")] == ["maux_de_tete"]
+
+
+def test_suggestions_follow_ingestion_and_retirement(make_case_base):
+    case_base = make_case_base([("grippe", ["fievre"]), ("rhume", ["toux"])])
+    suggester = SymptomSuggester(case_base)
+    for _ in range(2):
+        case_base.add_case("grippe", ["fringales"])
+        suggester.add_case(["fringales"])
+    assert [s["symptom"] for s in suggester.suggest("f")] == ["fringales", "fievre"]
+
+    case_base.remove_case("grippe", ["fievre"])
+    suggester.remove_case(["fievre"])
+    assert [s["symptom"] for s in suggester.suggest("f")] == ["fringales"]
+
+
+def test_suggest_endpoint(service):
+    client = service.app.test_client()
+    response = client.get('/api/symptoms/suggest?q=Fi&limit=3')
+    assert response.status_code == 200
+    assert "fievre" in [s["symptom"] for s in response.get_json()["suggestions"]]
+    assert client.get('/api/symptoms/suggest?q=f&limit=0').status_code == 400